@@ -0,0 +1,110 @@
+# benchmarks/bench_archive.py
+# Горячие запросы при большой истории: до и после переноса старых броней в архив,
+# плюс задержка записи гостей, пока архивация идет пачками.
+#
+#   python benchmarks/bench_archive.py [число_старых_броней]
+import datetime
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['METRICS_PORT'] = '0'
+
+import telegram_bot as tb
+
+HISTORY = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+CURRENT = 300
+
+def fill():
+    """История за два года и текущие брони на две недели вперед"""
+    now = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+    rows = []
+    for number in range(HISTORY + CURRENT):
+        if number < HISTORY:
+            start = now - datetime.timedelta(days=31 + number * 700 // HISTORY, hours=random.randint(0, 6))
+            status = random.choice(('approved', 'approved', 'rejected', 'cancelled_by_user'))
+        else:
+            start = now + datetime.timedelta(days=random.randint(0, 14), hours=random.randint(0, 6))
+            status = random.choice(('pending', 'approved'))
+        rows.append((
+            number % 5000, 'Гость', '+79990000000', start.strftime('%d.%m.%Y'), start.strftime('%H:%M'),
+            tb.format_ts(start), 2, '', status,
+        ))
+    with tb.db.transaction() as cursor:
+        cursor.executemany('''
+            INSERT INTO bookings (user_id, user_name, phone, booking_date, booking_time, start_ts, guests, comment, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        cursor.execute('ANALYZE')
+
+def user_history():
+    with tb.db.connection() as cursor:
+        cursor.execute('SELECT id, start_ts, status FROM bookings WHERE user_id = ? ORDER BY start_ts DESC LIMIT 10', (42,))
+        return cursor.fetchall()
+
+QUERIES = (
+    ('ожидающие, 1 стр.', lambda: tb.fetch_listing_page('pending')),
+    ('актуальные, 1 стр.', lambda: tb.fetch_listing_page('approved')),
+    ('отклоненные, 1 стр.', lambda: tb.fetch_listing_page('rejected')),
+    ('история гостя', user_history),
+    ('напоминания', tb.reminders.rebuild_from_db),
+)
+
+def measure():
+    return {name: min(timeit.repeat(query, number=20, repeat=3)) / 20 * 1000 for name, query in QUERIES}
+
+def file_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+def writer_latencies(stop, latencies):
+    """Короткие транзакции записи, как у гостей, пока идет архивация"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        with tb.db.transaction() as cursor:
+            cursor.execute('UPDATE bookings SET comment = ? WHERE id = ?', ('', HISTORY + 1))
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.002)
+
+def main():
+    tb.logger.setLevel('WARNING')
+    tb.init_db()
+    fill()
+    before = measure()
+    size_before = file_size(tb.DB_PATH)
+
+    stop, latencies = threading.Event(), []
+    writer = threading.Thread(target=writer_latencies, args=(stop, latencies))
+    writer.start()
+    started = time.perf_counter()
+    moved = tb.archive_old_bookings()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    writer.join()
+
+    with tb.db.transaction() as cursor:
+        cursor.execute('ANALYZE')
+    with tb.db.connection() as cursor:
+        cursor.execute('VACUUM')
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    after = measure()
+
+    print(f"история: {HISTORY}, текущих: {CURRENT}")
+    print(f"{'запрос':<22} {'до, мс':>9} {'после, мс':>10}")
+    for name, _ in QUERIES:
+        print(f"{name:<22} {before[name]:>9.3f} {after[name]:>10.3f}")
+    latencies.sort()
+    print(f"\nперенесено: {moved} за {elapsed:.1f} с ({moved / elapsed:.0f} броней/с)")
+    print(f"запись во время архивации: {len(latencies)} транзакций, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} мс, max {latencies[-1] * 1000:.1f} мс")
+    print(f"рабочая база: {size_before / 1e6:.1f} МБ -> {file_size(tb.DB_PATH) / 1e6:.1f} МБ, "
+          f"архив: {file_size(tb.ARCHIVE_DB_PATH) / 1e6:.1f} МБ")
+
+if __name__ == '__main__':
+    main()
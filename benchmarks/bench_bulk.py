@@ -0,0 +1,121 @@
+# benchmarks/bench_bulk.py
+# Решение по 100 ожидающим заявкам: по одной кнопке против пакетной модерации.
+# Бот работает против поддельного Bot API из loadtest/ с задержкой ответа, лимиты отправки - как у Telegram.
+# Время - от первого нажатия до доставки последнего уведомления гостю и последней правки у администратора.
+#
+#   python benchmarks/bench_bulk.py
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['METRICS_PORT'] = '0'
+
+from fake_api import FakeBotAPI
+from telebot import apihelper, types
+
+BOOKINGS = 100
+API_LATENCY_MS = 40
+
+api = FakeBotAPI(latency_ms=API_LATENCY_MS)
+apihelper.API_URL = api.serve()
+
+import telegram_bot as tb
+
+GUEST_BASE = 500000
+
+def create_pending(count, time_str):
+    """Заявки по 8 на вечер, чтобы всем хватило столов"""
+    booking_ids = []
+    for number in range(count):
+        date = (datetime.date.today() + datetime.timedelta(days=1 + number // 8)).strftime('%d.%m.%Y')
+        booking_ids.append(tb.save_booking_to_db(GUEST_BASE + number, {
+            'name': 'Гость', 'phone': '+79990000000', 'date': date, 'time': time_str, 'guests': 2, 'comment': '',
+        }))
+    return booking_ids
+
+def callback(data, message):
+    return types.CallbackQuery.de_json({
+        'id': str(time.monotonic_ns()), 'chat_instance': 'bench', 'data': data,
+        'from': {'id': tb.ADMIN_ID, 'is_bot': False, 'first_name': 'Admin'},
+        'message': message,
+    })
+
+def admin_notification(booking_id):
+    """Уведомление о новой заявке с кнопками, как его видит администратор"""
+    markup = {'inline_keyboard': [[
+        {'text': '✅ Одобрить', 'callback_data': f'admin_approve_{booking_id}'},
+        {'text': '❌ Отклонить', 'callback_data': f'admin_reject_{booking_id}'},
+    ]]}
+    _, response = api.call('sendMessage', {
+        'chat_id': tb.ADMIN_ID, 'text': f'НОВАЯ ЗАЯВКА #{booking_id}', 'reply_markup': json.dumps(markup),
+    })
+    return response['result'] | {'reply_markup': markup}
+
+def wait_delivered():
+    while tb.outbound.backlog:
+        time.sleep(0.005)
+
+def snapshot():
+    return sum(api.calls.values()), tb.DB_SECONDS.render()
+
+def transactions(rendered):
+    line = next((line for line in rendered if line.startswith('bot_db_seconds_count{mode="write"}')), '0 0')
+    return int(line.rsplit(' ', 1)[1])
+
+def one_by_one():
+    messages = [admin_notification(booking_id) for booking_id in create_pending(BOOKINGS, '19:00')]
+    calls, rendered = snapshot()
+    started = time.perf_counter()
+    for message in messages:
+        booking_id = message['reply_markup']['inline_keyboard'][0][0]['callback_data'].rsplit('_', 1)[1]
+        tb.router.dispatch_callback(callback(f'admin_approve_{booking_id}', message))
+    clicked = time.perf_counter() - started
+    wait_delivered()
+    total = time.perf_counter() - started
+    return clicked, total, sum(api.calls.values()) - calls, transactions(tb.DB_SECONDS.render()) - transactions(rendered)
+
+def bulk():
+    create_pending(BOOKINGS, '22:00')
+    tb.start_bulk_moderation(types.Message.de_json({
+        'message_id': 1, 'date': 1, 'text': '☑️ Пакетная модерация',
+        'from': {'id': tb.ADMIN_ID, 'is_bot': False, 'first_name': 'Admin'},
+        'chat': {'id': tb.ADMIN_ID, 'type': 'private'},
+    }))
+    wait_delivered()
+    page = api.wait_event(tb.ADMIN_ID, 0, {'sendMessage'}, 10, lambda event: 'Пакетная модерация' in event.message['text'])
+    message = page.message | {'date': 1}
+
+    calls, rendered = snapshot()
+    started = time.perf_counter()
+    tb.router.dispatch_callback(callback('bulk_all', message))
+    tb.router.dispatch_callback(callback('bulk_approve', message))
+    clicked = time.perf_counter() - started
+    wait_delivered()
+    total = time.perf_counter() - started
+    return clicked, total, sum(api.calls.values()) - calls, transactions(tb.DB_SECONDS.render()) - transactions(rendered)
+
+def main():
+    tb.init_db()
+    tb.seating.load_from_db()
+    tb.outbound.start()
+
+    print(f"{BOOKINGS} заявок, задержка Bot API {API_LATENCY_MS} мс, лимит {tb.GLOBAL_SEND_RATE:.0f} сообщений/с")
+    print(f"{'режим':<14} {'нажатия, с':>11} {'до доставки, с':>15} {'вызовов API':>12} {'транзакций':>11}")
+    for name, run in (('по одной', one_by_one), ('пакетом', bulk)):
+        clicked, total, calls, writes = run()
+        print(f"{name:<14} {clicked:>11.2f} {total:>15.2f} {calls:>12} {writes:>11}")
+
+    with tb.db.connection() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM bookings WHERE status = 'approved'")
+        print(f"одобрено всего: {cursor.fetchone()[0]}")
+
+if __name__ == '__main__':
+    main()
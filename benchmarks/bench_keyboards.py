@@ -0,0 +1,63 @@
+# benchmarks/bench_keyboards.py
+# Время и выделения памяти на одну клавиатуру: сборка с нуля против кэша готовых JSON-разметок.
+#
+#   python benchmarks/bench_keyboards.py
+import datetime
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+import telegram_bot as tb
+
+CALLS = 2000
+
+def rebuilt_time_buttons(date_str):
+    # Прежний путь: strptime для каждого слота и новая разметка на каждый запрос
+    now = datetime.datetime.now()
+    times = [
+        time_str for time_str in tb.booking_time_slots(date_str)
+        if tb.booking_start(date_str, time_str) > now and tb.seating.plan(tb.DEFAULT_VENUE_ID).can_seat(1, tb.booking_start(date_str, time_str))
+    ]
+    return tb.build_time_buttons(times).to_json()
+
+def measure(func):
+    """Время вызова и пик выделенной за вызов памяти"""
+    func()
+    per_call_us = min(timeit.repeat(func, number=CALLS, repeat=3)) / CALLS * 1e6
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return per_call_us, peak
+
+def main():
+    tb.init_db()
+    tb.seating.load_from_db()
+    today = datetime.date.today()
+    date_str = (today + datetime.timedelta(days=3)).strftime('%d.%m.%Y')
+
+    cases = [
+        ('календарь', lambda: tb.build_calendar(today.year, today.month, today).to_json(),
+                      lambda: tb.generate_calendar(today.year, today.month)),
+        ('сетка времени', lambda: rebuilt_time_buttons(date_str),
+                          lambda: tb.generate_time_buttons(date_str)),
+        ('главное меню', lambda: tb.build_main_menu(False).to_json(),
+                         lambda: tb.main_menu(42)),
+    ]
+
+    print(f"{'клавиатура':<15} {'сборка, мкс':>12} {'кэш, мкс':>10} {'сборка, Б/вызов':>16} {'кэш, Б/вызов':>13}")
+    for name, rebuilt, cached in cases:
+        rebuilt_us, rebuilt_bytes = measure(rebuilt)
+        cached_us, cached_bytes = measure(cached)
+        print(f"{name:<15} {rebuilt_us:>12.1f} {cached_us:>10.2f} {rebuilt_bytes:>16} {cached_bytes:>13}")
+    print(f"попаданий в кэш: {tb.keyboards.hits}, промахов: {tb.keyboards.misses}")
+
+if __name__ == '__main__':
+    main()
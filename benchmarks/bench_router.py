@@ -0,0 +1,74 @@
+# benchmarks/bench_router.py
+# Стоимость выбора обработчика в зависимости от числа маршрутов.
+# Сравнивает таблицы router с линейным перебором предикатов, как в message_handler(func=...).
+#
+#   python benchmarks/bench_router.py
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+import telegram_bot as tb
+from telebot.types import Message
+
+ROUTE_COUNTS = (10, 100, 1000, 10000)
+CALLS = 100000
+
+def make_message(user_id, text):
+    return Message.de_json({
+        'message_id': 1, 'date': 0, 'text': text,
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+        'chat': {'id': user_id, 'type': 'private'},
+    })
+
+def make_router(extra):
+    router = tb.Router(tb.conversation_state)
+    router.texts.update(tb.router.texts)
+    router.states.update(tb.router.states)
+    router.callbacks.update(tb.router.callbacks)
+    for number in range(extra):
+        router.text(f'Кнопка {number}')(print)
+        router.callback(f'extra_{number}')(print)
+    return router
+
+def make_predicates(extra):
+    # Порядок как у telebot: сначала дополнительные кнопки, нужная - последней
+    predicates = [(lambda message, text=f'Кнопка {number}': message.text == text) for number in range(extra)]
+    predicates.append(lambda message: message.text == '📞 Контакты')
+    return predicates
+
+def linear_resolve(predicates, message):
+    for predicate in predicates:
+        if predicate(message):
+            return predicate
+    return None
+
+def per_call_ns(stmt, calls=CALLS):
+    return min(timeit.repeat(stmt, number=calls, repeat=3)) / calls * 1e9
+
+def main():
+    tb.init_db()
+
+    button = make_message(42, '📞 Контакты')
+    in_dialog = make_message(43, 'Иван')
+    tb.user_data[43] = {'state': tb.BookingState.NAME, 'booking_steps': []}
+    callback = 'calendar_prev_2025_1'
+
+    print(f"{'маршрутов':>10} {'кнопка, нс':>12} {'шаг диалога, нс':>16} {'callback, нс':>13} {'перебор, нс':>13}")
+    for extra in ROUTE_COUNTS:
+        router = make_router(extra)
+        predicates = make_predicates(extra)
+        print(
+            f"{extra:>10} "
+            f"{per_call_ns(lambda: router.resolve_message(button)):>12.0f} "
+            f"{per_call_ns(lambda: router.resolve_message(in_dialog)):>16.0f} "
+            f"{per_call_ns(lambda: router.resolve_callback(callback)):>13.0f} "
+            f"{per_call_ns(lambda: linear_resolve(predicates, button), calls=max(100, CALLS * 10 // extra)):>13.0f}"
+        )
+
+if __name__ == '__main__':
+    main()
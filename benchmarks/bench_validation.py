@@ -0,0 +1,60 @@
+# benchmarks/bench_validation.py
+# Стоимость проверки ввода гостя: каждый валидатор и разбор даты по 100 000 вызовов.
+# Отдельной строкой - все проверки одного шага выбора даты и времени.
+#
+#   python benchmarks/bench_validation.py
+import datetime
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+import telegram_bot as tb
+
+CALLS = 100000
+
+def per_call_ns(stmt, calls=CALLS):
+    return min(timeit.repeat(stmt, number=calls, repeat=3)) / calls * 1e9
+
+def booking_step(date_str, time_str):
+    """Проверки, которые проходит одна бронь от выбора даты до сохранения"""
+    tb.validate_date(date_str)
+    tb.get_restaurant_hours(date_str)
+    tb.validate_time(time_str, date_str)
+    tb.booking_start(date_str, time_str)
+    tb.is_booking_active(date_str)
+
+def main():
+    tb.init_db()
+    tb.venues.load_from_db()
+    tb.seating.load_from_db()
+
+    date_str = (datetime.date.today() + datetime.timedelta(days=5)).strftime('%d.%m.%Y')
+    cases = [
+        ('validate_phone', lambda: tb.validate_phone('8 (912) 345-67-89')),
+        ('validate_phone, мусор', lambda: tb.validate_phone('позвоните мне')),
+        ('validate_name', lambda: tb.validate_name('Анна-Мария')),
+        ('validate_name, мусор', lambda: tb.validate_name('R2-D2!')),
+        ('validate_guests', lambda: tb.validate_guests('4')),
+        ('validate_date', lambda: tb.validate_date(date_str)),
+        ('validate_date, мусор', lambda: tb.validate_date('завтра')),
+        ('validate_time', lambda: tb.validate_time('20:30', date_str)),
+        ('validate_time, ночь', lambda: tb.validate_time('01:30', date_str)),
+        ('validate_time, мусор', lambda: tb.validate_time('вечером', date_str)),
+        ('get_restaurant_hours', lambda: tb.get_restaurant_hours(date_str)),
+        ('is_booking_active', lambda: tb.is_booking_active(date_str)),
+        ('booking_start', lambda: tb.booking_start(date_str, '20:30')),
+        ('generate_time_buttons', lambda: tb.generate_time_buttons(date_str)),
+        ('шаг даты и времени', lambda: booking_step(date_str, '20:30')),
+    ]
+
+    print(f"{'проверка':<24} {'нс/вызов':>10}")
+    for name, stmt in cases:
+        print(f"{name:<24} {per_call_ns(stmt):>10.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# loadtest/bot_runner.py
+# Запускает telegram_bot.py против поддельного Bot API (FAKE_API_URL) и при завершении
+# пишет в LOADTEST_STATS счетчики процесса: ожидания пула БД, ошибки в логе, очередь отправки.
+import atexit
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telebot import apihelper
+
+apihelper.API_URL = os.environ['FAKE_API_URL']
+
+import telegram_bot as tb
+
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+        self.samples = []
+
+    def emit(self, record):
+        self.count += 1
+        if len(self.samples) < 10:
+            self.samples.append(record.getMessage())
+
+
+errors = ErrorCounter()
+logging.getLogger().addHandler(errors)
+logging.getLogger('TeleBot').addHandler(errors)
+
+
+def dump_stats():
+    path = os.environ.get('LOADTEST_STATS')
+    if not path:
+        return
+    with open(path, 'w') as stats_file:
+        json.dump({
+            'db_wait_count': tb.db.wait_count,
+            'db_wait_seconds': tb.db.wait_seconds,
+            'outbound_backlog': tb.outbound.backlog,
+            'sessions': len(tb.user_data),
+            'errors': errors.count,
+            'error_samples': errors.samples,
+        }, stats_file, ensure_ascii=False)
+
+
+atexit.register(dump_stats)
+
+if __name__ == '__main__':
+    tb.main()
@@ -0,0 +1,290 @@
+# loadtest/fake_api.py
+# Локальная замена Bot API для нагрузочных прогонов.
+# Понимает getUpdates, sendMessage, editMessageText, editMessageReplyMarkup, deleteMessage,
+# answerCallbackQuery, getChat, getMe; остальные методы отвечают {"ok": true, "result": true}.
+#
+# Отдельно:  python loadtest/fake_api.py --port 8081 --latency-ms 50 --rate-limit 0.01
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'LoadTestBot', 'username': 'loadtest_bot'}
+RATE_LIMITED_METHODS = {'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'sendDocument'}
+
+
+class BotEvent:
+    """Вызов API от бота, адресованный чату"""
+    __slots__ = ('seq', 'at', 'method', 'params', 'message')
+
+    def __init__(self, seq, at, method, params, message):
+        self.seq = seq
+        self.at = at
+        self.method = method
+        self.params = params
+        self.message = message
+
+
+class FakeBotAPI:
+    """Состояние поддельного Telegram: очередь обновлений, сообщения чатов и журнал вызовов.
+
+    latency_ms/jitter_ms - задержка ответа на каждый вызов кроме getUpdates;
+    rate_limit - доля вызовов отправки, на которые отвечаем 429 с retry_after.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, rate_limit=0.0, retry_after=1, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._cond = threading.Condition()
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._seq = itertools.count(1)
+        self._events = defaultdict(list)      # chat_id -> [BotEvent]
+        self._messages = {}                   # (chat_id, message_id) -> dict сообщения
+        self._answers = {}                    # callback_query_id -> BotEvent
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self.server = None
+
+    # --- сторона гостей ---
+    def push_update(self, update):
+        with self._cond:
+            update['update_id'] = next(self._update_ids)
+            self._updates.append(update)
+            self._cond.notify_all()
+        return update['update_id']
+
+    def push_text(self, user_id, text, first_name='Guest'):
+        message = {
+            'message_id': next(self._message_ids), 'date': int(time.time()), 'text': text,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': first_name},
+            'chat': {'id': user_id, 'type': 'private'},
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return self.push_update({'message': message})
+
+    def push_callback(self, user_id, message, data, first_name='Guest'):
+        callback_id = str(next(self._seq))
+        self.push_update({'callback_query': {
+            'id': callback_id, 'chat_instance': 'loadtest', 'data': data,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': first_name},
+            'message': message,
+        }})
+        return callback_id
+
+    def mark(self, chat_id):
+        """Номер последнего события чата; ожидание ответа начинается после него"""
+        with self._cond:
+            events = self._events.get(chat_id)
+            return events[-1].seq if events else 0
+
+    def wait_event(self, chat_id, after, methods, timeout, predicate=None):
+        """Первое событие чата после after с методом из methods, или None по таймауту"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            checked = 0
+            while True:
+                events = self._events.get(chat_id, [])
+                for event in events[checked:]:
+                    if event.seq > after and event.method in methods and (predicate is None or predicate(event)):
+                        return event
+                checked = len(events)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def wait_answer(self, callback_id, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while callback_id not in self._answers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._answers[callback_id]
+
+    def message(self, chat_id, message_id):
+        with self._cond:
+            return self._messages.get((chat_id, message_id))
+
+    # --- сторона бота ---
+    def get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if offset:
+                self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(min(remaining, 1.0))
+            return self._updates[:limit]
+
+    def _record(self, chat_id, method, params, message=None):
+        event = BotEvent(next(self._seq), time.monotonic(), method, params, message)
+        self._events[chat_id].append(event)
+        if method == 'answerCallbackQuery':
+            self._answers[params.get('callback_query_id')] = event
+        self._cond.notify_all()
+        return event
+
+    def call(self, method, params):
+        """Выполняет метод API; возвращает (http-код, тело ответа)"""
+        self.calls[method] += 1
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': self.get_updates(params)}
+
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+        if method in RATE_LIMITED_METHODS and self.rate_limit and self._random.random() < self.rate_limit:
+            self.rate_limited[method] += 1
+            return 429, {
+                'ok': False, 'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            }
+
+        chat_id = int(params['chat_id']) if params.get('chat_id') else None
+        markup = json.loads(params['reply_markup']) if params.get('reply_markup') else None
+        with self._cond:
+            if method in ('sendMessage', 'sendDocument'):
+                message = {
+                    'message_id': next(self._message_ids), 'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER,
+                    'text': params.get('text') or params.get('caption') or '',
+                }
+                if markup:
+                    message['reply_markup'] = markup
+                self._messages[(chat_id, message['message_id'])] = message
+                self._record(chat_id, method, params, message)
+                # Как и Telegram, в ответе возвращаем только inline-разметку
+                result = dict(message)
+                if not (markup or {}).get('inline_keyboard'):
+                    result.pop('reply_markup', None)
+                return 200, {'ok': True, 'result': result}
+
+            if method in ('editMessageText', 'editMessageReplyMarkup'):
+                key = (chat_id, int(params.get('message_id') or 0))
+                message = self._messages.get(key)
+                if message is None:
+                    return 400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: message to edit not found'}
+                if method == 'editMessageText':
+                    message['text'] = params.get('text', '')
+                if markup and markup.get('inline_keyboard'):
+                    message['reply_markup'] = markup
+                else:
+                    message.pop('reply_markup', None)
+                self._record(chat_id, method, params, message)
+                return 200, {'ok': True, 'result': message}
+
+            if method == 'deleteMessage':
+                self._messages.pop((chat_id, int(params.get('message_id') or 0)), None)
+                self._record(chat_id, method, params)
+                return 200, {'ok': True, 'result': True}
+
+            if method == 'answerCallbackQuery':
+                # Ответ на callback не несет chat_id: кладем его в отдельный чат 0
+                self._record(0, method, params)
+                return 200, {'ok': True, 'result': True}
+
+        if method == 'getChat':
+            return 200, {'ok': True, 'result': {'id': chat_id, 'type': 'private', 'first_name': f'Guest{chat_id}'}}
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': BOT_USER}
+        return 200, {'ok': True, 'result': True}
+
+    # --- HTTP ---
+    def serve(self, host='127.0.0.1', port=0):
+        """Запускает сервер в фоновом потоке; возвращает адрес для apihelper.API_URL"""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _params(self):
+                parts = urlsplit(self.path)
+                params = dict(parse_qsl(parts.query))
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if body and content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update(parse_qsl(body.decode()))
+                elif body and content_type.startswith('application/json'):
+                    params.update({key: value if isinstance(value, str) else json.dumps(value)
+                                   for key, value in json.loads(body).items()})
+                elif body and content_type.startswith('multipart/form-data'):
+                    headers = f'Content-Type: {content_type}\r\n\r\n'.encode()
+                    for part in BytesParser(policy=HTTP).parsebytes(headers + body).iter_parts():
+                        name = part.get_param('name', header='content-disposition')
+                        if part.get_filename():
+                            params[name] = f'<file {part.get_filename()} {len(part.get_payload(decode=True))} bytes>'
+                        else:
+                            params[name] = part.get_content()
+                return parts.path, params
+
+            def _handle(self):
+                path, params = self._params()
+                method = path.rstrip('/').rsplit('/', 1)[-1]
+                code, payload = api.call(method, params)
+                body = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _handle
+            do_POST = _handle
+
+        ThreadingHTTPServer.daemon_threads = True
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='fake-api', daemon=True).start()
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/bot{{0}}/{{1}}'
+
+    def shutdown(self):
+        if self.server:
+            self.server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поддельный Bot API для локальных прогонов')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-limit', type=float, default=0, help='доля ответов 429 на отправку')
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency_ms, args.jitter_ms, args.rate_limit, args.retry_after)
+    url = api.serve(args.host, args.port)
+    print(f'Fake Bot API: {url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        api.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# loadtest/overbooking.py
+# Проверка закрепления столов под параллельной записью: много потоков одновременно
+# бронируют пересекающиеся слоты одного вечера, после чего по booking_tables проверяется,
+# что ни один стол не отдан двум броням с пересекающимся временем.
+#
+#   python loadtest/overbooking.py --rounds 20 --threads 16
+#
+# Код выхода 1 - найдено двойное закрепление; пары броней печатаются.
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import threading
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '123456:OVERBOOKING')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'overbooking.db')
+os.environ['METRICS_PORT'] = '0'
+
+import telegram_bot as tb
+
+SLOTS = ('20:00', '20:30', '21:00', '21:30')
+GUESTS = (2, 4, 6, 8)
+
+
+def book_round(date_str, threads):
+    """Все потоки стартуют по барьеру и бронируют, пока не получат NoSeatsAvailable"""
+    barrier = threading.Barrier(threads)
+    errors = []
+
+    def guest(index):
+        barrier.wait()
+        attempt = 0
+        while True:
+            data = {
+                'name': 'Гость', 'phone': '+79990000000', 'date': date_str,
+                'time': SLOTS[(index + attempt) % len(SLOTS)], 'guests': GUESTS[index % len(GUESTS)],
+            }
+            attempt += 1
+            try:
+                tb.save_booking_to_db(100000 + index, data)
+            except tb.NoSeatsAvailable:
+                return
+            except Exception as e:
+                errors.append(e)
+                return
+
+    workers = [threading.Thread(target=guest, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return errors
+
+
+def double_bookings():
+    """Пары броней, которым достался один стол в пересекающееся время"""
+    with tb.db.connection() as cursor:
+        cursor.execute('SELECT table_id, booking_id, start_ts, end_ts FROM booking_tables ORDER BY table_id, start_ts')
+        rows = cursor.fetchall()
+    by_table = defaultdict(list)
+    for table_id, booking_id, start_ts, end_ts in rows:
+        by_table[table_id].append((start_ts, end_ts, booking_id))
+    clashes = []
+    for table_id, intervals in by_table.items():
+        for (start, end, booking_id), (next_start, _, next_id) in zip(intervals, intervals[1:]):
+            if next_start < end:
+                clashes.append((table_id, booking_id, next_id))
+    return clashes, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка двойного закрепления столов')
+    parser.add_argument('--rounds', type=int, default=20, help='вечеров с параллельной записью')
+    parser.add_argument('--threads', type=int, default=16, help='одновременных гостей на вечер')
+    args = parser.parse_args()
+
+    tb.init_db()
+    tb.venues.load_from_db()
+    tb.schedule.load_from_db()
+    tb.reliability.load_from_db()
+    tb.seating.load_from_db()
+
+    errors = []
+    for day in range(args.rounds):
+        date_str = (datetime.date.today() + datetime.timedelta(days=2 + day)).strftime('%d.%m.%Y')
+        errors += book_round(date_str, args.threads)
+
+    clashes, assigned = double_bookings()
+    print(f"вечеров: {args.rounds}, потоков: {args.threads}, закреплений столов: {assigned}")
+    for error in errors:
+        print(f"ошибка: {error!r}")
+    for table_id, booking_id, other_id in clashes:
+        print(f"стол {table_id}: брони #{booking_id} и #{other_id} пересекаются")
+    print("двойных закреплений нет" if not clashes and not errors else f"двойных закреплений: {len(clashes)}")
+    sys.exit(1 if clashes or errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+# loadtest/swarm.py
+# Нагрузочный прогон telegram_bot.py без Telegram: поднимает поддельный Bot API,
+# запускает бота отдельным процессом в режиме polling и прогоняет гостей по всему сценарию
+# бронирования (старт -> календарь -> время -> гости -> имя -> телефон -> комментарий),
+# пока администраторы одобряют и отклоняют заявки.
+#
+#   python loadtest/swarm.py --guests 2000 --concurrency 200 --latency-ms 40 --rate-limit 0.01
+#
+# Отчет: p50/p95/p99 задержки ответа по шагам, пропускная способность, ожидания пула БД,
+# ответы 429, таймауты и ошибки в логе бота, а также сводка /metrics бота по обработчикам,
+# SQLite и вызовам Bot API (полный текст метрик сохраняется рядом с логом).
+import argparse
+import datetime
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import FakeBotAPI
+
+ADMIN_ID = 800471772          # совпадает с ADMIN_ID в telegram_bot.py
+GUEST_ID_BASE = 10_000_000
+NAMES = ('Анна', 'Иван', 'Мария', 'Павел', 'Ольга', 'Дмитрий', 'Елена', 'Сергей')
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot_runner.py')
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.outcomes = Counter()
+        self.errors = Counter()
+        self.updates = 0
+
+    def latency(self, step, seconds):
+        with self._lock:
+            self.latencies[step].append(seconds)
+
+    def outcome(self, name):
+        with self._lock:
+            self.outcomes[name] += 1
+
+    def error(self, name):
+        with self._lock:
+            self.errors[name] += 1
+
+    def sent(self, count=1):
+        with self._lock:
+            self.updates += count
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[int(round(q * (len(ordered) - 1)))]
+
+
+def buttons(message, inline=True):
+    markup = (message or {}).get('reply_markup') or {}
+    rows = markup.get('inline_keyboard' if inline else 'keyboard') or []
+    return [button for row in rows for button in row]
+
+
+class Guest:
+    def __init__(self, api, recorder, number, args):
+        self.api = api
+        self.recorder = recorder
+        self.user_id = GUEST_ID_BASE + number
+        self.args = args
+        self.random = random.Random(args.seed * 1_000_003 + number if args.seed is not None else None)
+
+    def think(self):
+        if self.args.think_ms:
+            time.sleep(self.random.uniform(0, self.args.think_ms) / 1000)
+
+    def say(self, step, text, expect=None):
+        """Отправляет текст и ждет следующего сообщения бота в чат"""
+        after = self.api.mark(self.user_id)
+        started = time.monotonic()
+        self.api.push_text(self.user_id, text)
+        self.recorder.sent()
+        event = self.api.wait_event(self.user_id, after, {'sendMessage'}, self.args.timeout)
+        if event is None:
+            self.recorder.error(f'таймаут: {step}')
+            raise StepFailed(step)
+        self.recorder.latency(step, event.at - started)
+        return event.message
+
+    def press(self, step, message, data):
+        """Нажимает inline-кнопку; возвращает новое сообщение бота или None, если был только ответ на callback"""
+        after = self.api.mark(self.user_id)
+        started = time.monotonic()
+        callback_id = self.api.push_callback(self.user_id, message, data)
+        self.recorder.sent()
+        answer = self.api.wait_answer(callback_id, self.args.timeout)
+        if answer is None:
+            self.recorder.error(f'таймаут: {step}')
+            raise StepFailed(step)
+        event = self.api.wait_event(self.user_id, after, {'sendMessage', 'editMessageReplyMarkup'}, 0)
+        self.recorder.latency(step, (event.at if event else answer.at) - started)
+        return event
+
+    def run(self):
+        try:
+            self.recorder.outcome(self.book())
+        except StepFailed:
+            self.recorder.outcome('таймаут')
+
+    def book(self):
+        calendar = self.say('старт', '📅 Забронировать стол')
+        self.think()
+
+        today = datetime.date.today().strftime('%d.%m.%Y')
+        days = [b['callback_data'] for b in buttons(calendar) if b.get('callback_data', '').startswith('calendar_day_')]
+        days = [data for data in days if not data.endswith(today)]
+        if not days:
+            arrow = next(b['callback_data'] for b in buttons(calendar) if b.get('callback_data', '').startswith('calendar_next_'))
+            self.press('календарь ▶️', calendar, arrow)
+            calendar = self.api.message(self.user_id, calendar['message_id'])
+            days = [b['callback_data'] for b in buttons(calendar) if b.get('callback_data', '').startswith('calendar_day_')]
+
+        times_message = None
+        for data in self.random.sample(days, min(3, len(days))):
+            event = self.press('дата', calendar, data)
+            if event and event.method == 'sendMessage':
+                times_message = event.message
+                break
+            self.think()
+        if times_message is None:
+            return 'нет дат'
+
+        times = [b['text'] for b in buttons(times_message, inline=False) if ':' in b['text']]
+        for time_str in self.random.sample(times, min(3, len(times))):
+            self.think()
+            reply = self.say('время', time_str)
+            if 'Шаг 3' in reply['text']:
+                break
+        else:
+            self.say('отмена', '❌ Отмена бронирования')
+            return 'нет времени'
+
+        self.think()
+        reply = self.say('гости', str(self.random.choice([1, 2, 2, 2, 3, 4, 4, 5, 6])))
+        if 'Шаг 4' not in reply['text']:
+            self.say('отмена', '❌ Отмена бронирования')
+            return 'нет столов'
+
+        self.think()
+        reply = self.say('имя', self.random.choice(NAMES))
+        if 'Шаг 5' not in reply['text']:
+            self.recorder.error('неожиданный ответ: имя')
+            return 'ошибка'
+
+        self.think()
+        phone = f'+7 9{self.random.randint(10, 99)} {self.random.randint(100, 999)}-{self.random.randint(10, 99)}-{self.random.randint(10, 99)}'
+        reply = self.say('телефон', phone)
+        if 'Шаг 6' not in reply['text']:
+            self.recorder.error('неожиданный ответ: телефон')
+            return 'ошибка'
+
+        self.think()
+        comment = '➡️ Пропустить комментарий' if self.random.random() < 0.5 else 'Столик у окна'
+        reply = self.say('комментарий', comment)
+        if 'Заявка на бронирование отправлена' in reply['text']:
+            return 'забронировано'
+        return 'стол заняли'
+
+
+class Admin:
+    """Администратор разбирает уведомления о новых заявках; несколько потоков делят одну очередь"""
+
+    claimed = set()
+    claimed_lock = threading.Lock()
+
+    def __init__(self, api, recorder, number, args, guests_done):
+        self.api = api
+        self.recorder = recorder
+        self.args = args
+        self.guests_done = guests_done
+        self.random = random.Random(None if args.seed is None else args.seed + number)
+        self.seen = 0
+        self.decisions = 0
+
+    def claim(self, data):
+        with self.claimed_lock:
+            if data in self.claimed and self.random.random() >= self.args.double_click:
+                return False
+            self.claimed.add(data)
+            return True
+
+    def decide(self, message, booking_id):
+        action = 'reject' if self.random.random() < self.args.reject_ratio else 'approve'
+        started = time.monotonic()
+        callback_id = self.api.push_callback(ADMIN_ID, message, f'admin_{action}_{booking_id}', first_name='Admin')
+        self.recorder.sent()
+        answer = self.api.wait_answer(callback_id, self.args.timeout)
+        if answer is None:
+            self.recorder.error('таймаут: решение администратора')
+            return
+        self.recorder.latency('админ: решение', answer.at - started)
+        self.decisions += 1
+
+        if self.decisions % 20 == 0:
+            after = self.api.mark(ADMIN_ID)
+            started = time.monotonic()
+            self.api.push_text(ADMIN_ID, '⏳ Ожидающие заявки', first_name='Admin')
+            self.recorder.sent()
+            event = self.api.wait_event(
+                ADMIN_ID, after, {'sendMessage'}, self.args.timeout,
+                lambda event: event.message['text'].startswith(('⏳', '✅ Нет'))
+            )
+            if event is None:
+                self.recorder.error('таймаут: список заявок')
+            else:
+                self.recorder.latency('админ: список', event.at - started)
+
+    def run(self):
+        idle_since = None
+        while True:
+            event = self.api.wait_event(
+                ADMIN_ID, self.seen, {'sendMessage'}, 0.5,
+                lambda event: 'НОВАЯ ЗАЯВКА' in event.message['text']
+            )
+            if event is None:
+                if self.guests_done.is_set():
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > 2:
+                        return
+                continue
+            idle_since = None
+            self.seen = event.seq
+            approve = next((b['callback_data'] for b in buttons(event.message) if b.get('callback_data', '').startswith('admin_approve_')), None)
+            if approve and self.claim(approve):
+                self.decide(event.message, approve.rsplit('_', 1)[1])
+
+
+def wait_until_polling(api, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while api.calls['getUpdates'] == 0:
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise SystemExit('Бот не начал опрос getUpdates, см. лог бота')
+        time.sleep(0.1)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def scrape_metrics(port, path):
+    """Снимает /metrics бота перед остановкой; возвращает текст или None"""
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+            text = response.read().decode()
+    except OSError:
+        return None
+    with open(path, 'w') as metrics_file:
+        metrics_file.write(text)
+    return text
+
+
+def histogram_summary(text, name):
+    """{метки: (count, среднее, p95 по границам корзин)} для гистограммы из текста /metrics"""
+    buckets = defaultdict(list)
+    sums = {}
+    for line in text.splitlines():
+        if line.startswith(name + '_bucket{'):
+            labels, value = line[len(name) + 8:].rsplit('} ', 1)
+            labels, le = labels.rsplit(',le=', 1) if ',le=' in labels else ('', labels[3:])
+            buckets[labels].append((float(le.strip('"')), float(value)))
+        elif line.startswith(name + '_sum'):
+            labels, value = line[len(name) + 4:].rsplit(' ', 1)
+            sums[labels.strip('{}')] = float(value)
+    summary = {}
+    for labels, series in buckets.items():
+        count = series[-1][1]
+        if not count:
+            continue
+        p95 = next(bound for bound, cumulative in series if cumulative >= 0.95 * count)
+        summary[labels] = (int(count), sums.get(labels, 0) / count, p95)
+    return summary
+
+
+def report(args, recorder, api, stats, elapsed, log_path, metrics_text=None):
+    print('\n=== Нагрузочный прогон ===')
+    print(f'гостей: {args.guests}, одновременно: {args.concurrency}, администраторов: {args.admins}, '
+          f'длительность: {elapsed:.1f} с')
+    print('исходы: ' + ', '.join(f'{name}={count}' for name, count in recorder.outcomes.most_common()))
+
+    print(f"\n{'шаг':<22}{'n':>7}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    everything = []
+    for step, values in recorder.latencies.items():
+        everything.extend(values)
+        print(f'{step:<22}{len(values):>7}' + ''.join(
+            f'{percentile(values, q) * 1000:>10.0f}' for q in (0.5, 0.95, 0.99, 1.0)))
+    if everything:
+        print(f"{'все шаги':<22}{len(everything):>7}" + ''.join(
+            f'{percentile(everything, q) * 1000:>10.0f}' for q in (0.5, 0.95, 0.99, 1.0)))
+
+    booked = recorder.outcomes['забронировано']
+    print(f'\nпропускная способность: {recorder.updates / elapsed:.1f} обновлений/с, {booked / elapsed:.2f} броней/с')
+    print('вызовы API: ' + ', '.join(f'{method}={count}' for method, count in api.calls.most_common()))
+    print(f'ответов 429: {sum(api.rate_limited.values())}')
+    if stats:
+        print(f"пул БД: ожиданий соединения {stats['db_wait_count']}, всего {stats['db_wait_seconds']:.3f} с")
+        print(f"очередь отправки при остановке: {stats['outbound_backlog']}, активных сессий: {stats['sessions']}")
+    if metrics_text:
+        print(f"\n{'метрика бота':<80}{'n':>7}{'среднее, мс':>13}{'p95 ≤, мс':>11}")
+        for name in ('bot_handler_seconds', 'bot_db_seconds', 'bot_telegram_api_seconds', 'bot_outbound_queue_seconds'):
+            rows = sorted(histogram_summary(metrics_text, name).items(), key=lambda item: -item[1][0] * item[1][1])
+            for labels, (count, mean, p95) in rows[:8]:
+                print(f'{name + " " + labels:<80.80}{count:>7}{mean * 1000:>13.2f}{p95 * 1000:>11.0f}')
+    errors = sum(recorder.errors.values()) + (stats or {}).get('errors', 0)
+    print(f'ошибки: {errors}')
+    for name, count in recorder.errors.most_common():
+        print(f'  {name}: {count}')
+    if stats and stats['errors']:
+        print(f"  в логе бота: {stats['errors']} (лог: {log_path})")
+        for sample in stats['error_samples']:
+            print(f'    {sample}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон бота на поддельном Bot API')
+    parser.add_argument('--guests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50, help='гостей в сценарии одновременно')
+    parser.add_argument('--admins', type=int, default=2, help='потоков администратора')
+    parser.add_argument('--reject-ratio', type=float, default=0.2)
+    parser.add_argument('--double-click', type=float, default=0.05, help='доля повторных нажатий на уже решенную заявку')
+    parser.add_argument('--think-ms', type=float, default=0, help='пауза гостя между шагами, до')
+    parser.add_argument('--timeout', type=float, default=30, help='ожидание ответа бота, с')
+    parser.add_argument('--latency-ms', type=float, default=20, help='задержка ответа Bot API')
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='доля ответов 429 на отправку')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--global-send-rate', type=float, default=1000,
+                        help='GLOBAL_SEND_RATE бота; у настоящего Telegram 30')
+    parser.add_argument('--chat-send-rate', type=float, default=20, help='CHAT_SEND_RATE бота')
+    parser.add_argument('--update-workers', type=int, default=16)
+    parser.add_argument('--outbound-workers', type=int, default=16)
+    parser.add_argument('--db', help='файл БД (по умолчанию временный)')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency_ms, args.jitter_ms, args.rate_limit, args.retry_after, seed=args.seed)
+    url = api.serve()
+
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    stats_path = os.path.join(workdir, 'stats.json')
+    log_path = os.path.join(workdir, 'bot.log')
+    metrics_path = os.path.join(workdir, 'metrics.txt')
+    metrics_port = free_port()
+    env = dict(
+        os.environ,
+        BOT_TOKEN='123456:LOADTEST',
+        BOT_MODE='polling',
+        FAKE_API_URL=url,
+        DB_PATH=args.db or os.path.join(workdir, 'loadtest.db'),
+        LOADTEST_STATS=stats_path,
+        GLOBAL_SEND_RATE=str(args.global_send_rate),
+        CHAT_SEND_RATE=str(args.chat_send_rate),
+        CHAT_SEND_BURST=str(max(3, int(args.chat_send_rate))),
+        UPDATE_WORKERS=str(args.update_workers),
+        OUTBOUND_WORKERS=str(args.outbound_workers),
+        METRICS_PORT=str(metrics_port),
+        PYTHONUNBUFFERED='1',
+    )
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen([sys.executable, RUNNER], env=env, stdout=log, stderr=subprocess.STDOUT)
+    print(f'бот запущен (pid {process.pid}), лог: {log_path}')
+
+    recorder = Recorder()
+    stats = metrics_text = None
+    try:
+        wait_until_polling(api, process)
+        guests_done = threading.Event()
+        admins = [threading.Thread(target=Admin(api, recorder, number, args, guests_done).run, daemon=True)
+                  for number in range(args.admins)]
+        started = time.monotonic()
+        for admin in admins:
+            admin.start()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for number in range(args.guests):
+                pool.submit(Guest(api, recorder, number, args).run)
+        guests_done.set()
+        for admin in admins:
+            admin.join()
+        elapsed = time.monotonic() - started
+        metrics_text = scrape_metrics(metrics_port, metrics_path)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        api.shutdown()
+
+    if os.path.exists(stats_path):
+        with open(stats_path) as stats_file:
+            stats = json.load(stats_file)
+    report(args, recorder, api, stats, elapsed, log_path, metrics_text)
+
+
+if __name__ == '__main__':
+    main()
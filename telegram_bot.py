@@ -1,1794 +1,5985 @@
-# telegram_bot.py 
-import os
-import signal
-import telebot
-from telebot.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-import sqlite3
-import datetime
-import time as time_module
-import re
-import threading
-from datetime import timedelta
-import logging
-
-# === НАСТРОЙКА ЛОГГИРОВАНИЯ ===
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
-
-# === ОБРАБОТКА ЗАВЕРШЕНИЯ ===
-def handle_exit(signum, frame):
-    logger.info("🤖 Бот завершает работу...")
-    exit(0)
-
-signal.signal(signal.SIGINT, handle_exit)
-signal.signal(signal.SIGTERM, handle_exit)
-
-# === КОНФИГУРАЦИЯ ===
-# Используем переменные окружения Railway
-BOT_TOKEN = os.environ.get('BOT_TOKEN')
-if not BOT_TOKEN:
-    logger.error("❌ BOT_TOKEN не установлен!")
-    exit(1)
-bot = telebot.TeleBot(BOT_TOKEN)
-
-# Обновленные данные ресторана
-RESTAURANT_INFO = {
-    'name': 'Лаундж-Бар на Уральской',
-    'address': 'г. Калининград, ул. Уральская, 11',
-    'phone': '+7(4012)63-69-39',
-    'hours_week': 'вс-чт 16:00-02:00',
-    'hours_weekend': 'пт-сб 16:00-03:00',
-    'description': 'Уютный лаундж-бар с игровой приставкой, Xbox и настольными играми. Идеальное место для отдыха с друзьями!',
-    'entertainment': '🎮 Игровая приставка\n🎯 Xbox\n♟️ Настольные игры'
-}
-
-ADMIN_ID = 800471772
-
-# Состояния бронирования
-class BookingState:
-    DATE = 1
-    TIME = 2
-    GUESTS = 3
-    NAME = 4
-    PHONE = 5
-    COMMENT = 6
-
-# Классы для управления состояниями
-class AdminStates:
-    _reply_modes = {}
-    _review_reply_modes = {}
-    
-    @classmethod
-    def set_booking_reply_mode(cls, admin_id, booking_id):
-        cls._reply_modes[admin_id] = booking_id
-    
-    @classmethod
-    def get_booking_reply_mode(cls, admin_id):
-        return cls._reply_modes.get(admin_id)
-    
-    @classmethod
-    def clear_booking_reply_mode(cls, admin_id):
-        cls._reply_modes.pop(admin_id, None)
-    
-    @classmethod
-    def set_review_reply_mode(cls, admin_id, review_id):
-        cls._review_reply_modes[admin_id] = review_id
-    
-    @classmethod
-    def get_review_reply_mode(cls, admin_id):
-        return cls._review_reply_modes.get(admin_id)
-    
-    @classmethod
-    def clear_review_reply_mode(cls, admin_id):
-        cls._review_reply_modes.pop(admin_id, None)
-
-# Глобальные переменные
-user_data = {}
-review_data = {}
-
-# === ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ===
-def safe_int(value, default=0):
-    """Безопасное преобразование в int"""
-    try:
-        return int(value)
-    except (ValueError, TypeError):
-        return default
-
-def safe_send_message(chat_id, text, **kwargs):
-    """Безопасная отправка сообщения"""
-    try:
-        return bot.send_message(chat_id, text, **kwargs)
-    except Exception as e:
-        logger.error(f"Ошибка отправки сообщения {chat_id}: {e}")
-        return None
-
-def safe_delete_message(chat_id, message_id):
-    """Безопасное удаление сообщения"""
-    try:
-        bot.delete_message(chat_id, message_id)
-        return True
-    except Exception as e:
-        logger.warning(f"Не удалось удалить сообщение: {e}")
-        return False
-
-def validate_phone(phone):
-    """Валидация номера телефона"""
-    if not phone:
-        return None
-        
-    clean_phone = re.sub(r'\D', '', phone)
-    
-    if len(clean_phone) < 10 or len(clean_phone) > 15:
-        return None
-    
-    if clean_phone.startswith('8') and len(clean_phone) == 11:
-        clean_phone = '7' + clean_phone[1:]
-    
-    if len(clean_phone) == 11 and clean_phone.startswith('7'):
-        return f"+7 ({clean_phone[1:4]}) {clean_phone[4:7]}-{clean_phone[7:9]}-{clean_phone[9:11]}"
-    elif len(clean_phone) == 10:
-        return f"+7 ({clean_phone[0:3]}) {clean_phone[3:6]}-{clean_phone[6:8]}-{clean_phone[8:10]}"
-    
-    return None
-
-def validate_date(date_str):
-    """Валидация даты"""
-    if not date_str:
-        return None, "❌ Дата не указана"
-        
-    try:
-        date_obj = datetime.datetime.strptime(date_str, '%d.%m.%Y').date()
-        today = datetime.date.today()
-        
-        if date_obj < today:
-            return None, "❌ Нельзя забронировать стол на прошедшую дату"
-        
-        max_date = today + timedelta(days=90)
-        if date_obj > max_date:
-            return None, "❌ Бронирование доступно только на 3 месяца вперед"
-        
-        return date_obj, None
-    except ValueError:
-        return None, "❌ Неверный формат даты. Используйте ДД.ММ.ГГГГ"
-
-def validate_time(time_str, date_str):
-    """Валидация времени с учетом реального времени работы"""
-    if not time_str:
-        return None, "❌ Время не указано"
-        
-    try:
-        time_obj = datetime.datetime.strptime(time_str, '%H:%M').time()
-        date_obj = datetime.datetime.strptime(date_str, '%d.%m.%Y').date()
-        weekday = date_obj.weekday()
-        
-        # Определяем время работы для этого дня
-        if weekday in [4, 5]:  # Пятница (4), Суббота (5)
-            min_time = datetime.time(16, 0)
-            max_time = datetime.time(3, 0)  # До 03:00 следующего дня
-        else:  # Воскресенье-Четверг
-            min_time = datetime.time(16, 0)
-            max_time = datetime.time(2, 0)   # До 02:00 следующего дня
-        
-        # Проверка времени
-        # Для времени после полуночи (следующий день)
-        if time_obj < datetime.time(12, 0):  # Время между 00:00 и 12:00
-            if time_obj <= max_time:
-                return time_obj, None
-        else:  # Время между 12:00 и 24:00
-            if time_obj >= min_time:
-                return time_obj, None
-        
-        # Если время не подходит
-        hours_info = get_restaurant_hours(date_str)
-        return None, f"❌ Ресторан работает {hours_info}. Выберите время в этом интервале"
-        
-    except ValueError:
-        return None, "❌ Неверный формат времени. Используйте ЧЧ:MM"
-
-def validate_guests(guests_str):
-    """Валидация количества гостей"""
-    if not guests_str:
-        return None, "❌ Количество гостей не указано"
-        
-    try:
-        guests = int(guests_str)
-        if guests < 1:
-            return None, "❌ Количество гостей должно быть не менее 1"
-        if guests > 12:  # Исправлено с 20 на 12
-            return None, "❌ Максимальное количество гостей - 12"
-        return guests, None
-    except ValueError:
-        return None, "❌ Введите число от 1 до 12"
-
-def validate_name(name):
-    """Валидация имени"""
-    if not name:
-        return None, "❌ Имя не указано"
-        
-    name = name.strip()
-    if len(name) < 2:
-        return None, "❌ Имя должно содержать минимум 2 символа"
-    if len(name) > 50:
-        return None, "❌ Имя слишком длинное"
-    if not re.match(r'^[a-zA-Zа-яА-ЯёЁ\s\-]+$', name):
-        return None, "❌ Имя может содержать только буквы, пробелы и дефисы"
-    return name, None
-
-def get_restaurant_hours(date_str):
-    """Получение часов работы для указанной даты"""
-    try:
-        date_obj = datetime.datetime.strptime(date_str, '%d.%m.%Y').date()
-        weekday = date_obj.weekday()
-        if weekday in [4, 5]:  # Пятница (4), Суббота (5)
-            return "пт-сб 16:00-03:00"
-        else:
-            return "вс-чт 16:00-02:00"
-    except:
-        return "вс-чт 16:00-02:00, пт-сб 16:00-03:00"
-
-def is_booking_active(booking_date_str):
-    """Проверяет, является ли бронирование актуальным (не прошедшим)"""
-    try:
-        booking_date = datetime.datetime.strptime(booking_date_str, '%d.%m.%Y').date()
-        today = datetime.date.today()
-        return booking_date >= today
-    except:
-        return False
-
-def cleanup_user_data(user_id):
-    """Очистка данных пользователя"""
-    if user_id in user_data:
-        if 'booking_steps' in user_data[user_id]:
-            for msg_id in user_data[user_id]['booking_steps']:
-                safe_delete_message(user_id, msg_id)
-        del user_data[user_id]
-
-# === БАЗА ДАННЫХ ===
-def init_db():
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS bookings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            user_name TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            booking_date TEXT NOT NULL,
-            booking_time TEXT NOT NULL,
-            guests INTEGER NOT NULL,
-            comment TEXT DEFAULT '',
-            status TEXT DEFAULT 'pending',
-            admin_reply TEXT,
-            reminder_24h_sent INTEGER DEFAULT 0,
-            reminder_1h_sent INTEGER DEFAULT 0,
-            review_requested INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admin_stats (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            total_bookings INTEGER DEFAULT 0,
-            approved_bookings INTEGER DEFAULT 0,
-            rejected_bookings INTEGER DEFAULT 0,
-            total_reviews INTEGER DEFAULT 0,
-            average_rating REAL DEFAULT 0
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admin_replies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            booking_id INTEGER,
-            admin_id INTEGER,
-            reply_text TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reviews (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            user_name TEXT,
-            rating INTEGER,
-            review_text TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Инициализируем статистику если не существует
-    cursor.execute('INSERT OR IGNORE INTO admin_stats (id) VALUES (1)')
-    conn.commit()
-    conn.close()
-    logger.info("✅ База данных инициализирована")
-
-# === КЛАВИАТУРЫ ===
-def main_menu(user_id=None):
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(KeyboardButton('📅 Забронировать стол'))
-    keyboard.add(KeyboardButton('📞 Контакты'), KeyboardButton('⭐ Оставить отзыв'))
-    
-    # Кнопка "Панель администратора" только для админа
-    if user_id == ADMIN_ID:
-        keyboard.add(KeyboardButton('👑 Панель администратора'))
-    
-    return keyboard
-
-def admin_menu():
-    """Меню администратора"""
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(KeyboardButton('⏳ Ожидающие заявки'))
-    keyboard.add(KeyboardButton('✅ Актуальные бронирования'), KeyboardButton('❌ Отклоненные заявки'))
-    keyboard.add(KeyboardButton('💬 Отзывы на модерации'), KeyboardButton('📈 Общая статистика'))
-    keyboard.add(KeyboardButton('🔙 В главное меню'))
-    return keyboard
-
-def cancel_keyboard():
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(KeyboardButton('❌ Отмена бронирования'))
-    return keyboard
-
-def skip_comment_keyboard():
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(KeyboardButton('➡️ Пропустить комментарий'))
-    keyboard.add(KeyboardButton('❌ Отмена бронирования'))
-    return keyboard
-
-# === КАЛЕНДАРЬ И ВРЕМЯ ===
-def generate_calendar(year=None, month=None):
-    now = datetime.datetime.now()
-    if year is None:
-        year = now.year
-    if month is None:
-        month = now.month
-    
-    keyboard = InlineKeyboardMarkup()
-    
-    month_name = get_month_name(month)
-    row = []
-    row.append(InlineKeyboardButton("◀️", callback_data=f"calendar_prev_{year}_{month}"))
-    row.append(InlineKeyboardButton(f"{month_name} {year}", callback_data="ignore"))
-    row.append(InlineKeyboardButton("▶️", callback_data=f"calendar_next_{year}_{month}"))
-    keyboard.row(*row)
-    
-    days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-    keyboard.row(*[InlineKeyboardButton(day, callback_data="ignore") for day in days])
-    
-    month_days = get_month_days(year, month)
-    
-    for week in month_days:
-        row = []
-        for day in week:
-            if day == 0:
-                row.append(InlineKeyboardButton(" ", callback_data="ignore"))
-            else:
-                date_str = f"{day:02d}.{month:02d}.{year}"
-                date_obj = datetime.date(year, month, day)
-                
-                if date_obj < now.date():
-                    row.append(InlineKeyboardButton(f"❌", callback_data="ignore"))
-                else:
-                    day_str = f"{day}"
-                    if date_obj == now.date():
-                        day_str = f"📍{day}"
-                    row.append(InlineKeyboardButton(day_str, callback_data=f"calendar_day_{date_str}"))
-        keyboard.row(*row)
-    
-    keyboard.row(InlineKeyboardButton("❌ Отмена", callback_data="calendar_cancel"))
-    return keyboard
-
-def get_month_name(month):
-    months = [
-        "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
-        "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
-    ]
-    return months[month - 1]
-
-def get_month_days(year, month):
-    first_day = datetime.date(year, month, 1)
-    last_day = datetime.date(year, month + 1, 1) - timedelta(days=1) if month < 12 else datetime.date(year + 1, 1, 1) - timedelta(days=1)
-    
-    first_weekday = (first_day.weekday()) % 7
-    days = []
-    current_day = 1
-    
-    for week in range(6):
-        week_days = []
-        for day in range(7):
-            if (week == 0 and day < first_weekday) or current_day > last_day.day:
-                week_days.append(0)
-            else:
-                week_days.append(current_day)
-                current_day += 1
-        days.append(week_days)
-        if current_day > last_day.day:
-            break
-    return days
-
-def generate_time_buttons(date_str):
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, row_width=4)
-    
-    times = []
-    # Генерация времени с учетом работы лаунджа
-    for hour in range(16, 24):  # С 16:00 до 23:30
-        for minute in ['00', '30']:
-            times.append(f"{hour:02d}:{minute}")
-    
-    # Добавляем время после полуночи для пятницы и субботы
-    try:
-        date_obj = datetime.datetime.strptime(date_str, '%d.%m.%Y').date()
-        weekday = date_obj.weekday()
-        if weekday in [4, 5]:  # Пятница, Суббота
-            for hour in [0, 1, 2]:  # 00:00, 01:00, 02:00
-                for minute in ['00', '30']:
-                    if hour == 2 and minute == '30':  # До 02:30 в пт-сб
-                        continue
-                    times.append(f"{hour:02d}:{minute}")
-    except:
-        pass
-    
-    for i in range(0, len(times), 4):
-        row = [KeyboardButton(time) for time in times[i:i+4]]
-        keyboard.add(*row)
-    
-    keyboard.add(KeyboardButton('🔙 Назад к календарю'))
-    keyboard.add(KeyboardButton('❌ Отмена бронирования'))
-    return keyboard
-
-# === СИСТЕМА БРОНИРОВАНИЯ ===
-@bot.message_handler(func=lambda message: message.text == '📅 Забронировать стол')
-def start_booking(message):
-    user_id = message.from_user.id
-    
-    # Администратор не может бронировать
-    if user_id == ADMIN_ID:
-        safe_send_message(
-            message.chat.id, 
-            "⛔ *Администратор не может бронировать столы через бота*\n\n"
-            "Для тестирования функционала используйте тестовый аккаунт.",
-            reply_markup=main_menu(message.from_user.id),
-            parse_mode='Markdown'
-        )
-        return
-    
-    cleanup_user_data(user_id)
-    
-    user_data[user_id] = {
-        'state': BookingState.DATE,
-        'booking_steps': [],
-        'last_activity': time_module.time()
-    }
-    
-    calendar = generate_calendar()
-    msg = safe_send_message(
-        message.chat.id,
-        "🍝 *Начнем бронирование столика!*\n\n"
-        "📅 **Шаг 1 из 6:** Выберите дату посещения\n"
-        "• Используйте стрелки для навигации\n• 📍 Сегодняшний день\n• ❌ Недоступные даты",
-        reply_markup=calendar,
-        parse_mode='Markdown'
-    )
-    
-    if msg:
-        user_data[user_id]['booking_steps'].append(msg.message_id)
-
-@bot.callback_query_handler(func=lambda call: call.data and call.data.startswith('calendar_'))
-def handle_calendar_callback(call):
-    """Обработка callback календаря"""
-    try:
-        if call.from_user.id == ADMIN_ID:
-            bot.answer_callback_query(call.id, "⛔ Администратор не может бронировать столы")
-            return
-        
-        data = call.data
-        
-        if data == 'calendar_cancel':
-            safe_delete_message(call.message.chat.id, call.message.message_id)
-            safe_send_message(call.message.chat.id, "❌ Выбор даты отменен", reply_markup=main_menu(call.from_user.id))
-            return
-        
-        elif data.startswith('calendar_prev_'):
-            _, _, year, month = data.split('_')
-            year, month = int(year), int(month)
-            if month == 1:
-                year -= 1
-                month = 12
-            else:
-                month -= 1
-            new_calendar = generate_calendar(year, month)
-            bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=new_calendar)
-        
-        elif data.startswith('calendar_next_'):
-            _, _, year, month = data.split('_')
-            year, month = int(year), int(month)
-            if month == 12:
-                year += 1
-                month = 1
-            else:
-                month += 1
-            new_calendar = generate_calendar(year, month)
-            bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=new_calendar)
-        
-        elif data.startswith('calendar_day_'):
-            user_id = call.from_user.id
-            
-            if user_id not in user_data:
-                bot.answer_callback_query(call.id, "❌ Сессия бронирования устарела. Начните заново.")
-                return
-            
-            date_str = call.data.replace('calendar_day_', '')
-            
-            date_obj, error = validate_date(date_str)
-            if error:
-                bot.answer_callback_query(call.id, error)
-                return
-            
-            user_data[user_id]['date'] = date_str
-            user_data[user_id]['state'] = BookingState.TIME
-            user_data[user_id]['last_activity'] = time_module.time()
-            
-            safe_delete_message(call.message.chat.id, call.message.message_id)
-            
-            hours_info = get_restaurant_hours(date_str)
-            time_keyboard = generate_time_buttons(date_str)
-            
-            msg = safe_send_message(
-                call.message.chat.id,
-                f"✅ **Дата:** {date_str}\n🕒 **Часы работы:** {hours_info}\n\n"
-                "🕐 **Шаг 2 из 6:** Выберите время бронирования:",
-                reply_markup=time_keyboard,
-                parse_mode='Markdown'
-            )
-            
-            if msg:
-                user_data[user_id]['booking_steps'].append(msg.message_id)
-            bot.answer_callback_query(call.id, f"✅ Дата {date_str} выбрана")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка в handle_calendar_callback: {e}")
-        bot.answer_callback_query(call.id, "❌ Произошла ошибка")
-
-@bot.message_handler(func=lambda message: 
-                     message.from_user.id in user_data and 
-                     user_data[message.from_user.id]['state'] == BookingState.TIME and
-                     ':' in message.text)
-def handle_time_selection(message):
-    user_id = message.from_user.id
-    time_str = message.text.strip()
-    
-    time_obj, error = validate_time(time_str, user_data[user_id]['date'])
-    if error:
-        msg = safe_send_message(message.chat.id, error)
-        if msg and user_id in user_data:
-            user_data[user_id]['booking_steps'].append(msg.message_id)
-        return
-    
-    user_data[user_id]['time'] = time_str
-    user_data[user_id]['state'] = BookingState.GUESTS
-    user_data[user_id]['last_activity'] = time_module.time()
-    
-    msg = safe_send_message(
-        message.chat.id,
-        f"✅ **Время:** {time_str}\n\n"
-        "👥 **Шаг 3 из 6:** Введите количество гостей (от 1 до 12):",
-        reply_markup=cancel_keyboard(),
-        parse_mode='Markdown'
-    )
-    
-    if msg and user_id in user_data:
-        user_data[user_id]['booking_steps'].append(msg.message_id)
-
-@bot.message_handler(func=lambda message: 
-                     message.from_user.id in user_data and 
-                     user_data[message.from_user.id]['state'] == BookingState.GUESTS)
-def handle_guests_selection(message):
-    user_id = message.from_user.id
-    guests_str = message.text.strip()
-    
-    guests, error = validate_guests(guests_str)
-    if error:
-        msg = safe_send_message(message.chat.id, error)
-        if msg and user_id in user_data:
-            user_data[user_id]['booking_steps'].append(msg.message_id)
-        return
-    
-    user_data[user_id]['guests'] = guests
-    user_data[user_id]['state'] = BookingState.NAME
-    user_data[user_id]['last_activity'] = time_module.time()
-    
-    msg = safe_send_message(
-        message.chat.id,
-        f"✅ **Гости:** {guests} человек\n\n"
-        "👤 **Шаг 4 из 6:** Введите ваше имя:",
-        reply_markup=cancel_keyboard(),
-        parse_mode='Markdown'
-    )
-    
-    if msg and user_id in user_data:
-        user_data[user_id]['booking_steps'].append(msg.message_id)
-
-@bot.message_handler(func=lambda message: 
-                     message.from_user.id in user_data and 
-                     user_data[message.from_user.id]['state'] == BookingState.NAME)
-def handle_name_selection(message):
-    user_id = message.from_user.id
-    name = message.text.strip()
-    
-    validated_name, error = validate_name(name)
-    if error:
-        msg = safe_send_message(message.chat.id, error)
-        if msg and user_id in user_data:
-            user_data[user_id]['booking_steps'].append(msg.message_id)
-        return
-    
-    user_data[user_id]['name'] = validated_name
-    user_data[user_id]['state'] = BookingState.PHONE
-    user_data[user_id]['last_activity'] = time_module.time()
-    
-    msg = safe_send_message(
-        message.chat.id,
-        f"✅ **Имя:** {validated_name}\n\n"
-        "📞 **Шаг 5 из 6:** Введите ваш номер телефона:\n"
-        "• В любом формате\n• Пример: 89123456789 или +7 (912) 345-67-89",
-        reply_markup=cancel_keyboard(),
-        parse_mode='Markdown'
-    )
-    
-    if msg and user_id in user_data:
-        user_data[user_id]['booking_steps'].append(msg.message_id)
-
-@bot.message_handler(func=lambda message: 
-                     message.from_user.id in user_data and 
-                     user_data[message.from_user.id]['state'] == BookingState.PHONE)
-def handle_phone_selection(message):
-    user_id = message.from_user.id
-    phone = message.text.strip()
-    
-    formatted_phone = validate_phone(phone)
-    if not formatted_phone:
-        msg = safe_send_message(
-            message.chat.id,
-            "❌ Неверный формат номера телефона.\n"
-            "Пожалуйста, введите корректный номер:\n"
-            "• 89123456789\n• +7 (912) 345-67-89\n• 8-912-345-67-89",
-            reply_markup=cancel_keyboard()
-        )
-        if msg and user_id in user_data:
-            user_data[user_id]['booking_steps'].append(msg.message_id)
-        return
-    
-    user_data[user_id]['phone'] = formatted_phone
-    user_data[user_id]['state'] = BookingState.COMMENT
-    user_data[user_id]['last_activity'] = time_module.time()
-    
-    msg = safe_send_message(
-        message.chat.id,
-        f"✅ **Телефон:** {formatted_phone}\n\n"
-        "💬 **Шаг 6 из 6:** Добавьте комментарий к бронированию (по желанию):\n"
-        "• Например: 'Столик у окна', 'День рождения', 'С приставкой'\n"
-        "• Или пропустите этот шаг",
-        reply_markup=skip_comment_keyboard(),
-        parse_mode='Markdown'
-    )
-    
-    if msg and user_id in user_data:
-        user_data[user_id]['booking_steps'].append(msg.message_id)
-
-@bot.message_handler(func=lambda message: 
-                     message.from_user.id in user_data and 
-                     user_data[message.from_user.id]['state'] == BookingState.COMMENT)
-def handle_comment_or_complete(message):
-    user_id = message.from_user.id
-    
-    if message.text == '➡️ Пропустить комментарий':
-        user_data[user_id]['comment'] = ""
-        complete_booking(message.chat.id, user_id)
-    else:
-        user_data[user_id]['comment'] = message.text
-        complete_booking(message.chat.id, user_id)
-
-def complete_booking(chat_id, user_id):
-    if user_id not in user_data:
-        safe_send_message(chat_id, "❌ Сессия бронирования устарела. Начните заново.", reply_markup=main_menu(user_id))
-        return
-        
-    required_fields = ['name', 'phone', 'date', 'time', 'guests']
-    missing_fields = []
-    
-    for field in required_fields:
-        if field not in user_data[user_id]:
-            missing_fields.append(field)
-    
-    if missing_fields:
-        logger.error(f"Отсутствуют поля: {missing_fields} для пользователя {user_id}")
-        safe_send_message(chat_id, "❌ Ошибка данных бронирования. Начните заново.", reply_markup=main_menu(user_id))
-        cleanup_user_data(user_id)
-        return
-    
-    if 'comment' not in user_data[user_id]:
-        user_data[user_id]['comment'] = ""
-    
-    try:
-        booking_id = save_booking_to_db(user_id, user_data[user_id])
-        send_booking_confirmation(chat_id, user_data[user_id], booking_id)
-        send_booking_to_admin(user_data[user_id], user_id, booking_id)
-        cleanup_user_data(user_id)
-        
-        logger.info(f"✅ Бронирование успешно создано #{booking_id} для пользователя {user_id}")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка при сохранении брони: {e}")
-        safe_send_message(chat_id, "❌ Произошла ошибка при сохранении брони. Попробуйте позже.", reply_markup=main_menu(user_id))
-        cleanup_user_data(user_id)
-
-def save_booking_to_db(user_id, data):
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO bookings (user_id, user_name, phone, booking_date, booking_time, guests, comment, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')
-    ''', (
-        user_id, 
-        data['name'], 
-        data['phone'], 
-        data['date'], 
-        data['time'], 
-        data['guests'], 
-        data.get('comment', '')
-    ))
-    
-    booking_id = cursor.lastrowid
-    cursor.execute('UPDATE admin_stats SET total_bookings = total_bookings + 1')
-    conn.commit()
-    conn.close()
-    
-    return booking_id
-
-def send_booking_confirmation(chat_id, booking_data, booking_id):
-    confirmation_text = f"""
-✅ *Заявка на бронирование отправлена!*
-
-📋 *Детали бронирования:*
-• 👤 **Имя:** {booking_data['name']}
-• 📞 **Телефон:** {booking_data['phone']}
-• 📅 **Дата:** {booking_data['date']}
-• ⏰ **Время:** {booking_data['time']}
-• 👥 **Гости:** {booking_data['guests']} человек
-{f"• 💬 **Комментарий:** {booking_data['comment']}" if booking_data['comment'] else ""}
-
-🏢 *Лаундж-бар:* {RESTAURANT_INFO['name']}
-📍 *Адрес:* {RESTAURANT_INFO['address']}
-{RESTAURANT_INFO['entertainment']}
-
-*Ожидайте подтверждения от администратора!* 📞
-    """
-    
-    safe_send_message(chat_id, confirmation_text, reply_markup=main_menu(chat_id), parse_mode='Markdown')
-
-def send_booking_to_admin(booking_data, user_id, booking_id):
-    comment_text = f"\n💬 *Комментарий гостя:* {booking_data['comment']}" if booking_data.get('comment') else "\n💬 *Комментарий:* Нет комментария"
-    
-    booking_text = f"""
-📋 *НОВАЯ ЗАЯВКА НА БРОНИРОВАНИЕ* #{booking_id}
-
-👤 *Имя:* {booking_data['name']}
-📞 *Телефон:* {booking_data['phone']}
-📅 *Дата:* {booking_data['date']}
-⏰ *Время:* {booking_data['time']}
-👥 *Гости:* {booking_data['guests']} чел.
-🆔 *ID пользователя:* {user_id}
-{comment_text}
-
-🏢 *Лаундж-бар:* {RESTAURANT_INFO['name']}
-📍 *Адрес:* {RESTAURANT_INFO['address']}
-    """
-    
-    keyboard = InlineKeyboardMarkup()
-    keyboard.row(
-        InlineKeyboardButton("✅ Одобрить", callback_data=f"admin_approve_{booking_id}"),
-        InlineKeyboardButton("❌ Отклонить", callback_data=f"admin_reject_{booking_id}")
-    )
-    keyboard.row(InlineKeyboardButton("💬 Ответить гостю", callback_data=f"admin_reply_{booking_id}"))
-    
-    safe_send_message(ADMIN_ID, booking_text, reply_markup=keyboard, parse_mode='Markdown')
-
-# === ИСПРАВЛЕННЫЙ ОБРАБОТЧИК ОТМЕНЫ БРОНИРОВАНИЯ ===
-@bot.message_handler(func=lambda message: message.text == '❌ Отмена бронирования')
-def cancel_booking(message):
-    user_id = message.from_user.id
-    if user_id in user_data:
-        cleanup_user_data(user_id)
-        safe_send_message(message.chat.id, "❌ Бронирование отменено", reply_markup=main_menu(user_id))
-    else:
-        safe_send_message(message.chat.id, "❌ Активное бронирование не найдено", reply_markup=main_menu(user_id))
-
-# === ОБРАБОТКА CALLBACK-ЗАПРОСОВ ===
-@bot.callback_query_handler(func=lambda call: True)
-def handle_all_callbacks(call):
-    """Глобальный обработчик callback-запросов с защитой от ошибок"""
-    try:
-        if not call.data:
-            bot.answer_callback_query(call.id, "❌ Ошибка данных")
-            return
-            
-        if call.data == 'ignore':
-            bot.answer_callback_query(call.id)
-            return
-            
-        # Обработка действий администратора
-        elif call.data.startswith('admin_'):
-            handle_admin_actions(call)
-        # Обработка подтверждения визита
-        elif call.data.startswith('confirm_visit_'):
-            handle_visit_confirmation(call)
-        # Обработка отмены визита
-        elif call.data.startswith('cancel_visit_'):
-            handle_visit_cancellation(call)
-        # Обработка отзывов
-        elif call.data.startswith('review_direct_'):
-            handle_review_rating(call)
-        # Обработка модерации отзывов
-        elif call.data.startswith(('publish_review_', 'reject_review_', 'admin_reply_review_')):
-            handle_review_moderation(call)
-        else:
-            bot.answer_callback_query(call.id, "❌ Неизвестная команда")
-            
-    except Exception as e:
-        logger.error(f"❌ Ошибка в обработчике callback: {e}")
-        try:
-            bot.answer_callback_query(call.id, "❌ Произошла ошибка")
-        except:
-            pass
-
-# === АДМИН-ПАНЕЛЬ ===
-@bot.message_handler(func=lambda message: message.text == '👑 Панель администратора')
-def admin_panel(message):
-    if message.from_user.id == ADMIN_ID:
-        safe_send_message(message.chat.id, "👑 *Панель администратора*", reply_markup=admin_menu(), parse_mode='Markdown')
-    else:
-        safe_send_message(message.chat.id, "⛔ Доступ запрещен", reply_markup=main_menu(message.from_user.id))
-
-@bot.message_handler(func=lambda message: message.text == '🔙 В главное меню')
-def back_to_main(message):
-    safe_send_message(message.chat.id, "Главное меню", reply_markup=main_menu(message.from_user.id))
-
-@bot.message_handler(func=lambda message: message.text == '⏳ Ожидающие заявки' and message.from_user.id == ADMIN_ID)
-def show_pending_bookings(message):
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM bookings WHERE status = "pending" ORDER BY booking_date, booking_time')
-    pending_bookings = cursor.fetchall()
-    conn.close()
-    
-    if not pending_bookings:
-        safe_send_message(message.chat.id, "✅ Нет ожидающих заявок")
-        return
-    
-    for booking in pending_bookings:
-        booking_id, user_id, user_name, phone, date, time, guests, comment, status, admin_reply, _, _, _, created_at = booking
-        
-        comment_text = f"\n💬 *Комментарий:* {comment}" if comment else ""
-        admin_reply_text = f"\n👑 *Ответ администратора:* {admin_reply}" if admin_reply else ""
-        
-        booking_text = f"""
-⏳ *Ожидает решения* #{booking_id}
-
-👤 *Имя:* {user_name}
-📞 *Телефон:* {phone}
-📅 *Дата:* {date}
-⏰ *Время:* {time}
-👥 *Гости:* {guests} чел.
-🆔 *ID:* {user_id}
-{comment_text}
-{admin_reply_text}
-        """
-        
-        keyboard = InlineKeyboardMarkup()
-        keyboard.row(
-            InlineKeyboardButton("✅ Одобрить", callback_data=f"admin_approve_{booking_id}"),
-            InlineKeyboardButton("❌ Отклонить", callback_data=f"admin_reject_{booking_id}")
-        )
-        keyboard.row(InlineKeyboardButton("💬 Ответить", callback_data=f"admin_reply_{booking_id}"))
-        
-        safe_send_message(message.chat.id, booking_text, reply_markup=keyboard, parse_mode='Markdown')
-
-@bot.message_handler(func=lambda message: message.text == '✅ Актуальные бронирования' and message.from_user.id == ADMIN_ID)
-def show_approved_bookings(message):
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    # Получаем только актуальные бронирования (не прошедшие даты)
-    today = datetime.date.today().strftime('%d.%m.%Y')
-    
-    cursor.execute('''
-        SELECT * FROM bookings 
-        WHERE status = "approved" 
-        AND booking_date >= ?
-        ORDER BY booking_date, booking_time 
-        LIMIT 20
-    ''', (today,))
-    
-    approved_bookings = cursor.fetchall()
-    conn.close()
-    
-    if not approved_bookings:
-        safe_send_message(message.chat.id, "📭 Нет актуальных бронирований")
-        return
-    
-    safe_send_message(message.chat.id, f"✅ *Актуальные бронирования (ближайшие 20):*", parse_mode='Markdown')
-    
-    for booking in approved_bookings:
-        booking_id, user_id, user_name, phone, date, time, guests, comment, status, admin_reply, _, _, _, created_at = booking
-        
-        # Проверяем актуальность брони
-        is_active = is_booking_active(date)
-        status_icon = "🟢" if is_active else "🔴"
-        
-        comment_text = f"\n💬 *Комментарий:* {comment}" if comment else ""
-        admin_reply_text = f"\n👑 *Ответ:* {admin_reply}" if admin_reply else ""
-        
-        booking_text = f"""
-{status_icon} *Актуальное бронирование* #{booking_id}
-
-👤 *Имя:* {user_name}
-📞 *Телефон:* {phone}
-📅 *Дата:* {date}
-⏰ *Время:* {time}
-👥 *Гости:* {guests} чел.
-{comment_text}
-{admin_reply_text}
-        """
-        safe_send_message(message.chat.id, booking_text, parse_mode='Markdown')
-
-@bot.message_handler(func=lambda message: message.text == '❌ Отклоненные заявки' and message.from_user.id == ADMIN_ID)
-def show_rejected_bookings(message):
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM bookings WHERE status = "rejected" ORDER BY created_at DESC LIMIT 10')
-    rejected_bookings = cursor.fetchall()
-    conn.close()
-    
-    if not rejected_bookings:
-        safe_send_message(message.chat.id, "📭 Нет отклоненных заявок")
-        return
-    
-    safe_send_message(message.chat.id, f"❌ *Последние 10 отклоненных заявок:*", parse_mode='Markdown')
-    
-    for booking in rejected_bookings:
-        booking_id, user_id, user_name, phone, date, time, guests, comment, status, admin_reply, _, _, _, created_at = booking
-        
-        comment_text = f"\n💬 *Комментарий:* {comment}" if comment else ""
-        admin_reply_text = f"\n👑 *Ответ:* {admin_reply}" if admin_reply else ""
-        
-        booking_text = f"""
-❌ *Отклонено* #{booking_id}
-
-👤 *Имя:* {user_name}
-📞 *Телефон:* {phone}
-📅 *Дата:* {date}
-⏰ *Время:* {time}
-👥 *Гости:* {guests} чел.
-{comment_text}
-{admin_reply_text}
-        """
-        safe_send_message(message.chat.id, booking_text, parse_mode='Markdown')
-
-@bot.message_handler(func=lambda message: message.text == '📈 Общая статистика' and message.from_user.id == ADMIN_ID)
-def show_stats(message):
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT total_bookings, approved_bookings, rejected_bookings, total_reviews, average_rating FROM admin_stats')
-    stats = cursor.fetchone()
-    
-    cursor.execute('SELECT COUNT(*) FROM bookings WHERE status = "pending"')
-    pending_count = cursor.fetchone()[0]
-    
-    # Актуальные бронирования
-    today = datetime.date.today().strftime('%d.%m.%Y')
-    cursor.execute('SELECT COUNT(*) FROM bookings WHERE status = "approved" AND booking_date >= ?', (today,))
-    active_bookings = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT booking_date, COUNT(*) FROM bookings WHERE status = "approved" AND booking_date >= ? GROUP BY booking_date ORDER BY booking_date DESC LIMIT 7', (today,))
-    last_week = cursor.fetchall()
-    
-    cursor.execute('SELECT booking_time, COUNT(*) FROM bookings WHERE status = "approved" GROUP BY booking_time ORDER BY COUNT(*) DESC LIMIT 5')
-    popular_times = cursor.fetchall()
-    
-    conn.close()
-    
-    stats_text = f"""
-📈 *Общая статистика лаундж-бара*
-
-📊 *Бронирования:*
-• Всего заявок: {stats[0]}
-• Ожидают решения: {pending_count}
-• Актуальные брони: {active_bookings}
-• Одобрено всего: {stats[1]}
-• Отклонено: {stats[2]}
-• Процент одобрения: {(stats[1]/stats[0]*100) if stats[0] > 0 else 0:.1f}%
-
-⭐ *Отзывы:*
-• Всего отзывов: {stats[3]}
-• Средний рейтинг: {stats[4]:.1f}/5
-
-📅 *Ближайшие 7 дней:*
-"""
-    
-    for date, count in last_week:
-        stats_text += f"• {date}: {count} броней\n"
-    
-    stats_text += "\n⏰ *Популярное время:*\n"
-    for time, count in popular_times:
-        stats_text += f"• {time}: {count} броней\n"
-    
-    safe_send_message(message.chat.id, stats_text, parse_mode='Markdown')
-
-def handle_admin_actions(call):
-    """Обработка действий администратора"""
-    if call.from_user.id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "⛔ Доступ запрещен")
-        return
-        
-    data_parts = call.data.split('_')
-    if len(data_parts) < 3:
-        bot.answer_callback_query(call.id, "❌ Ошибка данных")
-        return
-        
-    action = data_parts[1]
-    booking_id = safe_int(data_parts[2])
-    
-    if not booking_id:
-        bot.answer_callback_query(call.id, "❌ Неверный ID брони")
-        return
-    
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    if action == 'approve':
-        cursor.execute('UPDATE bookings SET status = "approved" WHERE id = ?', (booking_id,))
-        cursor.execute('UPDATE admin_stats SET approved_bookings = approved_bookings + 1')
-        
-        cursor.execute('SELECT user_id, user_name, booking_date, booking_time, guests, comment FROM bookings WHERE id = ?', (booking_id,))
-        booking = cursor.fetchone()
-        
-        if booking:
-            user_message = f"""
-✅ *Ваше бронирование подтверждено!*
-
-📋 *Детали:*
-• 👤 Имя: {booking[1]}
-• 📅 Дата: {booking[2]}
-• ⏰ Время: {booking[3]}
-• 👥 Гости: {booking[4]} чел.
-{f"• 💬 Ваш комментарий: {booking[5]}" if booking[5] else ""}
-
-🏢 *Лаундж-бар:* {RESTAURANT_INFO['name']}
-📍 *Адрес:* {RESTAURANT_INFO['address']}
-📞 *Телефон:* {RESTAURANT_INFO['phone']}
-{RESTAURANT_INFO['entertainment']}
-
-*Ждем вас в гости!* 🍝
-            """
-            
-            try:
-                safe_send_message(booking[0], user_message, parse_mode='Markdown')
-            except Exception as e:
-                logger.error(f"❌ Ошибка отправки уведомления пользователю: {e}")
-        
-        bot.answer_callback_query(call.id, "✅ Бронирование одобрено")
-        
-    elif action == 'reject':
-        cursor.execute('UPDATE bookings SET status = "rejected" WHERE id = ?', (booking_id,))
-        cursor.execute('UPDATE admin_stats SET rejected_bookings = rejected_bookings + 1')
-        
-        cursor.execute('SELECT user_id, user_name, booking_date, booking_time FROM bookings WHERE id = ?', (booking_id,))
-        booking = cursor.fetchone()
-        
-        if booking:
-            user_message = f"""
-❌ *К сожалению, ваше бронирование отклонено.*
-
-📅 *Дата:* {booking[2]}
-⏰ *Время:* {booking[3]}
-
-*Пожалуйста, выберите другое время или свяжитесь с нами:*
-📞 {RESTAURANT_INFO['phone']}
-            """
-            
-            try:
-                safe_send_message(booking[0], user_message, parse_mode='Markdown')
-            except Exception as e:
-                logger.error(f"❌ Ошибка отправки уведомления пользователю: {e}")
-        
-        bot.answer_callback_query(call.id, "❌ Бронирование отклонено")
-    
-    elif action == 'reply':
-        cursor.execute('SELECT user_id, user_name, comment FROM bookings WHERE id = ?', (booking_id,))
-        booking = cursor.fetchone()
-        
-        if booking:
-            AdminStates.set_booking_reply_mode(call.from_user.id, booking_id)
-            
-            reply_text = f"""
-💬 *Ответ на комментарий гостя*
-
-👤 *Гость:* {booking[1]}
-💭 *Комментарий:* {booking[2] if booking[2] else "Нет комментария"}
-
-*Введите ваш ответ для гостю:*
-            """
-            
-            safe_send_message(call.from_user.id, reply_text, parse_mode='Markdown')
-            bot.answer_callback_query(call.id, "💬 Введите ответ для гостя")
-        else:
-            bot.answer_callback_query(call.id, "❌ Бронь не найдена")
-    
-    conn.commit()
-    conn.close()
-    
-    # Удаляем кнопки только для approve/reject
-    if action in ['approve', 'reject']:
-        try:
-            bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        except Exception as e:
-            logger.warning(f"Не удалось обновить клавиатуру: {e}")
-
-# === ОБРАБОТКА ОТВЕТОВ АДМИНИСТРАТОРА ===
-@bot.message_handler(func=lambda message: message.from_user.id == ADMIN_ID and 
-                     AdminStates.get_booking_reply_mode(message.from_user.id) is not None and
-                     not message.text.startswith('/'))
-def handle_admin_reply(message):
-    booking_id = AdminStates.get_booking_reply_mode(message.from_user.id)
-    if not booking_id:
-        return
-        
-    reply_text = message.text
-    
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('UPDATE bookings SET admin_reply = ? WHERE id = ?', (reply_text, booking_id))
-    cursor.execute('INSERT INTO admin_replies (booking_id, admin_id, reply_text) VALUES (?, ?, ?)', 
-                  (booking_id, message.from_user.id, reply_text))
-    
-    cursor.execute('SELECT user_id, user_name, booking_date, booking_time, guests, comment FROM bookings WHERE id = ?', (booking_id,))
-    booking = cursor.fetchone()
-    
-    conn.commit()
-    conn.close()
-    
-    # Отправляем ответ гостю
-    if booking:
-        user_message = f"""
-👑 *Ответ от администратора лаундж-бара:*
-
-💬 *{reply_text}*
-
-*По вопросам бронирования:*
-📞 {RESTAURANT_INFO['phone']}
-        """
-        
-        try:
-            safe_send_message(booking[0], user_message, parse_mode='Markdown')
-            user_notified = True
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки ответа гостю: {e}")
-            user_notified = False
-        
-        # Уведомление о результате
-        if user_notified:
-            safe_send_message(message.from_user.id, "✅ Ответ успешно отправлен гостю!")
-        else:
-            safe_send_message(message.from_user.id, "❌ Не удалось отправить ответ гостю (возможно, заблокировал бота)")
-    
-    # Очищаем режим ответа
-    AdminStates.clear_booking_reply_mode(message.from_user.id)
-
-# === СИСТЕМА УВЕДОМЛЕНИЙ ===
-def check_reminders():
-    """Проверка и отправка уведомлений"""
-    while True:
-        try:
-            conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-            cursor = conn.cursor()
-            
-            now = datetime.datetime.now()
-            current_time = now.strftime('%H:%M')
-            current_date = now.strftime('%d.%m.%Y')
-            
-            # УВЕДОМЛЕНИЯ ЗА 24 ЧАСА
-            tomorrow = (now + timedelta(days=1)).strftime('%d.%m.%Y')
-            
-            cursor.execute('''
-                SELECT id, user_id, user_name, booking_date, booking_time, guests, comment 
-                FROM bookings 
-                WHERE status = "approved" 
-                AND booking_date = ?
-                AND reminder_24h_sent = 0
-            ''', (tomorrow,))
-            
-            bookings_24h = cursor.fetchall()
-            
-            for booking in bookings_24h:
-                booking_id, user_id, user_name, date, time, guests, comment = booking
-                
-                reminder_text = f"""
-🔔 *Напоминание о бронировании*
-
-Уважаемый(ая) {user_name}! 
-Напоминаем, что завтра *{date} в {time}* 
-у вас бронь в *{RESTAURANT_INFO['name']}* на *{guests}* персон.
-
-{f"💬 *Ваш комментарий:* {comment}" if comment else ""}
-
-📍 *Адрес:* {RESTAURANT_INFO['address']}
-📞 *Телефон:* {RESTAURANT_INFO['phone']}
-{RESTAURANT_INFO['entertainment']}
-
-*Подтвердите, пожалуйста, вашу явку:* 👇
-                """
-                
-                keyboard = InlineKeyboardMarkup()
-                keyboard.row(
-                    InlineKeyboardButton("✅ Подтверждаю", callback_data=f"confirm_visit_{booking_id}"),
-                    InlineKeyboardButton("❌ Отменить визит", callback_data=f"cancel_visit_{booking_id}")
-                )
-                
-                try:
-                    safe_send_message(user_id, reminder_text, reply_markup=keyboard, parse_mode='Markdown')
-                    cursor.execute('UPDATE bookings SET reminder_24h_sent = 1 WHERE id = ?', (booking_id,))
-                    logger.info(f"✅ Отправлено уведомление за 24 часа для брони #{booking_id}")
-                except Exception as e:
-                    logger.error(f"❌ Ошибка отправки уведомления за 24 часа: {e}")
-            
-            # УВЕДОМЛЕНИЯ ЗА 1 ЧАС
-            cursor.execute('''
-                SELECT id, user_id, user_name, booking_time, guests, comment 
-                FROM bookings 
-                WHERE status = "approved" 
-                AND booking_date = ?
-                AND reminder_1h_sent = 0
-            ''', (current_date,))
-            
-            bookings_today = cursor.fetchall()
-            
-            for booking in bookings_today:
-                booking_id, user_id, user_name, booking_time_str, guests, comment = booking
-                
-                booking_time_obj = datetime.datetime.strptime(booking_time_str, '%H:%M').time()
-                current_time_obj = datetime.datetime.strptime(current_time, '%H:%M').time()
-                
-                booking_datetime = datetime.datetime.combine(now.date(), booking_time_obj)
-                current_datetime = datetime.datetime.combine(now.date(), current_time_obj)
-                time_diff = (booking_datetime - current_datetime).total_seconds() / 3600
-                
-                if 0.9 <= time_diff <= 1.1:
-                    reminder_text = f"""
-⏰ *Скоро встретимся!*
-
-Уважаемый(ая) {user_name}!
-Через 1 час в *{booking_time_str}* ждем вас в *{RESTAURANT_INFO['name']}*!
-
-*Напоминаем:*
-👥 *Гости:* {guests} персон
-{f"💬 *Ваш комментарий:* {comment}" if comment else ""}
-📍 *Адрес:* {RESTAURANT_INFO['address']}
-📞 *Телефон:* {RESTAURANT_INFO['phone']}
-{RESTAURANT_INFO['entertainment']}
-
-*Ждем с нетерпением!* 🍝
-                    """
-                    
-                    try:
-                        safe_send_message(user_id, reminder_text, parse_mode='Markdown')
-                        cursor.execute('UPDATE bookings SET reminder_1h_sent = 1 WHERE id = ?', (booking_id,))
-                        logger.info(f"✅ Отправлено уведомление за 1 час для брони #{booking_id}")
-                    except Exception as e:
-                        logger.error(f"❌ Ошибка отправки уведомления за 1 час: {e}")
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка в системе уведомлений: {e}")
-        
-        time_module.sleep(60)  # Проверка каждую минуту
-
-def handle_visit_confirmation(call):
-    booking_id = safe_int(call.data.replace('confirm_visit_', ''))
-    if not booking_id:
-        bot.answer_callback_query(call.id, "❌ Неверный ID брони")
-        return
-    
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT user_name, booking_date, booking_time FROM bookings WHERE id = ?', (booking_id,))
-    booking = cursor.fetchone()
-    conn.close()
-    
-    if booking:
-        user_name, date, time = booking
-        
-        admin_notification = f"""
-✅ *Гость подтвердил визит*
-
-👤 *Гость:* {user_name}
-📅 *Дата:* {date}
-⏰ *Время:* {time}
-
-*Бронь #*{booking_id}
-        """
-        
-        try:
-            safe_send_message(ADMIN_ID, admin_notification, parse_mode='Markdown')
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки уведомления администратору: {e}")
-        
-        bot.answer_callback_query(call.id, "✅ Спасибо за подтверждение! Ждем вас!")
-    else:
-        bot.answer_callback_query(call.id, "❌ Бронь не найдена")
-
-def handle_visit_cancellation(call):
-    booking_id = safe_int(call.data.replace('cancel_visit_', ''))
-    if not booking_id:
-        bot.answer_callback_query(call.id, "❌ Неверный ID брони")
-        return
-    
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT user_name, booking_date, booking_time FROM bookings WHERE id = ?', (booking_id,))
-    booking = cursor.fetchone()
-    
-    if booking:
-        user_name, date, time = booking
-        
-        cursor.execute('UPDATE bookings SET status = "cancelled_by_user" WHERE id = ?', (booking_id,))
-        
-        admin_notification = f"""
-❌ *Гость отменил визит*
-
-👤 *Гость:* {user_name}
-📅 *Дата:* {date}
-⏰ *Время:* {time}
-
-*Бронь #*{booking_id}
-        """
-        
-        try:
-            safe_send_message(ADMIN_ID, admin_notification, parse_mode='Markdown')
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки уведомления администратору: {e}")
-        
-        bot.answer_callback_query(call.id, "❌ Бронь отменена. Надеемся увидеть вас в другой раз!")
-    else:
-        bot.answer_callback_query(call.id, "❌ Бронь не найдена")
-    
-    conn.commit()
-    conn.close()
-
-# === СИСТЕМА ОТЗЫВОВ ===
-@bot.message_handler(func=lambda message: message.text == '⭐ Оставить отзыв')
-def start_review(message):
-    keyboard = InlineKeyboardMarkup()
-    keyboard.row(
-        InlineKeyboardButton("1 ⭐", callback_data="review_direct_1"),
-        InlineKeyboardButton("2 ⭐", callback_data="review_direct_2"), 
-        InlineKeyboardButton("3 ⭐", callback_data="review_direct_3"),
-        InlineKeyboardButton("4 ⭐", callback_data="review_direct_4"),
-        InlineKeyboardButton("5 ⭐", callback_data="review_direct_5")
-    )
-    
-    review_text = f"""
-⭐ *Оцените {RESTAURANT_INFO['name']}*
-
-Пожалуйста, оцените ваше посещение по 5-балльной шкале:
-
-5 ⭐ - Отлично
-4 ⭐ - Хорошо  
-3 ⭐ - Нормально
-2 ⭐ - Плохо
-1 ⭐ - Очень плохо
-
-*Выберите оценку:* 👇
-    """
-    
-    safe_send_message(message.chat.id, review_text, reply_markup=keyboard, parse_mode='Markdown')
-
-def handle_review_rating(call):
-    global review_data
-    
-    rating = safe_int(call.data.replace('review_direct_', ''))
-    if not rating or rating < 1 or rating > 5:
-        bot.answer_callback_query(call.id, "❌ Неверная оценка")
-        return
-        
-    user_id = call.from_user.id
-    review_data[user_id] = {'rating': rating}
-    
-    safe_delete_message(call.message.chat.id, call.message.message_id)
-    msg = safe_send_message(
-        call.message.chat.id,
-        f"⭐ *Спасибо за оценку {rating}/5!*\n\n*Пожалуйста, напишите ваш отзыв:*\n• Что понравилось?\n• Что можно улучшить?\n• Ваши пожелания\n\nИли нажмите /skip чтобы пропустить текст",
-        parse_mode='Markdown'
-    )
-
-@bot.message_handler(commands=['skip'])
-def skip_review_text(message):
-    global review_data
-    user_id = message.from_user.id
-    if user_id in review_data:
-        save_review(user_id, "")
-        safe_send_message(message.chat.id, "✅ Спасибо! Ваш отзыв сохранен.", reply_markup=main_menu(user_id))
-    else:
-        safe_send_message(message.chat.id, "❌ Сначала оцените ресторан")
-
-@bot.message_handler(func=lambda message: message.from_user.id in review_data and not message.text.startswith('/'))
-def handle_review_text(message):
-    global review_data
-    user_id = message.from_user.id
-    review_text = message.text
-    save_review(user_id, review_text)
-    safe_send_message(message.chat.id, "✅ Спасибо! Ваш отзыв сохранен.", reply_markup=main_menu(user_id))
-
-def save_review(user_id, review_text):
-    global review_data
-    if user_id not in review_data:
-        return
-    
-    rating = review_data[user_id]['rating']
-    
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    try:
-        user = bot.get_chat(user_id)
-        user_name = user.first_name or "Аноним"
-        if user.last_name:
-            user_name += f" {user.last_name}"
-    except:
-        user_name = "Аноним"
-    
-    cursor.execute('INSERT INTO reviews (user_id, user_name, rating, review_text, status) VALUES (?, ?, ?, ?, "pending")', 
-                  (user_id, user_name, rating, review_text))
-    
-    cursor.execute('SELECT total_reviews, average_rating FROM admin_stats')
-    stats = cursor.fetchone()
-    
-    total_reviews = stats[0] + 1
-    if stats[0] == 0:
-        new_avg = float(rating)
-    else:
-        new_avg = (stats[1] * stats[0] + rating) / total_reviews
-    
-    cursor.execute('UPDATE admin_stats SET total_reviews = ?, average_rating = ?', (total_reviews, new_avg))
-    conn.commit()
-    conn.close()
-    
-    send_review_to_admin(user_name, rating, review_text)
-    del review_data[user_id]
-
-def send_review_to_admin(user_name, rating, review_text, booking_id=None):
-    stars = "⭐" * rating + "☆" * (5 - rating)
-    booking_info = f"\n📋 *Бронь #*{booking_id}" if booking_id else ""
-    
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM reviews ORDER BY id DESC LIMIT 1')
-    last_review = cursor.fetchone()
-    conn.close()
-    
-    review_id = last_review[0] if last_review else "1"
-    
-    review_message = f"""
-⭐ *НОВЫЙ ОТЗЫВ* {booking_info}
-
-👤 *Гость:* {user_name}
-⭐ *Оценка:* {rating}/5 {stars}
-{f"💬 *Текст отзыва:* {review_text}" if review_text else "💬 *Текст:* Без текста"}
-    """
-    
-    keyboard = InlineKeyboardMarkup()
-    keyboard.row(
-        InlineKeyboardButton("✅ Опубликовать", callback_data=f"publish_review_{review_id}"),
-        InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_review_{review_id}")
-    )
-    
-    if review_text:
-        keyboard.row(InlineKeyboardButton("💬 Ответить гостю", callback_data=f"admin_reply_review_{review_id}"))
-    
-    safe_send_message(ADMIN_ID, review_message, reply_markup=keyboard, parse_mode='Markdown')
-
-@bot.message_handler(func=lambda message: message.text == '💬 Отзывы на модерации' and message.from_user.id == ADMIN_ID)
-def show_pending_reviews(message):
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM reviews WHERE status = "pending" ORDER BY created_at DESC')
-    pending_reviews = cursor.fetchall()
-    conn.close()
-    
-    if not pending_reviews:
-        safe_send_message(message.chat.id, "✅ Нет отзывов на модерации")
-        return
-    
-    for review in pending_reviews:
-        review_id, user_id, user_name, rating, review_text, status, created_at = review
-        stars = "⭐" * rating + "☆" * (5 - rating)
-        text_display = f"💬 *Текст:* {review_text}" if review_text else "💬 *Текст:* Без текста"
-        
-        review_message = f"""
-⭐ *ОТЗЫВ НА МОДЕРАЦИИ* #{review_id}
-
-👤 *Гость:* {user_name}
-⭐ *Оценка:* {rating}/5 {stars}
-{text_display}
-📅 *Дата:* {created_at}
-        """
-        
-        keyboard = InlineKeyboardMarkup()
-        keyboard.row(
-            InlineKeyboardButton("✅ Опубликовать", callback_data=f"publish_review_{review_id}"),
-            InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_review_{review_id}")
-        )
-        
-        if review_text:
-            keyboard.row(InlineKeyboardButton("💬 Ответить гостю", callback_data=f"admin_reply_review_{review_id}"))
-        
-        safe_send_message(message.chat.id, review_message, reply_markup=keyboard, parse_mode='Markdown')
-
-def handle_review_moderation(call):
-    """Обработка модерации отзывов"""
-    if not call.data:
-        bot.answer_callback_query(call.id, "❌ Ошибка данных")
-        return
-        
-    if call.data.startswith('publish_review_'):
-        review_id = safe_int(call.data.replace('publish_review_', ''))
-        if not review_id:
-            bot.answer_callback_query(call.id, "❌ Неверный ID отзыва")
-            return
-            
-        conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE reviews SET status = "published" WHERE id = ?', (review_id,))
-        conn.commit()
-        conn.close()
-        bot.answer_callback_query(call.id, "✅ Отзыв опубликован")
-        
-        try:
-            bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        except Exception as e:
-            logger.warning(f"Не удалось обновить клавиатуру: {e}")
-        
-    elif call.data.startswith('reject_review_'):
-        review_id = safe_int(call.data.replace('reject_review_', ''))
-        if not review_id:
-            bot.answer_callback_query(call.id, "❌ Неверный ID отзыва")
-            return
-            
-        conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE reviews SET status = "rejected" WHERE id = ?', (review_id,))
-        conn.commit()
-        conn.close()
-        bot.answer_callback_query(call.id, "❌ Отзыв отклонен")
-        
-        try:
-            bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        except Exception as e:
-            logger.warning(f"Не удалось обновить клавиатуру: {e}")
-    
-    elif call.data.startswith('admin_reply_review_'):
-        review_id = safe_int(call.data.replace('admin_reply_review_', ''))
-        if not review_id:
-            bot.answer_callback_query(call.id, "❌ Неверный ID отзыва")
-            return
-            
-        AdminStates.set_review_reply_mode(call.from_user.id, review_id)
-        
-        conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id, user_name, review_text FROM reviews WHERE id = ?', (review_id,))
-        review = cursor.fetchone()
-        conn.close()
-        
-        if review:
-            user_id, user_name, review_text = review
-            
-            reply_text = f"""
-💬 *Ответ на отзыв гостя*
-
-👤 *Гость:* {user_name}
-⭐ *Отзыв:* {review_text if review_text else "Без текста"}
-
-*Введите ваш ответ для гостя:*
-            """
-            
-            try:
-                bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-            except Exception as e:
-                logger.warning(f"Не удалось обновить клавиатуру: {e}")
-            
-            safe_send_message(call.from_user.id, reply_text, parse_mode='Markdown')
-            bot.answer_callback_query(call.id, "💬 Введите ответ для гостя")
-        else:
-            bot.answer_callback_query(call.id, "❌ Отзыв не найден")
-
-@bot.message_handler(func=lambda message: message.from_user.id == ADMIN_ID and 
-                     AdminStates.get_review_reply_mode(message.from_user.id) is not None and
-                     not message.text.startswith('/'))
-def handle_admin_review_reply(message):
-    review_id = AdminStates.get_review_reply_mode(message.from_user.id)
-    if not review_id:
-        return
-        
-    reply_text = message.text
-    
-    conn = sqlite3.connect('restaurant.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_id, user_name FROM reviews WHERE id = ?', (review_id,))
-    review = cursor.fetchone()
-    conn.close()
-    
-    if review:
-        user_id, user_name = review
-        user_message = f"""
-👑 *Ответ от администратора на ваш отзыв:*
-
-💬 *{reply_text}*
-
-*Спасибо за ваш отзыв!* ❤️
-        """
-        try:
-            safe_send_message(user_id, user_message, parse_mode='Markdown')
-            safe_send_message(ADMIN_ID, "✅ Ответ успешно отправлен гостю!")
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки ответа гостю: {e}")
-            safe_send_message(ADMIN_ID, "❌ Не удалось отправить ответ гостю")
-    
-    AdminStates.clear_review_reply_mode(message.from_user.id)
-
-# === ДОПОЛНИТЕЛЬНЫЕ ОБРАБОТЧИКИ ===
-@bot.message_handler(func=lambda message: message.text == '🔙 Назад к календарю')
-def back_to_calendar(message):
-    user_id = message.from_user.id
-    
-    if user_id in user_data:
-        user_data[user_id]['state'] = BookingState.DATE
-        user_data[user_id]['last_activity'] = time_module.time()
-    
-    cleanup_user_data(user_id)
-    
-    calendar = generate_calendar()
-    msg = safe_send_message(message.chat.id, "🗓️ Возврат к выбору даты:", reply_markup=calendar)
-    
-    if user_id not in user_data:
-        user_data[user_id] = {}
-    user_data[user_id]['booking_steps'] = [msg.message_id]
-    user_data[user_id]['state'] = BookingState.DATE
-
-# === ОСНОВНЫЕ КОМАНДЫ ===
-@bot.message_handler(commands=['start'])
-def start(message):
-    if message.from_user.id == ADMIN_ID:
-        welcome_text = f"""
-👑 *Добро пожаловать в панель администратора!*
-
-🏢 *Лаундж-бар:* {RESTAURANT_INFO['name']}
-📍 *Адрес:* {RESTAURANT_INFO['address']}
-{RESTAURANT_INFO['entertainment']}
-
-*Используйте меню ниже для управления:* 👇
-        """
-        safe_send_message(message.chat.id, welcome_text, reply_markup=admin_menu(), parse_mode='Markdown')
-    else:
-        welcome_text = f"""
-🍝 *Добро пожаловать в {RESTAURANT_INFO['name']}!*
-
-{RESTAURANT_INFO['description']}
-
-{RESTAURANT_INFO['entertainment']}
-
-📍 *Адрес:* {RESTAURANT_INFO['address']}
-📞 *Телефон:* {RESTAURANT_INFO['phone']}
-🕒 *Режим работы:*
-• {RESTAURANT_INFO['hours_week']}
-• {RESTAURANT_INFO['hours_weekend']}
-
-*Чем могу помочь?* 👇
-        """
-        safe_send_message(message.chat.id, welcome_text, reply_markup=main_menu(message.from_user.id), parse_mode='Markdown')
-
-@bot.message_handler(func=lambda message: message.text == '📞 Контакты')
-def contacts(message):
-    contacts_text = f"""
-📞 *Контакты {RESTAURANT_INFO['name']}:*
-
-📍 *Адрес:* {RESTAURANT_INFO['address']}
-📞 *Телефон:* {RESTAURANT_INFO['phone']}
-
-🕒 *Режим работы:*
-• {RESTAURANT_INFO['hours_week']}
-• {RESTAURANT_INFO['hours_weekend']}
-
-🎮 *Развлечения:*
-{RESTAURANT_INFO['entertainment']}
-
-*Ждем вас в гости!* 😊
-    """
-    safe_send_message(message.chat.id, contacts_text, parse_mode='Markdown')
-
-# === СИСТЕМА ОЧИСТКИ СЕССИЙ ===
-def cleanup_old_sessions():
-    while True:
-        try:
-            current_time = time_module.time()
-            max_age = 1800
-            
-            users_to_remove = []
-            for user_id, data in user_data.items():
-                if 'last_activity' in data and current_time - data['last_activity'] > max_age:
-                    users_to_remove.append(user_id)
-            
-            for user_id in users_to_remove:
-                cleanup_user_data(user_id)
-                logger.info(f"🧹 Очищена старая сессия пользователя {user_id}")
-            
-            time_module.sleep(300)
-        except Exception as e:
-            logger.error(f"❌ Ошибка в очистке сессий: {e}")
-            time_module.sleep(60)
-
-def start_reminder_system():
-    reminder_thread = threading.Thread(target=check_reminders)
-    reminder_thread.daemon = True
-    reminder_thread.start()
-    logger.info("✅ Система уведомлений запущена")
-
-# === ЗАПУСК СИСТЕМЫ ===
-if __name__ == '__main__':
-    print("🚀 Запуск бота на Railway...")
-    print(f"🏢 Лаундж-бар: {RESTAURANT_INFO['name']}")
-    print(f"📍 Адрес: {RESTAURANT_INFO['address']}")
-    print(f"👑 Администратор: {ADMIN_ID}")
-    print(f"🎮 Развлечения: {RESTAURANT_INFO['entertainment']}")
-    
-    # Инициализация базы данных
-    init_db()
-    
-    # Запуск системы уведомлений
-    start_reminder_system()
-    
-    # Запуск очистки сессий
-    cleanup_thread = threading.Thread(target=cleanup_old_sessions)
-    cleanup_thread.daemon = True
-    cleanup_thread.start()
-    
-    print("✅ Все системы запущены!")
-    print("🤖 Бот запущен и готов к работе...")
-    
-    # Бесконечный цикл для Railway
-    while True:
-        try:
-            print("🔍 Ожидание сообщений...")
-            bot.polling(none_stop=True, timeout=60)
-        except Exception as e:
-            logger.error(f"❌ Ошибка бота: {e}")
-            print("🔄 Перезапуск через 10 секунд...")
-
-            time_module.sleep(10)
+# telegram_bot.py 
+import os
+import signal
+import telebot
+from telebot.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+import sqlite3
+import datetime
+import time as time_module
+import re
+import threading
+import queue
+import heapq
+import bisect
+import itertools
+import functools
+from collections import deque, Counter, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+import logging
+import json
+import io
+import hmac
+import secrets
+import csv
+import gzip
+import tempfile
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# === НАСТРОЙКА ЛОГГИРОВАНИЯ ===
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# === ОБРАБОТКА ЗАВЕРШЕНИЯ ===
+def handle_exit(signum, frame):
+    logger.info("🤖 Бот завершает работу...")
+    outbound.drain(timeout=5)
+    flush_sessions()
+    db.close_all()
+    exit(0)
+
+signal.signal(signal.SIGINT, handle_exit)
+signal.signal(signal.SIGTERM, handle_exit)
+
+# === КОНФИГУРАЦИЯ ===
+# Используем переменные окружения Railway
+BOT_TOKEN = os.environ.get('BOT_TOKEN')
+if not BOT_TOKEN:
+    logger.error("❌ BOT_TOKEN не установлен!")
+    exit(1)
+# Потоки обработки обновлений: пул telebot при polling и пул webhook
+UPDATE_WORKERS = int(os.environ.get('UPDATE_WORKERS', 8))
+bot = telebot.TeleBot(BOT_TOKEN, num_threads=UPDATE_WORKERS)
+
+# Обновленные данные ресторана
+RESTAURANT_INFO = {
+    'name': 'Лаундж-Бар на Уральской',
+    'address': 'г. Калининград, ул. Уральская, 11',
+    'phone': '+7(4012)63-69-39',
+    'hours_week': 'вс-чт 16:00-02:00',
+    'hours_weekend': 'пт-сб 16:00-03:00',
+    'description': 'Уютный лаундж-бар с игровой приставкой, Xbox и настольными играми. Идеальное место для отдыха с друзьями!',
+    'entertainment': '🎮 Игровая приставка\n🎯 Xbox\n♟️ Настольные игры'
+}
+
+# Первое заведение создается из RESTAURANT_INFO и этих часов; остальные - командой /venues
+DEFAULT_VENUE_ID = 1
+DEFAULT_VENUE_HOURS = {
+    'opens': '16:00',
+    'closes_week': '02:00',
+    'closes_weekend': '03:00',
+    'last_slot_week': '01:00',      # последний слот бронирования - за час до закрытия
+    'last_slot_weekend': '02:00',
+    'weekend_days': '56',           # пятница и суббота, 1 - понедельник
+}
+# Бронирование открыто на столько дней вперед; на этот срок собирается календарь расписания
+BOOKING_HORIZON_DAYS = 90
+
+# Владелец: создается в таблице staff при первом запуске, остальной персонал - командой /staff
+ADMIN_ID = int(os.environ.get('ADMIN_ID', 800471772))
+CLAIM_TTL = timedelta(minutes=15)   # захват заявки сотрудником снимается, если решения нет
+
+# Столы лаунджа: вместимость и зона. Столы одной зоны можно сдвигать для большой компании
+LOUNGE_TABLES = [
+    {'id': 1, 'seats': 2, 'zone': 'window'},
+    {'id': 2, 'seats': 2, 'zone': 'window'},
+    {'id': 3, 'seats': 4, 'zone': 'hall'},
+    {'id': 4, 'seats': 4, 'zone': 'hall'},
+    {'id': 5, 'seats': 4, 'zone': 'hall'},
+    {'id': 6, 'seats': 6, 'zone': 'console'},
+    {'id': 7, 'seats': 6, 'zone': 'vip'},
+    {'id': 8, 'seats': 8, 'zone': 'vip'},
+]
+# Индекс столов заведения, к которому не обращались столько секунд, выгружается из памяти
+SEATING_IDLE_TTL = int(os.environ.get('SEATING_IDLE_TTL', 3600))
+# Сколько времени стол считается занятым после начала брони
+BOOKING_DURATION = timedelta(hours=2)
+
+# Лимиты Telegram на исходящие сообщения
+GLOBAL_SEND_RATE = float(os.environ.get('GLOBAL_SEND_RATE', 30))   # сообщений в секунду на бота
+CHAT_SEND_RATE = float(os.environ.get('CHAT_SEND_RATE', 1))        # сообщений в секунду в один чат
+CHAT_SEND_BURST = int(os.environ.get('CHAT_SEND_BURST', 3))        # допустимая короткая пачка в один чат
+OUTBOUND_WORKERS = int(os.environ.get('OUTBOUND_WORKERS', 4))
+MAX_SEND_ATTEMPTS = 5
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')          # публичный адрес, например https://bot.example.com/telegram
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')    # проверяется в X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.environ.get('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('PORT', 8080))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/telegram')
+UPDATE_QUEUE_SIZE = int(os.environ.get('UPDATE_QUEUE_SIZE', 1000))
+# Сколько последних update_id, сообщений и нажатий помнить для отсева повторов
+RECENT_IDS_LIMIT = int(os.environ.get('RECENT_IDS_LIMIT', 10000))
+
+# Настройки базы данных
+DB_PATH = os.environ.get('DB_PATH', 'restaurant.db')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+# Архив завершенных броней - отдельный файл, подключается к каждому соединению как schema "archive"
+ARCHIVE_DB_PATH = os.environ.get('ARCHIVE_DB_PATH', os.path.splitext(DB_PATH)[0] + '_archive.db')
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 30))
+
+# Метрики Prometheus: http://METRICS_HOST:METRICS_PORT/metrics, 0 - отключить
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9100))
+
+# === МЕТРИКИ ===
+# Формат - текстовый Prometheus exposition. Запись в метрику - одна блокировка и bisect,
+# поэтому их можно ставить на горячий путь. Метки - только из ограниченных наборов
+# (имя обработчика, метод API), а не user_id или текст сообщения.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class CounterMetric:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+class GaugeMetric:
+    """Значение снимается функцией в момент запроса /metrics"""
+    
+    def __init__(self, name, help_text, read, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.read = read              # без меток - число, с метками - {кортеж меток: число}
+        self.labelnames = labelnames
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge']
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось снять метрику {self.name}: {e}")
+            return lines
+        items = sorted(value.items()) if self.labelnames else [((), value)]
+        for labels, number in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {number}')
+        return lines
+
+class HistogramMetric:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}             # метки -> [счетчики по корзинам..., +Inf, сумма]
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+    
+    @contextmanager
+    def time(self, *labels):
+        started = time_module.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time_module.perf_counter() - started, *labels)
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+    
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(CounterMetric(name, help_text, labelnames))
+    
+    def gauge(self, name, help_text, read, labelnames=()):
+        return self._register(GaugeMetric(name, help_text, read, labelnames))
+    
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(HistogramMetric(name, help_text, labelnames, buckets))
+    
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+HANDLER_SECONDS = metrics.histogram(
+    'bot_handler_seconds', 'Время обработчика обновления', ('kind', 'route'))
+HANDLER_ERRORS = metrics.counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках', ('kind', 'route'))
+DB_SECONDS = metrics.histogram(
+    'bot_db_seconds', 'Время работы с соединением SQLite, включая ожидание пула', ('mode',))
+DB_POOL_WAIT_SECONDS = metrics.histogram(
+    'bot_db_pool_wait_seconds', 'Ожидание свободного соединения в пуле')
+API_SECONDS = metrics.histogram(
+    'bot_telegram_api_seconds', 'Время HTTP-вызова Bot API', ('method',))
+API_ERRORS = metrics.counter(
+    'bot_telegram_api_errors_total', 'Ошибки вызовов Bot API', ('method', 'code'))
+OUTBOUND_QUEUE_SECONDS = metrics.histogram(
+    'bot_outbound_queue_seconds', 'Время от постановки в очередь отправки до успешного вызова', ('priority',))
+REMINDER_SECONDS = metrics.histogram(
+    'bot_reminder_seconds', 'Время отправки одного напоминания', ('kind',))
+REMINDER_LAG_SECONDS = metrics.histogram(
+    'bot_reminder_lag_seconds', 'Опоздание напоминания относительно запланированного времени')
+DUPLICATE_UPDATES = metrics.counter(
+    'bot_duplicate_updates_total', 'Повторно доставленные обновления, отброшенные без обработки', ('kind',))
+EXPORT_SECONDS = metrics.histogram(
+    'bot_export_seconds', 'Время выгрузки /export до отправки файла', ('kind',),
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0))
+
+def _timed_make_request(make_request):
+    """Обертка над apihelper._make_request: через нее проходят все вызовы Bot API"""
+    @functools.wraps(make_request)
+    def timed(token, method_name, *args, **kwargs):
+        started = time_module.perf_counter()
+        try:
+            return make_request(token, method_name, *args, **kwargs)
+        except telebot.apihelper.ApiTelegramException as e:
+            API_ERRORS.inc(method_name, e.error_code)
+            raise
+        except Exception:
+            API_ERRORS.inc(method_name, 'network')
+            raise
+        finally:
+            # Long polling getUpdates ждет до timeout по определению, его время не показательно
+            if method_name != 'getUpdates':
+                API_SECONDS.observe(time_module.perf_counter() - started, method_name)
+    return timed
+
+telebot.apihelper._make_request = _timed_make_request(telebot.apihelper._make_request)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server():
+    if not METRICS_PORT:
+        return
+    try:
+        server = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), MetricsHandler)
+    except OSError as e:
+        logger.error(f"❌ Не удалось запустить сервер метрик на {METRICS_HOST}:{METRICS_PORT}: {e}")
+        return
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"📈 Метрики: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+# Состояния бронирования
+class BookingState:
+    DATE = 1
+    TIME = 2
+    GUESTS = 3
+    NAME = 4
+    PHONE = 5
+    COMMENT = 6
+
+# === СЕССИИ ===
+# Незавершенные диалоги хранятся в SQLite и переживают перезапуск бота.
+# В памяти держится ограниченный LRU-кэш, изменения пишутся в базу пачками
+SESSION_TTL = 1800                  # незавершенное бронирование, секунды
+REVIEW_SESSION_TTL = 3600           # ожидание текста отзыва
+ADMIN_MODE_TTL = 24 * 3600          # режим ответа администратора
+VENUE_CHOICE_TTL = 90 * 24 * 3600   # выбранное гостем заведение
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 5000))
+SESSION_FLUSH_INTERVAL = 1.0        # окно потери изменений при аварийном завершении
+USER_LOCK_STRIPES = 256
+
+_user_locks = [threading.RLock() for _ in range(USER_LOCK_STRIPES)]
+
+def user_lock(user_id):
+    """Блокировка пользователя из фиксированного набора: память не растет с числом гостей"""
+    return _user_locks[hash(user_id) % USER_LOCK_STRIPES]
+
+class Session(dict):
+    """Данные сессии; любое изменение продлевает ее и ставит в очередь на запись.
+    
+    Вложенные списки нужно присваивать заново, а не менять на месте.
+    """
+    
+    def __init__(self, store, key, data=()):
+        super().__init__(data)
+        self._store = store
+        self._key = key
+    
+    def __setitem__(self, field, value):
+        super().__setitem__(field, value)
+        self._store._touch(self._key)
+    
+    def __delitem__(self, field):
+        super().__delitem__(field)
+        self._store._touch(self._key)
+    
+    def pop(self, field, *default):
+        value = super().pop(field, *default)
+        self._store._touch(self._key)
+        return value
+    
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._store._touch(self._key)
+
+class SessionStore:
+    """Сессии одного вида с ключом user_id.
+    
+    Сроки жизни всех сессий (и закэшированных, и вытесненных в базу) лежат в
+    _expires, очередь истечения - куча с одной записью на ключ. Отсутствие
+    сессии проверяется без обращения к базе.
+    """
+    
+    def __init__(self, namespace, ttl, capacity=SESSION_CACHE_SIZE, on_expire=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.capacity = capacity
+        self.on_expire = on_expire
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()   # чтение вытесненных сессий не обгоняет их запись
+        self._cache = OrderedDict()        # user_id -> Session, от давно не использованных к свежим
+        self._expires = {}                 # user_id -> время истечения
+        self._heap = []                    # (время истечения, user_id)
+        self._scheduled = set()            # ключи, у которых есть запись в куче
+        self._dirty = set()
+        self._evicted = {}                 # вытеснены из кэша до записи: user_id -> данные
+        self._deleted = set()
+    
+    def _schedule(self, key, expires_at):
+        self._expires[key] = expires_at
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            heapq.heappush(self._heap, (expires_at, key))
+    
+    def _touch(self, key):
+        with self._lock:
+            if key not in self._cache:
+                return
+            self._schedule(key, time_module.time() + self.ttl)
+            self._cache.move_to_end(key)
+            self._dirty.add(key)
+    
+    def _install(self, key, data):
+        session = Session(self, key, data)
+        self._cache[key] = session
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.capacity:
+            old_key, old_session = self._cache.popitem(last=False)
+            if old_key in self._dirty:
+                self._dirty.discard(old_key)
+                self._evicted[old_key] = dict(old_session)
+        return session
+    
+    def _drop(self, key):
+        self._cache.pop(key, None)
+        self._expires.pop(key, None)
+        self._dirty.discard(key)
+        self._evicted.pop(key, None)
+        self._deleted.add(key)
+    
+    def _load(self, key):
+        with self._io_lock, db.connection() as cursor:
+            cursor.execute('SELECT data FROM sessions WHERE namespace = ? AND user_id = ?', (self.namespace, key))
+            row = cursor.fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def get(self, key, default=None):
+        with self._lock:
+            expires_at = self._expires.get(key)
+            if expires_at is None or expires_at <= time_module.time():
+                return default
+            session = self._cache.get(key)
+            if session is not None:
+                self._cache.move_to_end(key)
+                return session
+            data = self._evicted.pop(key, None)
+            if data is not None:
+                self._dirty.add(key)
+                return self._install(key, data)
+        
+        data = self._load(key)
+        with self._lock:
+            if key not in self._expires:
+                return default
+            session = self._cache.get(key)
+            if session is None:
+                if data is None:
+                    return default
+                session = self._install(key, data)
+            return session
+    
+    def __contains__(self, key):
+        return self.get(key) is not None
+    
+    def __getitem__(self, key):
+        session = self.get(key)
+        if session is None:
+            raise KeyError(key)
+        return session
+    
+    def __setitem__(self, key, data):
+        with self._lock:
+            self._deleted.discard(key)
+            self._evicted.pop(key, None)
+            self._install(key, data)
+            self._touch(key)
+    
+    def __delitem__(self, key):
+        with self._lock:
+            if key not in self._expires:
+                raise KeyError(key)
+            self._drop(key)
+    
+    def pop(self, key, default=None):
+        session = self.get(key)
+        with self._lock:
+            if key in self._expires:
+                self._drop(key)
+        return default if session is None else session
+    
+    def __len__(self):
+        return len(self._expires)
+    
+    def load_index(self):
+        """Поднимает сроки жизни сохраненных сессий после перезапуска"""
+        with db.connection() as cursor:
+            cursor.execute('SELECT user_id, expires_at FROM sessions WHERE namespace = ?', (self.namespace,))
+            rows = cursor.fetchall()
+        with self._lock:
+            for key, expires_at in rows:
+                if key not in self._expires:
+                    self._schedule(key, expires_at)
+        return len(rows)
+    
+    def flush(self):
+        """Записывает измененные и удаленные сессии одной транзакцией"""
+        with self._io_lock:
+            with self._lock:
+                writes = [(key, dict(self._cache[key])) for key in self._dirty]
+                writes.extend(self._evicted.items())
+                rows = [
+                    (self.namespace, key, json.dumps(data, ensure_ascii=False), self._expires[key])
+                    for key, data in writes
+                ]
+                deletes = [(self.namespace, key) for key in self._deleted]
+                self._dirty.clear()
+                self._evicted.clear()
+                self._deleted.clear()
+            
+            if not rows and not deletes:
+                return 0
+            try:
+                with db.transaction() as cursor:
+                    cursor.executemany(
+                        'INSERT OR REPLACE INTO sessions (namespace, user_id, data, expires_at) VALUES (?, ?, ?, ?)',
+                        rows
+                    )
+                    cursor.executemany('DELETE FROM sessions WHERE namespace = ? AND user_id = ?', deletes)
+            except Exception:
+                # Возвращаем в очередь то, что не перезаписали и не удалили за время попытки
+                with self._lock:
+                    for key, data in writes:
+                        if key in self._cache:
+                            self._dirty.add(key)
+                        elif key in self._expires:
+                            self._evicted.setdefault(key, data)
+                    for _, key in deletes:
+                        if key not in self._expires:
+                            self._deleted.add(key)
+                raise
+        return len(rows) + len(deletes)
+    
+    def expire_due(self, now=None):
+        """Удаляет истекшие сессии и вызывает для них on_expire"""
+        now = now or time_module.time()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, key = heapq.heappop(self._heap)
+                self._scheduled.discard(key)
+                expires_at = self._expires.get(key)
+                if expires_at is None:
+                    continue
+                if expires_at > now:
+                    self._schedule(key, expires_at)
+                    continue
+                session = self._cache.get(key)
+                data = dict(session) if session is not None else self._evicted.get(key)
+                expired.append((key, data))
+                self._drop(key)
+        
+        for key, data in expired:
+            if data is None:
+                data = self._load(key)
+            if self.on_expire and data:
+                try:
+                    self.on_expire(key, data)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка при завершении сессии {self.namespace} пользователя {key}: {e}")
+            logger.info(f"🧹 Очищена старая сессия {self.namespace} пользователя {key}")
+        return len(expired)
+
+def delete_booking_steps(user_id, data):
+    """Удаляет из чата сообщения шагов бронирования"""
+    for msg_id in data.get('booking_steps', ()):
+        safe_delete_message(user_id, msg_id)
+
+user_data = SessionStore('booking', SESSION_TTL, on_expire=delete_booking_steps)
+review_data = SessionStore('review', REVIEW_SESSION_TTL)
+admin_modes = SessionStore('admin', ADMIN_MODE_TTL)
+venue_choices = SessionStore('venue', VENUE_CHOICE_TTL)
+session_stores = (user_data, review_data, admin_modes, venue_choices)
+metrics.gauge(
+    'bot_sessions', 'Активные сессии по видам', lambda: {(store.namespace,): len(store) for store in session_stores},
+    ('namespace',)
+)
+
+def booking_state(user_id):
+    """Текущий шаг бронирования или None"""
+    session = user_data.get(user_id)
+    return session.get('state') if session is not None else None
+
+def remember_step(user_id, msg):
+    """Запоминает сообщение шага, чтобы удалить его по завершении бронирования"""
+    session = user_data.get(user_id)
+    if msg and session is not None:
+        session['booking_steps'] = session.get('booking_steps', []) + [msg.message_id]
+
+def flush_sessions():
+    for store in session_stores:
+        try:
+            store.flush()
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи сессий {store.namespace}: {e}")
+
+# Классы для управления состояниями
+class AdminStates:
+    """Режимы ответа администратора; хранятся в сессии 'admin'"""
+    
+    @staticmethod
+    def _set(admin_id, field, value):
+        session = admin_modes.get(admin_id)
+        if session is None:
+            admin_modes[admin_id] = {field: value}
+        else:
+            session[field] = value
+    
+    @staticmethod
+    def _get(admin_id, field):
+        session = admin_modes.get(admin_id)
+        return session.get(field) if session is not None else None
+    
+    @staticmethod
+    def _clear(admin_id, field):
+        session = admin_modes.get(admin_id)
+        if session is not None and field in session:
+            del session[field]
+    
+    @classmethod
+    def set_booking_reply_mode(cls, admin_id, booking_id):
+        cls._set(admin_id, 'booking_reply', booking_id)
+    
+    @classmethod
+    def get_booking_reply_mode(cls, admin_id):
+        return cls._get(admin_id, 'booking_reply')
+    
+    @classmethod
+    def clear_booking_reply_mode(cls, admin_id):
+        cls._clear(admin_id, 'booking_reply')
+    
+    @classmethod
+    def set_review_reply_mode(cls, admin_id, review_id):
+        cls._set(admin_id, 'review_reply', review_id)
+    
+    @classmethod
+    def get_review_reply_mode(cls, admin_id):
+        return cls._get(admin_id, 'review_reply')
+    
+    @classmethod
+    def clear_review_reply_mode(cls, admin_id):
+        cls._clear(admin_id, 'review_reply')
+    
+    @classmethod
+    def get_bulk_selection(cls, admin_id):
+        return set(cls._get(admin_id, 'bulk_selected') or ())
+    
+    @classmethod
+    def set_bulk_selection(cls, admin_id, booking_ids):
+        if booking_ids:
+            cls._set(admin_id, 'bulk_selected', sorted(booking_ids))
+        else:
+            cls._clear(admin_id, 'bulk_selected')
+
+# === ИСХОДЯЩИЕ СООБЩЕНИЯ ===
+# Приоритеты очереди: меньше - раньше
+PRIORITY_URGENT = 0   # шаги диалога, решения администратора, ответы гостю
+PRIORITY_NORMAL = 1   # уведомления и напоминания
+PRIORITY_BULK = 2     # списки в админ-панели
+
+class TokenBucket:
+    """Корзина токенов; вызывается под блокировкой диспетчера"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time_module.monotonic()
+    
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, now):
+        """Через сколько секунд будет доступен токен (0 - уже доступен)"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+    
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class OutboundJob:
+    __slots__ = ('priority', 'chat_id', 'method', 'args', 'kwargs', 'attempts', 'future', 'queued_at')
+    
+    def __init__(self, priority, chat_id, method, args, kwargs):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.future = Future()
+        self.queued_at = time_module.monotonic()
+
+class OutboundDispatcher:
+    """Очередь исходящих вызовов Bot API.
+    
+    - глобальная корзина токенов и по одной на чат;
+    - внутри чата строгий FIFO, между чатами - по приоритету головного задания;
+    - 429 и сетевые ошибки повторяются с учетом retry_after, не нарушая порядок в чате;
+    - пул потоков разбирает очередь, обработчики не ждут HTTP.
+    """
+    
+    def __init__(self, workers, global_rate, chat_rate, chat_burst):
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._cond = threading.Condition()
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._buckets = {}
+        self._ready = []
+        self._delayed = []
+        self._scheduled = set()
+        self._in_flight = set()
+        self._seq = itertools.count()
+        self._threads = []
+        self.backlog = 0
+    
+    @property
+    def running(self):
+        return bool(self._threads)
+    
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'outbound-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"✅ Очередь исходящих сообщений запущена ({self.workers} потоков)")
+    
+    def submit(self, chat_id, method, *args, priority=PRIORITY_NORMAL, **kwargs):
+        job = OutboundJob(priority, chat_id, method, args, kwargs)
+        if not self.running:
+            self._execute_inline(job)
+            return job.future
+        
+        with self._cond:
+            self._chats.setdefault(chat_id, deque()).append(job)
+            self.backlog += 1
+            if chat_id not in self._scheduled and chat_id not in self._in_flight:
+                self._schedule(chat_id, time_module.monotonic())
+            self._cond.notify()
+        return job.future
+    
+    def drain(self, timeout):
+        """Ждет отправки очереди при завершении работы"""
+        deadline = time_module.monotonic() + timeout
+        with self._cond:
+            while self.backlog and time_module.monotonic() < deadline:
+                self._cond.wait(0.1)
+    
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) > 4096:
+                now = time_module.monotonic()
+                for idle_chat in [c for c, b in self._buckets.items() if c not in self._chats and b.is_full(now)]:
+                    del self._buckets[idle_chat]
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+    
+    def _schedule(self, chat_id, ready_at):
+        self._scheduled.add(chat_id)
+        head = self._chats[chat_id][0]
+        if ready_at <= time_module.monotonic():
+            heapq.heappush(self._ready, (head.priority, next(self._seq), chat_id))
+        else:
+            heapq.heappush(self._delayed, (ready_at, next(self._seq), chat_id))
+    
+    def _next_job(self):
+        """Выбирает следующий чат; вызывается под self._cond"""
+        while True:
+            now = time_module.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self._delayed)
+                head = self._chats[chat_id][0]
+                heapq.heappush(self._ready, (head.priority, next(self._seq), chat_id))
+            
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            if self._ready:
+                global_wait = self._global.wait_time(now)
+                if global_wait == 0:
+                    _, _, chat_id = heapq.heappop(self._ready)
+                    chat_wait = self._bucket(chat_id).wait_time(now)
+                    if chat_wait > 0:
+                        heapq.heappush(self._delayed, (now + chat_wait, next(self._seq), chat_id))
+                        continue
+                    self._global.take(now)
+                    self._bucket(chat_id).take(now)
+                    self._scheduled.discard(chat_id)
+                    self._in_flight.add(chat_id)
+                    return self._chats[chat_id][0]
+                timeout = global_wait if timeout is None else min(timeout, global_wait)
+            self._cond.wait(timeout)
+    
+    def _call(self, job):
+        """Один вызов API. Возвращает (готово, результат, задержка перед повтором)"""
+        job.attempts += 1
+        try:
+            return True, job.method(*job.args, **job.kwargs), 0
+        except telebot.apihelper.ApiTelegramException as e:
+            if e.error_code == 429 and job.attempts < MAX_SEND_ATTEMPTS:
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                logger.warning(f"⏳ Лимит Telegram для чата {job.chat_id}, повтор через {retry_after} с")
+                return False, None, retry_after
+            if e.error_code >= 500 and job.attempts < MAX_SEND_ATTEMPTS:
+                return False, None, 2 ** job.attempts
+            logger.error(f"Ошибка отправки сообщения {job.chat_id}: {e}")
+        except Exception as e:
+            if job.attempts < MAX_SEND_ATTEMPTS:
+                logger.warning(f"Сбой отправки в чат {job.chat_id} (попытка {job.attempts}): {e}")
+                return False, None, 2 ** job.attempts
+            logger.error(f"Ошибка отправки сообщения {job.chat_id}: {e}")
+        return True, None, 0
+    
+    def _execute_inline(self, job):
+        while True:
+            done, result, delay = self._call(job)
+            if done:
+                job.future.set_result(result)
+                return
+            time_module.sleep(delay)
+    
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+            
+            done, result, delay = self._call(job)
+            
+            with self._cond:
+                chat_id = job.chat_id
+                self._in_flight.discard(chat_id)
+                jobs = self._chats[chat_id]
+                ready_at = time_module.monotonic() + delay
+                if done:
+                    jobs.popleft()
+                    self.backlog -= 1
+                    ready_at = 0
+                if jobs:
+                    self._schedule(chat_id, ready_at)
+                else:
+                    del self._chats[chat_id]
+                self._cond.notify_all()
+            
+            if done:
+                OUTBOUND_QUEUE_SECONDS.observe(time_module.monotonic() - job.queued_at, job.priority)
+                job.future.set_result(result)
+
+outbound = OutboundDispatcher(OUTBOUND_WORKERS, GLOBAL_SEND_RATE, CHAT_SEND_RATE, CHAT_SEND_BURST)
+metrics.gauge('bot_outbound_backlog', 'Заданий в очереди отправки', lambda: outbound.backlog)
+
+def queue_message(chat_id, text, priority=PRIORITY_URGENT, **kwargs):
+    """Ставит сообщение в очередь и сразу возвращает Future с Message (или None при ошибке)"""
+    return outbound.submit(chat_id, bot.send_message, chat_id, text, priority=priority, **kwargs)
+
+# === ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ===
+def safe_int(value, default=0):
+    """Безопасное преобразование в int"""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return default
+
+def safe_send_message(chat_id, text, **kwargs):
+    """Безопасная отправка сообщения с ожиданием результата (нужен message_id)"""
+    try:
+        return queue_message(chat_id, text, priority=PRIORITY_URGENT, **kwargs).result(timeout=60)
+    except Exception as e:
+        logger.error(f"Ошибка отправки сообщения {chat_id}: {e}")
+        return None
+
+def safe_delete_message(chat_id, message_id):
+    """Безопасное удаление сообщения"""
+    try:
+        bot.delete_message(chat_id, message_id)
+        return True
+    except Exception as e:
+        logger.warning(f"Не удалось удалить сообщение: {e}")
+        return False
+
+# Шаблоны компилируются один раз. Строки дат и времени ограничены календарем на 90 дней
+# и сеткой слотов, поэтому разбор кэшируется: одна и та же дата за шаг бронирования
+# проверяется, переводится в часы работы, слоты и начало визита - и разбирается однажды.
+# Неверный ввод отсекается шаблоном до strptime и в кэш не попадает.
+NON_DIGITS = re.compile(r'\D')
+NAME_PATTERN = re.compile(r'[a-zA-Zа-яА-ЯёЁ\s\-]+')
+DATE_PATTERN = re.compile(r'\d{1,2}\.\d{1,2}\.\d{4}')
+TIME_PATTERN = re.compile(r'\d{1,2}:\d{2}')
+SHIFT_PATTERN = re.compile(r'(\d{1,2}:\d{2})-(\d{1,2}:\d{2})')
+DATE_CACHE_SIZE = 512   # ~ 90 дней календаря на несколько заведений
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(date_str):
+    """ДД.ММ.ГГГГ -> date; ValueError, как у strptime"""
+    if not DATE_PATTERN.fullmatch(date_str):
+        raise ValueError(f"неверная дата: {date_str!r}")
+    return datetime.datetime.strptime(date_str, '%d.%m.%Y').date()
+
+@functools.lru_cache(maxsize=64)
+def clock(value):
+    """ЧЧ:ММ -> time; ValueError, как у strptime"""
+    if not TIME_PATTERN.fullmatch(value):
+        raise ValueError(f"неверное время: {value!r}")
+    return datetime.datetime.strptime(value, '%H:%M').time()
+
+def validate_phone(phone):
+    """Валидация номера телефона"""
+    if not phone:
+        return None
+    
+    clean_phone = NON_DIGITS.sub('', phone)
+    
+    if len(clean_phone) < 10 or len(clean_phone) > 15:
+        return None
+    
+    if clean_phone.startswith('8') and len(clean_phone) == 11:
+        clean_phone = '7' + clean_phone[1:]
+    
+    if len(clean_phone) == 11 and clean_phone.startswith('7'):
+        return f"+7 ({clean_phone[1:4]}) {clean_phone[4:7]}-{clean_phone[7:9]}-{clean_phone[9:11]}"
+    elif len(clean_phone) == 10:
+        return f"+7 ({clean_phone[0:3]}) {clean_phone[3:6]}-{clean_phone[6:8]}-{clean_phone[8:10]}"
+    
+    return None
+
+def validate_date(date_str):
+    """Валидация даты"""
+    if not date_str:
+        return None, "❌ Дата не указана"
+        
+    try:
+        date_obj = parse_date(date_str)
+        today = datetime.date.today()
+        
+        if date_obj < today:
+            return None, "❌ Нельзя забронировать стол на прошедшую дату"
+        
+        max_date = today + timedelta(days=BOOKING_HORIZON_DAYS)
+        if date_obj > max_date:
+            return None, "❌ Бронирование доступно только на 3 месяца вперед"
+        
+        return date_obj, None
+    except ValueError:
+        return None, "❌ Неверный формат даты. Используйте ДД.ММ.ГГГГ"
+
+def validate_time(time_str, date_str, venue_id=DEFAULT_VENUE_ID):
+    """Валидация времени с учетом реального времени работы заведения"""
+    if not time_str:
+        return None, "❌ Время не указано"
+    
+    try:
+        time_obj = clock(time_str)
+        day = opening_hours(date_str, venue_id)
+        if day.closed:
+            return None, closed_day_text(day)
+        
+        # Граница та же, что у кнопок времени: от открытия до последнего слота дня
+        if night_order(day.opens) <= night_order(time_obj) <= night_order(clock(day.last_slot)):
+            return time_obj, None
+        
+        # Если время не подходит
+        return None, f"❌ Ресторан работает {day.text}, последняя бронь на {day.last_slot}. Выберите время в этом интервале"
+        
+    except ValueError:
+        return None, "❌ Неверный формат времени. Используйте ЧЧ:MM"
+
+def validate_guests(guests_str):
+    """Валидация количества гостей"""
+    if not guests_str:
+        return None, "❌ Количество гостей не указано"
+        
+    try:
+        guests = int(guests_str)
+        if guests < 1:
+            return None, "❌ Количество гостей должно быть не менее 1"
+        if guests > 12:  # Исправлено с 20 на 12
+            return None, "❌ Максимальное количество гостей - 12"
+        return guests, None
+    except ValueError:
+        return None, "❌ Введите число от 1 до 12"
+
+def validate_name(name):
+    """Валидация имени"""
+    if not name:
+        return None, "❌ Имя не указано"
+        
+    name = name.strip()
+    if len(name) < 2:
+        return None, "❌ Имя должно содержать минимум 2 символа"
+    if len(name) > 50:
+        return None, "❌ Имя слишком длинное"
+    if not NAME_PATTERN.fullmatch(name):
+        return None, "❌ Имя может содержать только буквы, пробелы и дефисы"
+    return name, None
+
+def get_restaurant_hours(date_str, venue_id=DEFAULT_VENUE_ID):
+    """Получение часов работы заведения для указанной даты"""
+    try:
+        return opening_hours(date_str, venue_id).text
+    except (ValueError, TypeError):
+        venue = venues.get(venue_id)
+        return f"{venue['hours_week']}, {venue['hours_weekend']}"
+
+def is_booking_active(booking_date_str):
+    """Проверяет, является ли бронирование актуальным (не прошедшим)"""
+    try:
+        return parse_date(booking_date_str) >= datetime.date.today()
+    except (ValueError, TypeError):
+        return False
+
+# Формат хранения начала визита: сортируемая строка, сравнивается как время
+START_TS_FORMAT = '%Y-%m-%d %H:%M'
+
+def booking_start(date_str, time_str):
+    """Фактическое начало визита: время до полудня относится к следующему календарному дню"""
+    time_obj = clock(time_str)
+    start = datetime.datetime.combine(parse_date(date_str), time_obj)
+    if time_obj < datetime.time(12, 0):
+        start += timedelta(days=1)
+    return start
+
+def booking_start_ts(date_str, time_str):
+    """Начало визита в формате START_TS_FORMAT"""
+    return booking_start(date_str, time_str).strftime(START_TS_FORMAT)
+
+def format_ts(dt):
+    return dt.strftime(START_TS_FORMAT)
+
+def cleanup_user_data(user_id):
+    """Очистка данных пользователя"""
+    session = user_data.pop(user_id)
+    if session is not None:
+        delete_booking_steps(user_id, session)
+
+# === БАЗА ДАННЫХ ===
+class ConnectionPool:
+    """Ограниченный потокобезопасный пул соединений SQLite в режиме WAL"""
+    
+    PRAGMAS = (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA cache_size=-16000',
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA busy_timeout=10000',
+    )
+    
+    def __init__(self, path, size=8, cached_statements=256, attachments=None):
+        self.path = path
+        self.attachments = attachments or {}    # имя schema -> путь к файлу
+        self.size = size
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._stats_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+    
+    def _connect(self):
+        # isolation_level=None: транзакциями управляем сами (BEGIN IMMEDIATE),
+        # подготовленные выражения кэшируются на уровне соединения
+        conn = sqlite3.connect(
+            self.path,
+            timeout=10,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=self.cached_statements
+        )
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        for schema, path in self.attachments.items():
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+            conn.execute(f'PRAGMA {schema}.journal_mode=WAL')
+            conn.execute(f'PRAGMA {schema}.synchronous=NORMAL')
+        return conn
+    
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            started = time_module.monotonic()
+            self._slots.acquire()
+            waited = time_module.monotonic() - started
+            DB_POOL_WAIT_SECONDS.observe(waited)
+            with self._stats_lock:
+                self.wait_count += 1
+                self.wait_seconds += waited
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def _release(self, conn, broken=False):
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+    
+    @contextmanager
+    def connection(self):
+        """Курсор в режиме autocommit (для чтения)"""
+        started = time_module.perf_counter()
+        conn = self._acquire()
+        broken = False
+        try:
+            yield conn.cursor()
+        except sqlite3.ProgrammingError:
+            broken = True
+            raise
+        finally:
+            if not broken and conn.in_transaction:
+                conn.rollback()
+            self._release(conn, broken)
+            DB_SECONDS.observe(time_module.perf_counter() - started, 'read')
+    
+    @contextmanager
+    def transaction(self):
+        """Курсор внутри транзакции BEGIN IMMEDIATE: commit при успехе, rollback при ошибке"""
+        started = time_module.perf_counter()
+        conn = self._acquire()
+        broken = False
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            conn.commit()
+        except sqlite3.ProgrammingError:
+            broken = True
+            raise
+        finally:
+            # Неудачный commit (занято, ошибка диска) оставляет транзакцию открытой:
+            # с ней и блокировкой записи соединение в пул не возвращается
+            if not broken and conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    broken = True
+            self._release(conn, broken)
+            DB_SECONDS.observe(time_module.perf_counter() - started, 'write')
+    
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+db = ConnectionPool(DB_PATH, DB_POOL_SIZE, attachments={'archive': ARCHIVE_DB_PATH})
+
+# === МИГРАЦИИ ===
+# Номер последней примененной миграции хранится в PRAGMA user_version
+def migrate_booking_start_ts(cursor):
+    """Сортируемое время начала визита и индексы для списков и напоминаний"""
+    cursor.execute('PRAGMA table_info(bookings)')
+    columns = {row[1] for row in cursor.fetchall()}
+    if 'start_ts' not in columns:
+        cursor.execute('ALTER TABLE bookings ADD COLUMN start_ts TEXT')
+    
+    cursor.execute('SELECT id, booking_date, booking_time FROM bookings WHERE start_ts IS NULL')
+    updates = []
+    for booking_id, date_str, time_str in cursor.fetchall():
+        try:
+            updates.append((booking_start_ts(date_str, time_str), booking_id))
+        except (ValueError, TypeError):
+            logger.warning(f"⚠️ Не удалось вычислить время начала брони #{booking_id}: {date_str} {time_str}")
+    cursor.executemany('UPDATE bookings SET start_ts = ? WHERE id = ?', updates)
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookings_status_start ON bookings (status, start_ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookings_user_start ON bookings (user_id, start_ts)')
+
+def migrate_seating(cursor):
+    """Столы лаунджа и закрепление столов за бронями"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lounge_tables (
+            id INTEGER PRIMARY KEY,
+            seats INTEGER NOT NULL,
+            zone TEXT NOT NULL,
+            active INTEGER DEFAULT 1
+        )
+    ''')
+    cursor.executemany(
+        'INSERT OR IGNORE INTO lounge_tables (id, seats, zone) VALUES (?, ?, ?)',
+        [(table['id'], table['seats'], table['zone']) for table in LOUNGE_TABLES]
+    )
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS booking_tables (
+            booking_id INTEGER NOT NULL,
+            table_id INTEGER NOT NULL,
+            start_ts TEXT NOT NULL,
+            end_ts TEXT NOT NULL,
+            PRIMARY KEY (booking_id, table_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_booking_tables_end ON booking_tables (end_ts)')
+
+def migrate_sessions(cursor):
+    """Сессии незавершенных диалогов"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            namespace TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (namespace, user_id)
+        )
+    ''')
+
+def migrate_events(cursor):
+    """Журнал событий и счетчики статистики вместо admin_stats"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            old_status TEXT,
+            new_status TEXT NOT NULL,
+            day TEXT,
+            slot TEXT,
+            rating INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+    ''')
+    
+    # История переходов до журнала неизвестна: каждая запись входит одним событием с текущим статусом.
+    # Пишем в схему этого шага напрямую: record_event с тех пор знает про заведения
+    events, deltas = [], Counter()
+    cursor.execute('SELECT id, status, booking_date, booking_time FROM bookings ORDER BY id')
+    for booking_id, status, date_str, time_str in cursor.fetchall():
+        events.append(('booking', booking_id, status or 'pending', service_day(date_str), time_str, None))
+    cursor.execute('SELECT id, status, rating FROM reviews ORDER BY id')
+    for review_id, status, rating in cursor.fetchall():
+        events.append(('review', review_id, status or 'pending', None, None, rating))
+    for kind, _, status, day, slot, rating in events:
+        deltas.update(event_deltas(kind, None, status, day, slot, rating))
+    cursor.executemany(
+        'INSERT INTO events (kind, entity_id, new_status, day, slot, rating) VALUES (?, ?, ?, ?, ?, ?)', events
+    )
+    cursor.executemany(
+        'INSERT INTO stats_counters (name, key, value) VALUES (?, ?, ?)',
+        [(name, key, value) for (name, key), value in deltas.items() if value]
+    )
+    
+    cursor.execute('DROP TABLE IF EXISTS admin_stats')
+
+def migrate_staff(cursor):
+    """Персонал с ролями и сменами, захват заявок и копии уведомлений у сотрудников"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS staff (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL DEFAULT '',
+            role TEXT NOT NULL DEFAULT 'host',
+            shift_days TEXT NOT NULL DEFAULT '1234567',
+            shift_start TEXT,
+            shift_end TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO staff (user_id, role) VALUES (?, 'owner')", (ADMIN_ID,))
+    
+    cursor.execute('ALTER TABLE bookings ADD COLUMN claimed_by INTEGER')
+    cursor.execute('ALTER TABLE bookings ADD COLUMN claimed_at TEXT')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS staff_notifications (
+            booking_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            PRIMARY KEY (booking_id, chat_id, message_id)
+        ) WITHOUT ROWID
+    ''')
+
+def migrate_venues(cursor):
+    """Заведения: настройки в таблице venues, данные и счетчики каждого заведения - по venue_id"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS venues (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            address TEXT NOT NULL DEFAULT '',
+            phone TEXT NOT NULL DEFAULT '',
+            description TEXT NOT NULL DEFAULT '',
+            entertainment TEXT NOT NULL DEFAULT '',
+            hours_week TEXT NOT NULL DEFAULT '',
+            hours_weekend TEXT NOT NULL DEFAULT '',
+            opens TEXT NOT NULL,
+            closes_week TEXT NOT NULL,
+            closes_weekend TEXT NOT NULL,
+            last_slot_week TEXT NOT NULL,
+            last_slot_weekend TEXT NOT NULL,
+            weekend_days TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    venue = dict(RESTAURANT_INFO, **DEFAULT_VENUE_HOURS, id=DEFAULT_VENUE_ID, active=1)
+    cursor.execute(
+        f"INSERT OR IGNORE INTO venues ({', '.join(VENUE_FIELDS)}) VALUES ({', '.join('?' * len(VENUE_FIELDS))})",
+        [venue[field] for field in VENUE_FIELDS]
+    )
+    
+    for table in ('bookings', 'reviews', 'lounge_tables', 'events'):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN venue_id INTEGER NOT NULL DEFAULT {DEFAULT_VENUE_ID}')
+    cursor.execute('ALTER TABLE staff ADD COLUMN venue_id INTEGER')   # NULL - все заведения
+    
+    cursor.execute('''
+        CREATE TABLE stats_counters_by_venue (
+            venue_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (venue_id, name, key)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute(f'INSERT INTO stats_counters_by_venue SELECT {DEFAULT_VENUE_ID}, name, key, value FROM stats_counters')
+    cursor.execute('DROP TABLE stats_counters')
+    cursor.execute('ALTER TABLE stats_counters_by_venue RENAME TO stats_counters')
+    
+    # Списки персонала начинаются с заведения; (status, start_ts) остается для общих
+    # фоновых проходов по всем заведениям - напоминаний и архивации
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookings_venue_status_start ON bookings (venue_id, status, start_ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reviews_venue_status ON reviews (venue_id, status, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_lounge_tables_venue ON lounge_tables (venue_id)')
+
+def migrate_idempotency(cursor):
+    """Ключ сессии бронирования у брони и отметка подтверждения визита"""
+    cursor.execute('ALTER TABLE bookings ADD COLUMN idempotency_key TEXT')
+    cursor.execute('ALTER TABLE bookings ADD COLUMN visit_confirmed_at TEXT')
+    # Частичный индекс: у броней без ключа (импорт, старые записи) ограничения нет
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_bookings_idempotency_key
+        ON bookings (idempotency_key) WHERE idempotency_key IS NOT NULL
+    ''')
+
+def migrate_waitlist(cursor):
+    """Лист ожидания освободившихся столов"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            venue_id INTEGER NOT NULL DEFAULT {DEFAULT_VENUE_ID},
+            user_id INTEGER NOT NULL,
+            user_name TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            guests INTEGER NOT NULL,
+            comment TEXT NOT NULL DEFAULT '',
+            booking_date TEXT NOT NULL,
+            window_start TEXT NOT NULL,
+            window_end TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'waiting',
+            offer_start TEXT,
+            offer_expires TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_waitlist_status_end ON waitlist (status, window_end)')
+
+def migrate_schedule(cursor):
+    """Правила расписания: другие часы, особые вечера и закрытые дни"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schedule_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            venue_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            date_from TEXT NOT NULL,
+            date_to TEXT NOT NULL,
+            weekdays TEXT NOT NULL DEFAULT '1234567',
+            opens TEXT,
+            closes TEXT,
+            last_slot TEXT,
+            note TEXT NOT NULL DEFAULT '',
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_schedule_rules_venue_to ON schedule_rules (venue_id, date_to)')
+    # Вс-чт кнопки заканчивались в 23:30, хотя проверка времени пускала до закрытия в 02:00.
+    # Заведения с нетронутыми часами по умолчанию получают слоты до 01:00, как пт-сб - за час
+    cursor.execute("UPDATE venues SET last_slot_week = '01:00' WHERE last_slot_week = '23:30' AND closes_week = '02:00'")
+
+def migrate_visits(cursor):
+    """Отметки визита, депозит и счетчики надежности гостей"""
+    cursor.execute('ALTER TABLE bookings ADD COLUMN deposit_required INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('ALTER TABLE bookings ADD COLUMN visit_marked_by INTEGER')
+    cursor.execute('ALTER TABLE bookings ADD COLUMN visit_marked_at TEXT')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS guest_reliability (
+            user_id INTEGER PRIMARY KEY,
+            seated INTEGER NOT NULL DEFAULT 0,
+            no_shows INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    # Подтверждения визита уже записаны в рабочей таблице - переносим их в счетчики
+    cursor.execute('''
+        INSERT INTO guest_reliability (user_id, confirmed)
+        SELECT user_id, COUNT(*) FROM bookings WHERE visit_confirmed_at IS NOT NULL GROUP BY user_id
+    ''')
+
+MIGRATIONS = [
+    migrate_booking_start_ts,
+    migrate_seating,
+    migrate_sessions,
+    migrate_events,
+    migrate_staff,
+    migrate_venues,
+    migrate_idempotency,
+    migrate_waitlist,
+    migrate_schedule,
+    migrate_visits,
+]
+
+def apply_migrations(cursor):
+    cursor.execute('PRAGMA user_version')
+    version = cursor.fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(cursor)
+        cursor.execute(f'PRAGMA user_version = {number}')
+        logger.info(f"🛠 Применена миграция базы данных #{number}: {migration.__name__}")
+
+def init_db():
+    with db.transaction() as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bookings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                user_name TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                booking_date TEXT NOT NULL,
+                booking_time TEXT NOT NULL,
+                guests INTEGER NOT NULL,
+                comment TEXT DEFAULT '',
+                status TEXT DEFAULT 'pending',
+                admin_reply TEXT,
+                reminder_24h_sent INTEGER DEFAULT 0,
+                reminder_1h_sent INTEGER DEFAULT 0,
+                review_requested INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS admin_replies (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                booking_id INTEGER,
+                admin_id INTEGER,
+                reply_text TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reviews (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                user_name TEXT,
+                rating INTEGER,
+                review_text TEXT,
+                status TEXT DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    
+        apply_migrations(cursor)
+        ensure_archive_schema(cursor)
+    logger.info("✅ База данных инициализирована")
+
+# === СТАТИСТИКА ===
+# Журнал events - источник истины. stats_counters - материализованные счетчики,
+# которые меняются в той же транзакции, что и событие, и пересобираются из журнала
+def service_day(date_str):
+    """Дата визита ДД.ММ.ГГГГ в сортируемом виде ГГГГ-ММ-ДД"""
+    return '-'.join(reversed(date_str.split('.')))
+
+def event_deltas(kind, old_status, new_status, day=None, slot=None, rating=None):
+    """Изменения счетчиков от одного события"""
+    deltas = Counter()
+    if old_status is None:
+        deltas[(f'{kind}s_total', '')] += 1
+        if rating:
+            deltas[('rating', str(rating))] += 1
+    else:
+        deltas[(f'{kind}_status', old_status)] -= 1
+        if day:
+            deltas[(f'day_{old_status}', day)] -= 1
+        if slot:
+            deltas[(f'slot_{old_status}', slot)] -= 1
+    deltas[(f'{kind}_status', new_status)] += 1
+    deltas[(f'{kind}_entered', new_status)] += 1
+    if day:
+        deltas[(f'day_{new_status}', day)] += 1
+    if slot:
+        deltas[(f'slot_{new_status}', slot)] += 1
+    return deltas
+
+def apply_deltas(cursor, deltas, venue_id=DEFAULT_VENUE_ID):
+    cursor.executemany('''
+        INSERT INTO stats_counters (venue_id, name, key, value) VALUES (?, ?, ?, ?)
+        ON CONFLICT (venue_id, name, key) DO UPDATE SET value = value + excluded.value
+    ''', [(venue_id, name, key, value) for (name, key), value in deltas.items() if value])
+
+def record_event(cursor, kind, entity_id, old_status, new_status, day=None, slot=None, rating=None, venue_id=DEFAULT_VENUE_ID):
+    """Пишет событие в журнал и обновляет счетчики заведения; вызывается внутри транзакции"""
+    cursor.execute('''
+        INSERT INTO events (kind, entity_id, old_status, new_status, day, slot, rating, venue_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (kind, entity_id, old_status, new_status, day, slot, rating, venue_id))
+    apply_deltas(cursor, event_deltas(kind, old_status, new_status, day, slot, rating), venue_id)
+
+def transition_booking(cursor, booking_id, new_status, allowed_from):
+    """Условная смена статуса брони. Возвращает прежний статус или None,
+    если бронь не найдена или уже обработана"""
+    cursor.execute('SELECT status, booking_date, booking_time, venue_id FROM bookings WHERE id = ?', (booking_id,))
+    row = cursor.fetchone()
+    if not row or row[0] not in allowed_from:
+        return None
+    old_status, date_str, time_str, venue_id = row
+    cursor.execute('UPDATE bookings SET status = ? WHERE id = ? AND status = ?', (new_status, booking_id, old_status))
+    if cursor.rowcount != 1:
+        return None
+    record_event(cursor, 'booking', booking_id, old_status, new_status, service_day(date_str), time_str, venue_id=venue_id)
+    return old_status
+
+def transition_review(cursor, review_id, new_status, allowed_from=('pending',)):
+    """Условная смена статуса отзыва; прежний статус или None"""
+    cursor.execute('SELECT status, venue_id FROM reviews WHERE id = ?', (review_id,))
+    row = cursor.fetchone()
+    if not row or row[0] not in allowed_from:
+        return None
+    cursor.execute('UPDATE reviews SET status = ? WHERE id = ? AND status = ?', (new_status, review_id, row[0]))
+    if cursor.rowcount != 1:
+        return None
+    record_event(cursor, 'review', review_id, row[0], new_status, venue_id=row[1])
+    return row[0]
+
+def rebuild_stats():
+    """Пересчитывает все счетчики по журналу событий"""
+    totals = {}
+    with db.transaction() as cursor:
+        cursor.execute('SELECT venue_id, kind, old_status, new_status, day, slot, rating FROM events ORDER BY id')
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for venue_id, *row in rows:
+                totals.setdefault(venue_id, Counter()).update(event_deltas(*row))
+        cursor.execute('DELETE FROM stats_counters')
+        for venue_id, deltas in totals.items():
+            apply_deltas(cursor, deltas, venue_id)
+    logger.info(f"📊 Статистика пересчитана по журналу событий: {sum(map(len, totals.values()))} счетчиков")
+
+def read_stats(venue_id=DEFAULT_VENUE_ID):
+    """Снимок счетчиков заведения для панели администратора: число запросов не зависит от объема данных"""
+    today = datetime.date.today()
+    with db.connection() as cursor:
+        cursor.execute('''
+            SELECT name, key, value FROM stats_counters
+            WHERE venue_id = ? AND name IN ('bookings_total', 'booking_status', 'booking_entered', 'reviews_total', 'rating')
+        ''', (venue_id,))
+        counters = {(name, key): value for name, key, value in cursor.fetchall()}
+        
+        # Отметка «пришел» переводит бронь из approved в seated: считаем оба счетчика
+        cursor.execute(
+            "SELECT COALESCE(SUM(value), 0) FROM stats_counters WHERE venue_id = ? AND name IN ('day_approved', 'day_seated') AND key >= ?",
+            (venue_id, today.isoformat())
+        )
+        active = cursor.fetchone()[0]
+        
+        cursor.execute('''
+            SELECT key, SUM(value) FROM stats_counters
+            WHERE venue_id = ? AND name IN ('day_approved', 'day_seated') AND key >= ? AND key < ?
+            GROUP BY key HAVING SUM(value) > 0
+            ORDER BY key
+        ''', (venue_id, today.isoformat(), (today + timedelta(days=7)).isoformat()))
+        week = cursor.fetchall()
+        
+        cursor.execute('''
+            SELECT key, SUM(value) FROM stats_counters
+            WHERE venue_id = ? AND name IN ('slot_approved', 'slot_seated')
+            GROUP BY key HAVING SUM(value) > 0
+            ORDER BY 2 DESC, key LIMIT 5
+        ''', (venue_id,))
+        popular_times = cursor.fetchall()
+    
+    ratings = {rating: counters.get(('rating', str(rating)), 0) for rating in range(1, 6)}
+    rated = sum(ratings.values())
+    return {
+        'total': counters.get(('bookings_total', ''), 0),
+        'pending': counters.get(('booking_status', 'pending'), 0),
+        'active': active,
+        'approved': counters.get(('booking_entered', 'approved'), 0),
+        'rejected': counters.get(('booking_entered', 'rejected'), 0),
+        'seated': counters.get(('booking_entered', 'seated'), 0),
+        'no_show': counters.get(('booking_entered', 'no_show'), 0),
+        'reviews': counters.get(('reviews_total', ''), 0),
+        'ratings': ratings,
+        'average_rating': sum(rating * count for rating, count in ratings.items()) / rated if rated else 0,
+        'week': [('.'.join(reversed(day.split('-'))), count) for day, count in week],
+        'popular_times': popular_times,
+    }
+
+# === АРХИВ ===
+# Завершенные брони старше ARCHIVE_AFTER_DAYS переносятся из bookings в archive.bookings
+# небольшими пачками, чтобы рабочая таблица и ее индексы не росли вместе с историей.
+# Статистика считается по счетчикам и журналу событий, перенос ее не меняет;
+# экспорт читает обе таблицы.
+ARCHIVE_STATUSES = ('approved', 'rejected', 'cancelled_by_user', 'seated', 'no_show')
+ARCHIVE_BATCH = 500
+ARCHIVE_PAUSE = 0.05        # пауза между пачками, чтобы запись гостей не ждала архивацию
+ARCHIVE_INTERVAL = 3600
+
+ARCHIVED_BOOKINGS = metrics.counter('bot_archived_bookings_total', 'Брони, перенесенные в архив')
+
+def booking_columns(cursor, schema='main'):
+    cursor.execute(f'PRAGMA {schema}.table_info(bookings)')
+    return [(row[1], row[2]) for row in cursor.fetchall()]
+
+def ensure_archive_schema(cursor):
+    """Архивная таблица повторяет колонки bookings; новые колонки рабочей таблицы добавляются и в нее"""
+    cursor.execute('CREATE TABLE IF NOT EXISTS archive.bookings (id INTEGER PRIMARY KEY, archived_at TEXT NOT NULL)')
+    cursor.execute('PRAGMA main.table_info(bookings)')
+    defaults = {row[1]: row[4] for row in cursor.fetchall()}
+    existing = {name for name, _ in booking_columns(cursor, 'archive')}
+    for name, declared_type in booking_columns(cursor):
+        if name not in existing:
+            # Постоянное значение по умолчанию получают и уже перенесенные строки
+            default = defaults[name]
+            if default is not None and not default.upper().startswith('CURRENT_'):
+                declared_type += f' DEFAULT {default}'
+            cursor.execute(f'ALTER TABLE archive.bookings ADD COLUMN {name} {declared_type}')
+    cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_start ON bookings (start_ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_user_start ON bookings (user_id, start_ts)')
+
+def archive_batch(cutoff, limit=ARCHIVE_BATCH):
+    """Переносит до limit завершенных броней с началом раньше cutoff; возвращает число перенесенных.
+    
+    Копирование и удаление - две транзакции: в режиме WAL коммит в два файла не атомарен,
+    а в таком порядке сбой между ними оставит только копию, которую заменит следующий проход.
+    """
+    statuses = ', '.join('?' * len(ARCHIVE_STATUSES))
+    with db.connection() as cursor:
+        columns = ', '.join(name for name, _ in booking_columns(cursor))
+        cursor.execute(f'''
+            SELECT id FROM bookings
+            WHERE status IN ({statuses}) AND start_ts < ?
+            ORDER BY start_ts
+            LIMIT ?
+        ''', ARCHIVE_STATUSES + (format_ts(cutoff), limit))
+        booking_ids = [row[0] for row in cursor.fetchall()]
+    if not booking_ids:
+        return 0
+    
+    marks = ', '.join('?' * len(booking_ids))
+    with db.transaction() as cursor:
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO archive.bookings ({columns}, archived_at)
+            SELECT {columns}, ? FROM main.bookings WHERE id IN ({marks})
+        ''', [format_ts(datetime.datetime.now())] + booking_ids)
+    
+    with db.transaction() as cursor:
+        # Удаляем только то, что лежит в архиве в том же статусе
+        cursor.execute(f'''
+            DELETE FROM main.bookings
+            WHERE id IN ({marks})
+            AND EXISTS (
+                SELECT 1 FROM archive.bookings archived
+                WHERE archived.id = main.bookings.id AND archived.status = main.bookings.status
+            )
+        ''', booking_ids)
+        moved = cursor.rowcount
+        for table in ('booking_tables', 'staff_notifications'):
+            cursor.execute(f'''
+                DELETE FROM {table}
+                WHERE booking_id IN ({marks})
+                AND booking_id NOT IN (SELECT id FROM main.bookings WHERE id IN ({marks}))
+            ''', booking_ids + booking_ids)
+    
+    ARCHIVED_BOOKINGS.inc(amount=moved)
+    return moved
+
+def archive_old_bookings(now=None):
+    """Один проход архивации: пачки до исчерпания; возвращает число перенесенных броней"""
+    cutoff = (now or datetime.datetime.now()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+    total = 0
+    while True:
+        moved = archive_batch(cutoff)
+        total += moved
+        if moved < ARCHIVE_BATCH:
+            break
+        time_module.sleep(ARCHIVE_PAUSE)
+    if total:
+        logger.info(f"🗄 В архив перенесено броней: {total}")
+    return total
+
+def run_archiver():
+    while True:
+        try:
+            archive_old_bookings()
+        except Exception as e:
+            logger.error(f"❌ Ошибка архивации броней: {e}")
+        time_module.sleep(ARCHIVE_INTERVAL)
+
+# === ЗАВЕДЕНИЯ ===
+# Настройки всех заведений - десятки коротких строк - читаются из таблицы venues один раз
+# и держатся в памяти неизменяемым снимком, как и состав персонала. Тяжелые структуры
+# (индекс столов, свободные слоты, клавиатуры) заводятся для заведения при первом
+# обращении и выгружаются, когда к нему долго не обращаются.
+VENUE_FIELDS = (
+    'id', 'name', 'address', 'phone', 'description', 'entertainment', 'hours_week', 'hours_weekend',
+    'opens', 'closes_week', 'closes_weekend', 'last_slot_week', 'last_slot_weekend', 'weekend_days', 'active',
+)
+
+class VenueRegistry:
+    """Снимок {venue_id: dict настроек}; ключи настроек совпадают с RESTAURANT_INFO"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._venues = {DEFAULT_VENUE_ID: dict(RESTAURANT_INFO, **DEFAULT_VENUE_HOURS, id=DEFAULT_VENUE_ID, active=1)}
+    
+    def load_from_db(self):
+        with db.connection() as cursor:
+            cursor.execute(f"SELECT {', '.join(VENUE_FIELDS)} FROM venues ORDER BY id")
+            loaded = {row[0]: dict(zip(VENUE_FIELDS, row)) for row in cursor.fetchall()}
+        with self._lock:
+            self._venues = loaded
+        # Слоты и клавиатуры зависят от часов работы
+        venue_slots.cache_clear()
+        schedule.invalidate()
+        keyboards.clear()
+        logger.info(f"🏢 Заведений: {len(loaded)}, активных: {len(self.active())}")
+    
+    def get(self, venue_id):
+        """Настройки заведения; неизвестный id - первое заведение"""
+        venues = self._venues
+        return venues.get(venue_id) or venues.get(DEFAULT_VENUE_ID) or next(iter(venues.values()))
+    
+    def __contains__(self, venue_id):
+        return venue_id in self._venues
+    
+    def all(self):
+        return list(self._venues.values())
+    
+    def active(self):
+        return [venue for venue in self._venues.values() if venue['active']]
+    
+    def save(self, venue_id=None, **fields):
+        """Создает заведение (venue_id=None) или меняет поля; возвращает id"""
+        with self._lock, db.transaction() as cursor:
+            if venue_id is None:
+                base = self.get(DEFAULT_VENUE_ID)
+                copied = (*DEFAULT_VENUE_HOURS, 'hours_week', 'hours_weekend')
+                values = dict({field: base[field] for field in copied}, **fields)
+                cursor.execute(
+                    f"INSERT INTO venues ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+                    list(values.values())
+                )
+                venue_id = cursor.lastrowid
+                # Новое заведение получает типовую расстановку столов
+                cursor.executemany(
+                    'INSERT INTO lounge_tables (seats, zone, venue_id) VALUES (?, ?, ?)',
+                    [(table['seats'], table['zone'], venue_id) for table in LOUNGE_TABLES]
+                )
+            else:
+                for field, value in fields.items():
+                    cursor.execute(f'UPDATE venues SET {field} = ? WHERE id = ?', (value, venue_id))
+        self.load_from_db()
+        return venue_id
+
+venues = VenueRegistry()
+
+def current_venue(user_id):
+    """Заведение пользователя: у сотрудника заведения - его, у остальных - выбранное при /start"""
+    active = venues.active()
+    if len(active) == 1:
+        return active[0]['id']
+    member = staff.get(user_id)
+    if member is not None and member.venue_id is not None:
+        return member.venue_id
+    choice = venue_choices.get(user_id)
+    if choice is not None and choice.get('venue') in venues:
+        return choice['venue']
+    return active[0]['id'] if active else DEFAULT_VENUE_ID
+
+def choose_venue(user_id, venue_id):
+    venue_choices[user_id] = {'venue': venue_id}
+
+def venue_caption(venue_id):
+    """Подпись заведения для сообщений персоналу; пусто, пока заведение одно"""
+    return f"🏢 {venues.get(venue_id)['name']}\n" if len(venues.active()) > 1 else ''
+
+def is_weekend(venue, date_obj):
+    return str(date_obj.isoweekday()) in venue['weekend_days']
+
+# === РАСПИСАНИЕ ===
+# Часы работы дня складываются из недельных часов заведения (venues) и правил schedule_rules:
+# hours - другие часы на даты, event - особый вечер (подпись гостям и при желании свои часы),
+# closed - закрытый день (праздник, закрытое мероприятие); closed сильнее остальных, среди
+# hours и event действует последнее добавленное. Из правил заранее собирается календарь
+# на горизонт бронирования: список дней на заведение, день находится по смещению от первого.
+# Новое или удаленное правило пересчитывает только свои даты.
+SCHEDULE_KINDS = ('hours', 'event', 'closed')
+SCHEDULE_RULE_FIELDS = ('id', 'venue_id', 'kind', 'date_from', 'date_to', 'weekdays', 'opens', 'closes', 'last_slot', 'note')
+NOON = datetime.time(12, 0)
+
+OpeningHours = namedtuple(
+    'OpeningHours', 'date weekday weekend closed opens closes last_slot text note slots starts'
+)
+
+def night_order(time_obj):
+    """Ключ сравнения времени в пределах ночи: время до полудня идет после полуночи"""
+    return (time_obj < NOON, time_obj)
+
+class ScheduleCalendar:
+    """Правила расписания и собранный из них календарь дней по заведениям"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = {}   # venue_id -> [правило] в порядке id; список заменяется целиком
+        self._days = {}    # venue_id -> (toordinal первого дня, [OpeningHours] на BOOKING_HORIZON_DAYS вперед)
+        self.version = 0
+    
+    def load_from_db(self):
+        yesterday = datetime.date.today() - timedelta(days=1)
+        with db.connection() as cursor:
+            cursor.execute(
+                f"SELECT {', '.join(SCHEDULE_RULE_FIELDS)} FROM schedule_rules WHERE date_to >= ? ORDER BY id",
+                (yesterday.isoformat(),)
+            )
+            rows = cursor.fetchall()
+        rules = {}
+        for row in rows:
+            rule = self._rule(row)
+            rules.setdefault(rule['venue_id'], []).append(rule)
+        with self._lock:
+            self._rules = rules
+        self.invalidate()
+        logger.info(f"📆 Правил расписания: {len(rows)}")
+    
+    @staticmethod
+    def _rule(row):
+        rule = dict(zip(SCHEDULE_RULE_FIELDS, row))
+        rule['date_from'] = datetime.date.fromisoformat(rule['date_from'])
+        rule['date_to'] = datetime.date.fromisoformat(rule['date_to'])
+        return rule
+    
+    def invalidate(self, venue_id=None):
+        """Календарь заведения (или всех) соберется заново при следующем обращении"""
+        with self._lock:
+            if venue_id is None:
+                self._days = {}
+            else:
+                self._days.pop(venue_id, None)
+            self.version += 1
+    
+    def rules(self, venue_id):
+        return list(self._rules.get(venue_id, ()))
+    
+    def day(self, venue_id, date_obj):
+        """Расписание дня; в пределах горизонта - чтение из собранного списка"""
+        entry = self._days.get(venue_id)
+        if entry is not None:
+            offset = date_obj.toordinal() - entry[0]
+            if 0 <= offset < len(entry[1]):
+                return entry[1][offset]
+        return self._miss(venue_id, date_obj)
+    
+    def _miss(self, venue_id, date_obj):
+        today = datetime.date.today()
+        with self._lock:
+            entry = self._days.get(venue_id)
+            if entry is None or entry[0] != today.toordinal():
+                # Первое обращение или новые сутки: прошедшие дни отбрасываются,
+                # посчитанные переиспользуются, досчитываются только новые
+                base, days = entry or (today.toordinal(), [])
+                days = days[today.toordinal() - base:] if base <= today.toordinal() else []
+                days += [self._compute(venue_id, today + timedelta(days=offset))
+                         for offset in range(len(days), BOOKING_HORIZON_DAYS + 1)]
+                entry = self._days[venue_id] = (today.toordinal(), days)
+            offset = date_obj.toordinal() - entry[0]
+            if 0 <= offset < len(entry[1]):
+                return entry[1][offset]
+        # Прошедшие даты и даты за горизонтом не сохраняются
+        return self._compute(venue_id, date_obj)
+    
+    def _compute(self, venue_id, date_obj):
+        venue = venues.get(venue_id)
+        weekend = is_weekend(venue, date_obj)
+        suffix = 'weekend' if weekend else 'week'
+        opens, closes, last_slot = venue['opens'], venue[f'closes_{suffix}'], venue[f'last_slot_{suffix}']
+        text, note, closed = venue[f'hours_{suffix}'], '', False
+        weekday = date_obj.isoweekday()
+        for rule in self._rules.get(venue_id, ()):
+            if not rule['date_from'] <= date_obj <= rule['date_to'] or str(weekday) not in rule['weekdays']:
+                continue
+            if rule['kind'] == 'closed':
+                closed, note = True, rule['note']
+                break
+            if rule['opens']:
+                opens, closes, last_slot = rule['opens'], rule['closes'], rule['last_slot']
+                text = f"{opens}-{closes}"
+            if rule['note']:
+                note = rule['note']
+        
+        slots = () if closed else venue_slots(opens, last_slot)
+        starts = tuple(
+            datetime.datetime.combine(date_obj + timedelta(days=time_obj < NOON), time_obj)
+            for time_obj in map(clock, slots)
+        )
+        return OpeningHours(
+            date_obj, weekday, weekend, closed, clock(opens), clock(closes), last_slot, text, note, slots, starts
+        )
+    
+    def add_rule(self, venue_id, kind, date_from, date_to, weekdays=None,
+                 opens=None, closes=None, last_slot=None, note='', created_by=None):
+        weekdays = weekdays or WEEKDAY_DIGITS
+        with db.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO schedule_rules (venue_id, kind, date_from, date_to, weekdays, opens, closes, last_slot, note, created_by)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (venue_id, kind, date_from.isoformat(), date_to.isoformat(), weekdays, opens, closes, last_slot, note, created_by))
+            rule = self._rule((cursor.lastrowid, venue_id, kind, date_from.isoformat(), date_to.isoformat(),
+                               weekdays, opens, closes, last_slot, note))
+        with self._lock:
+            self._rules[venue_id] = self._rules.get(venue_id, []) + [rule]
+        self._refresh(venue_id, date_from, date_to)
+        return rule['id']
+    
+    def remove_rule(self, venue_id, rule_id):
+        """Удаляет правило заведения; False - не найдено"""
+        rule = next((rule for rule in self._rules.get(venue_id, ()) if rule['id'] == rule_id), None)
+        if rule is None:
+            return False
+        with db.transaction() as cursor:
+            cursor.execute('DELETE FROM schedule_rules WHERE id = ?', (rule_id,))
+        with self._lock:
+            self._rules[venue_id] = [other for other in self._rules.get(venue_id, ()) if other['id'] != rule_id]
+        self._refresh(venue_id, rule['date_from'], rule['date_to'])
+        return True
+    
+    def _refresh(self, venue_id, date_from, date_to):
+        """Пересчитывает в собранном календаре только дни правила"""
+        with self._lock:
+            entry = self._days.get(venue_id)
+            if entry is not None:
+                base, days = entry[0], list(entry[1])
+                for offset in range(max(date_from.toordinal() - base, 0), min(date_to.toordinal() - base + 1, len(days))):
+                    days[offset] = self._compute(venue_id, datetime.date.fromordinal(base + offset))
+                self._days[venue_id] = (base, days)
+            self.version += 1
+        # Свободные слоты и календари в кэше клавиатур строились по прежним часам
+        keyboards.clear()
+
+schedule = ScheduleCalendar()
+
+def opening_hours(date_str, venue_id=DEFAULT_VENUE_ID):
+    """Расписание заведения в день date_str; ValueError для неверной даты"""
+    return schedule.day(venue_id, parse_date(date_str))
+
+def closed_day_text(day):
+    return f"🚫 {day.date.strftime('%d.%m.%Y')} заведение закрыто" + (f": {day.note}" if day.note else "")
+
+# === СТОЛЫ И ДОСТУПНОСТЬ ===
+class NoSeatsAvailable(Exception):
+    """На выбранное время нет подходящих свободных столов"""
+
+class DuplicateBooking(Exception):
+    """Бронь этой сессии уже создана - повторная доставка или двойное нажатие"""
+    
+    def __init__(self, booking_id):
+        super().__init__(booking_id)
+        self.booking_id = booking_id
+
+SEATING_VERSIONS = itertools.count(1)   # версии индексов не повторяются и после перезагрузки
+
+def slot_minute(dt):
+    """Минуты от начала эпохи datetime: не зависят от часового пояса"""
+    return dt.toordinal() * 1440 + dt.hour * 60 + dt.minute
+
+class SeatingPlan:
+    """Индекс занятости столов.
+    
+    Для каждого стола хранится отсортированный список непересекающихся
+    интервалов (начало, конец, бронь) в минутах, поэтому проверка свободен ли
+    стол - один bisect. Все изменения выполняются под self.lock.
+    """
+    
+    def __init__(self, venue_id=DEFAULT_VENUE_ID):
+        self.venue_id = venue_id
+        self.lock = threading.RLock()
+        self.tables = []
+        self._busy = {}
+        self._bookings = {}
+        self.version = next(SEATING_VERSIONS)
+    
+    def load_tables(self, tables):
+        with self.lock:
+            self.tables = sorted(tables, key=lambda table: (table['seats'], table['id']))
+            for table in self.tables:
+                self._busy.setdefault(table['id'], [])
+            self.version = next(SEATING_VERSIONS)
+    
+    def _is_free(self, table_id, start, end, ignore=None):
+        intervals = self._busy[table_id]
+        index = bisect.bisect_left(intervals, (end,))
+        # Интервалы стола не пересекаются: у брони ignore на столе не больше одного
+        if index and intervals[index - 1][2] == ignore:
+            index -= 1
+        return index == 0 or intervals[index - 1][1] <= start
+    
+    def find_tables(self, guests, start_dt, ignore=None):
+        """Подбор стола или группы сдвигаемых столов одной зоны с минимумом лишних мест.
+        Столы брони ignore считаются свободными - так перенос не мешает сам себе"""
+        start = slot_minute(start_dt)
+        end = slot_minute(start_dt + BOOKING_DURATION)
+        with self.lock:
+            free = [table for table in self.tables if self._is_free(table['id'], start, end, ignore)]
+            
+            for table in free:
+                if table['seats'] >= guests:
+                    return [table['id']]
+            
+            best = None
+            zones = {}
+            for table in free:
+                zones.setdefault(table['zone'], []).append(table)
+            for zone_tables in zones.values():
+                chosen = []
+                seats = 0
+                for table in reversed(zone_tables):
+                    chosen.append(table)
+                    seats += table['seats']
+                    if seats >= guests:
+                        break
+                if seats >= guests and (best is None or (seats, len(chosen)) < best[0]):
+                    best = ((seats, len(chosen)), [table['id'] for table in chosen])
+            return best[1] if best else None
+    
+    def can_seat(self, guests, start_dt):
+        return self.find_tables(guests, start_dt) is not None
+    
+    def reserve(self, booking_id, table_ids, start_dt):
+        start = slot_minute(start_dt)
+        end = slot_minute(start_dt + BOOKING_DURATION)
+        with self.lock:
+            for table_id in table_ids:
+                bisect.insort(self._busy[table_id], (start, end, booking_id))
+            self._bookings[booking_id] = (tuple(table_ids), start, end)
+            self.version = next(SEATING_VERSIONS)
+    
+    def release(self, booking_id):
+        with self.lock:
+            reserved = self._bookings.pop(booking_id, None)
+            if not reserved:
+                return
+            table_ids, start, end = reserved
+            for table_id in table_ids:
+                intervals = self._busy.get(table_id, [])
+                index = bisect.bisect_left(intervals, (start, end, booking_id))
+                if index < len(intervals) and intervals[index] == (start, end, booking_id):
+                    del intervals[index]
+            self.version = next(SEATING_VERSIONS)
+    
+    def prune(self, before_dt):
+        """Удаляет закончившиеся интервалы, чтобы индекс не рос бесконечно"""
+        border = slot_minute(before_dt)
+        with self.lock:
+            finished = [booking_id for booking_id, (_, _, end) in self._bookings.items() if end <= border]
+            for booking_id in finished:
+                self.release(booking_id)
+    
+    def load_from_db(self):
+        """Загрузка столов и будущих закреплений заведения; брони без столов размещаются повторно"""
+        now = datetime.datetime.now()
+        with db.connection() as cursor:
+            cursor.execute('SELECT id, seats, zone FROM lounge_tables WHERE venue_id = ? AND active = 1', (self.venue_id,))
+            tables = [{'id': row[0], 'seats': row[1], 'zone': row[2]} for row in cursor.fetchall()]
+            cursor.execute('''
+                SELECT bt.booking_id, bt.table_id, bt.start_ts
+                FROM bookings b
+                JOIN booking_tables bt ON bt.booking_id = b.id
+                WHERE b.venue_id = ? AND b.status IN ('pending', 'approved', 'seated') AND b.start_ts > ? AND bt.end_ts > ?
+            ''', (self.venue_id, format_ts(now - BOOKING_DURATION), format_ts(now)))
+            assigned = cursor.fetchall()
+            cursor.execute('''
+                SELECT id, guests, start_ts FROM bookings
+                WHERE venue_id = ? AND status IN ('pending', 'approved', 'seated') AND start_ts > ?
+                AND id NOT IN (SELECT booking_id FROM booking_tables)
+                ORDER BY start_ts, id
+            ''', (self.venue_id, format_ts(now - BOOKING_DURATION)))
+            unassigned = cursor.fetchall()
+        
+        with self.lock:
+            self._busy = {}
+            self._bookings = {}
+            self.load_tables(tables)
+            
+            grouped = {}
+            for booking_id, table_id, start_ts in assigned:
+                grouped.setdefault((booking_id, start_ts), []).append(table_id)
+            for (booking_id, start_ts), table_ids in grouped.items():
+                table_ids = [table_id for table_id in table_ids if table_id in self._busy]
+                self.reserve(booking_id, table_ids, datetime.datetime.strptime(start_ts, START_TS_FORMAT))
+            
+            for booking_id, guests, start_ts in unassigned:
+                start_dt = datetime.datetime.strptime(start_ts, START_TS_FORMAT)
+                table_ids = self.find_tables(guests, start_dt)
+                if not table_ids:
+                    logger.warning(f"⚠️ Для брони #{booking_id} не нашлось свободных столов")
+                    continue
+                with db.transaction() as cursor:
+                    assign_tables(cursor, booking_id, table_ids, start_dt)
+                self.reserve(booking_id, table_ids, start_dt)
+        
+        logger.info(f"🪑 Заведение {self.venue_id}: столов {len(tables)}, закрепленных броней {len(self._bookings)}")
+
+class SeatingRegistry:
+    """Индексы столов по заведениям.
+    
+    Индекс заведения загружается из БД при первом обращении и выгружается через
+    SEATING_IDLE_TTL без обращений: память растет с числом заведений, где сейчас
+    бронируют, а не с общим числом заведений. Источник истины - booking_tables.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._plans = {}
+        self._used = {}
+    
+    def plan(self, venue_id=DEFAULT_VENUE_ID):
+        self._used[venue_id] = time_module.monotonic()
+        plan = self._plans.get(venue_id)
+        if plan is not None:
+            return plan
+        with self._lock:
+            plan = self._plans.get(venue_id)
+            if plan is None:
+                plan = SeatingPlan(venue_id)
+                plan.load_from_db()
+                self._plans[venue_id] = plan
+        return plan
+    
+    def __len__(self):
+        return len(self._plans)
+    
+    def release(self, booking_id):
+        """Освобождает столы брони в том индексе, где она есть"""
+        for plan in list(self._plans.values()):
+            plan.release(booking_id)
+    
+    def prune(self, before_dt):
+        """Чистит закончившиеся интервалы и выгружает индексы заведений без обращений"""
+        idle_since = time_module.monotonic() - SEATING_IDLE_TTL
+        for venue_id, plan in list(self._plans.items()):
+            if self._used.get(venue_id, 0) < idle_since:
+                with self._lock, plan.lock:
+                    del self._plans[venue_id]
+                    self._used.pop(venue_id, None)
+                logger.info(f"🪑 Индекс столов заведения {venue_id} выгружен")
+            else:
+                plan.prune(before_dt)
+    
+    def load_from_db(self):
+        """Перечитывает уже загруженные индексы и индекс первого заведения"""
+        with self._lock:
+            venue_ids = set(self._plans) | {DEFAULT_VENUE_ID}
+            self._plans = {}
+        for venue_id in sorted(venue_ids):
+            self.plan(venue_id)
+
+seating = SeatingRegistry()
+metrics.gauge('bot_seating_plans', 'Загруженных индексов столов', lambda: len(seating))
+
+def assign_tables(cursor, booking_id, table_ids, start_dt):
+    cursor.executemany(
+        'INSERT OR REPLACE INTO booking_tables (booking_id, table_id, start_ts, end_ts) VALUES (?, ?, ?, ?)',
+        [(booking_id, table_id, format_ts(start_dt), format_ts(start_dt + BOOKING_DURATION)) for table_id in table_ids]
+    )
+
+def release_tables(cursor, booking_id):
+    """Освобождение столов в БД; индекс обновляется через seating.release после коммита"""
+    cursor.execute('DELETE FROM booking_tables WHERE booking_id = ?', (booking_id,))
+
+# === ПЕРСОНАЛ ===
+# Состав персонала хранится в таблице staff. В памяти - снимок {user_id: StaffMember}, который
+# при изменениях собирается заново и подменяется целиком: проверки прав в обработчиках
+# читают его без блокировок. Новые заявки получают все, кто на смене; ответственный за
+# заявку выбирается по её номеру, поэтому поток заявок делится между сотрудниками поровну.
+# Сотрудник с venue_id работает только с заявками своего заведения, без него - со всеми.
+STAFF_PERMISSIONS = {
+    'owner': frozenset({'moderate', 'reports', 'staff'}),
+    'manager': frozenset({'moderate', 'reports'}),
+    'host': frozenset({'moderate'}),
+}
+STAFF_ROLE_TITLES = {'owner': '👑 Владелец', 'manager': '🧑‍💼 Менеджер', 'host': '🙋 Хостес'}
+WEEKDAY_DIGITS = '1234567'   # 1 - понедельник
+
+class StaffMember:
+    __slots__ = ('user_id', 'name', 'role', 'days', 'shift_start', 'shift_end', 'venue_id')
+    
+    def __init__(self, user_id, name, role, days, shift_start, shift_end, venue_id=None):
+        self.user_id = user_id
+        self.venue_id = venue_id
+        self.name = name
+        self.role = role
+        self.days = days
+        self.shift_start = datetime.datetime.strptime(shift_start, '%H:%M').time() if shift_start else None
+        self.shift_end = datetime.datetime.strptime(shift_end, '%H:%M').time() if shift_end else None
+    
+    @property
+    def title(self):
+        return self.name or str(self.user_id)
+    
+    def can(self, permission):
+        return permission in STAFF_PERMISSIONS.get(self.role, ())
+    
+    def serves(self, venue_id):
+        return self.venue_id is None or self.venue_id == venue_id
+    
+    def on_shift(self, now):
+        """Смена может переходить через полночь: 18:00-02:00 в пятницу захватывает ночь на субботу"""
+        weekday = str(now.isoweekday())
+        if self.shift_start is None or self.shift_end is None:
+            return weekday in self.days
+        moment = now.time()
+        if self.shift_start < self.shift_end:
+            return weekday in self.days and self.shift_start <= moment < self.shift_end
+        yesterday = str((now - timedelta(days=1)).isoweekday())
+        return (weekday in self.days and moment >= self.shift_start) or (yesterday in self.days and moment < self.shift_end)
+    
+    def describe(self):
+        days = ''.join(self.days) if self.days != WEEKDAY_DIGITS else 'ежедневно'
+        hours = f"{self.shift_start:%H:%M}-{self.shift_end:%H:%M}" if self.shift_start else 'весь день'
+        name = f" {self.name}" if self.name else ''
+        venue = f" · 🏢 {venues.get(self.venue_id)['name']}" if self.venue_id is not None else ''
+        return f"{STAFF_ROLE_TITLES.get(self.role, self.role)}{name} · 🆔 {self.user_id} · {days} {hours}{venue}"
+
+class StaffRoster:
+    """Индекс персонала: чтение - из неизменяемого снимка, запись - в БД с пересборкой снимка"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._members = {ADMIN_ID: StaffMember(ADMIN_ID, '', 'owner', WEEKDAY_DIGITS, None, None)}
+    
+    def load_from_db(self):
+        with db.connection() as cursor:
+            cursor.execute('SELECT user_id, name, role, shift_days, shift_start, shift_end, venue_id FROM staff')
+            members = {row[0]: StaffMember(*row) for row in cursor.fetchall()}
+        with self._lock:
+            self._members = members
+        logger.info(f"👥 Персонал: {len(members)}")
+    
+    def __len__(self):
+        return len(self._members)
+    
+    def get(self, user_id):
+        return self._members.get(user_id)
+    
+    def members(self):
+        return sorted(self._members.values(), key=lambda member: (member.role != 'owner', member.role, member.user_id))
+    
+    def is_staff(self, user_id):
+        return user_id in self._members
+    
+    def can(self, user_id, permission, venue_id=None):
+        """Право сотрудника; с venue_id - еще и в этом заведении"""
+        member = self._members.get(user_id)
+        return member is not None and member.can(permission) and (venue_id is None or member.serves(venue_id))
+    
+    def title(self, user_id):
+        member = self._members.get(user_id)
+        return member.title if member else str(user_id)
+    
+    def on_duty(self, permission='moderate', now=None, venue_id=None):
+        """id сотрудников на смене с нужным правом; если смена пуста - владельцы.
+        С venue_id - только те, кто работает с этим заведением"""
+        now = now or datetime.datetime.now()
+        members = [
+            member for member in self._members.values()
+            if member.can(permission) and (venue_id is None or member.serves(venue_id))
+        ]
+        on_shift = sorted(member.user_id for member in members if member.on_shift(now))
+        return on_shift or sorted(member.user_id for member in members if member.role == 'owner')
+    
+    def responsible(self, booking_id, on_duty):
+        """Ответственный за заявку: заявки распределяются по сотрудникам смены по кругу"""
+        return on_duty[booking_id % len(on_duty)] if on_duty else None
+    
+    def save(self, user_id, **fields):
+        """Добавляет сотрудника или меняет его поля; снимок пересобирается после коммита"""
+        with self._lock, db.transaction() as cursor:
+            cursor.execute('INSERT OR IGNORE INTO staff (user_id) VALUES (?)', (user_id,))
+            for field, value in fields.items():
+                cursor.execute(f'UPDATE staff SET {field} = ? WHERE user_id = ?', (value, user_id))
+        self.load_from_db()
+    
+    def remove(self, user_id):
+        with self._lock, db.transaction() as cursor:
+            cursor.execute('DELETE FROM staff WHERE user_id = ?', (user_id,))
+            removed = cursor.rowcount
+        self.load_from_db()
+        return removed > 0
+
+staff = StaffRoster()
+metrics.gauge('bot_staff_on_duty', 'Сотрудников на смене', lambda: len(staff.on_duty()))
+
+def notify_staff(text, booking_id=None, permission='moderate', reply_markup=None, on_duty=None, venue_id=None, **kwargs):
+    """Рассылка сотрудникам смены заведения. Со звуком - только ответственному за заявку,
+    остальным - тихо. id сообщений о заявках сохраняются, чтобы потом обновить все копии"""
+    on_duty = on_duty if on_duty is not None else staff.on_duty(permission, venue_id=venue_id)
+    responsible = staff.responsible(booking_id, on_duty) if booking_id else None
+    for chat_id in on_duty:
+        future = queue_message(
+            chat_id, text, reply_markup=reply_markup, priority=PRIORITY_NORMAL,
+            disable_notification=responsible is not None and chat_id != responsible, **kwargs
+        )
+        if booking_id and reply_markup is not None:
+            future.add_done_callback(functools.partial(remember_staff_notification, booking_id))
+    return responsible
+
+def remember_staff_notification(booking_id, future):
+    message = future.result()
+    if message is None:
+        return
+    with db.transaction() as cursor:
+        cursor.execute(
+            'INSERT OR IGNORE INTO staff_notifications (booking_id, chat_id, message_id) VALUES (?, ?, ?)',
+            (booking_id, message.chat.id, message.message_id)
+        )
+
+def update_staff_notifications(booking_ids, reply_markup, exclude=None):
+    """Меняет клавиатуру у всех копий уведомлений о заявках.
+    Копии хранятся, пока бронь не уйдет в архив: поздняя смена решения тоже их обновит"""
+    booking_ids = list(booking_ids)
+    copies = []
+    with db.connection() as cursor:
+        for start in range(0, len(booking_ids), 500):
+            chunk = booking_ids[start:start + 500]
+            cursor.execute(
+                f"SELECT chat_id, message_id FROM staff_notifications WHERE booking_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            copies.extend(cursor.fetchall())
+    
+    for chat_id, message_id in copies:
+        if (chat_id, message_id) == exclude:
+            continue
+        outbound.submit(
+            chat_id, bot.edit_message_reply_markup, chat_id, message_id,
+            reply_markup=reply_markup, priority=PRIORITY_NORMAL
+        )
+
+def claim_booking(cursor, booking_id, staff_id, now=None, statuses=None):
+    """Захват заявки сотрудником одним условным UPDATE (compare-and-set).
+    
+    Удается, если заявка ничья, уже захвачена этим сотрудником или захват старше CLAIM_TTL.
+    Решение тоже оставляет захват за сотрудником: коллега со старой копией уведомления
+    не перерешит бронь сразу следом, а сам автор может передумать. Сотрудник заведения
+    не захватит заявку чужого заведения. С statuses захват ставится, только если статус
+    брони из этого списка - решение, которое не применится, захват не оставит.
+    """
+    now = now or datetime.datetime.now()
+    member = staff.get(staff_id)
+    venue_id = member.venue_id if member is not None else None
+    status_filter = f"AND status IN ({', '.join('?' * len(statuses))})" if statuses else ''
+    cursor.execute(f'''
+        UPDATE bookings SET claimed_by = ?, claimed_at = ?
+        WHERE id = ? AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?)
+        AND (? IS NULL OR venue_id = ?) {status_filter}
+    ''', (staff_id, format_ts(now), booking_id, staff_id, format_ts(now - CLAIM_TTL), venue_id, venue_id, *(statuses or ())))
+    return cursor.rowcount == 1
+
+# === КЛАВИАТУРЫ ===
+# Разметки отдаются готовой JSON-строкой: telebot передает строку в API без пересборки
+class KeyboardCache:
+    """Ограниченный LRU-кэш готовых клавиатур и свободных слотов; очищается при смене даты"""
+    
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._day = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _check_day(self):
+        today = datetime.date.today()
+        if today != self._day:
+            self._items.clear()
+            self._day = today
+        return today
+    
+    def get_or_build(self, key, build):
+        with self._lock:
+            self._check_day()
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        
+        value = build()
+        with self._lock:
+            self._items[key] = value
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+    
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+keyboards = KeyboardCache()
+
+def build_main_menu(is_admin):
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
+    keyboard.add(KeyboardButton('📅 Забронировать стол'), KeyboardButton('📋 Мои брони'))
+    keyboard.add(KeyboardButton('📞 Контакты'), KeyboardButton('⭐ Оставить отзыв'))
+    
+    # Кнопка "Панель администратора" только для админа
+    if is_admin:
+        keyboard.add(KeyboardButton('👑 Панель администратора'))
+    
+    return keyboard
+
+def build_admin_menu():
+    """Меню администратора"""
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
+    keyboard.add(KeyboardButton('⏳ Ожидающие заявки'), KeyboardButton('☑️ Пакетная модерация'))
+    keyboard.add(KeyboardButton('✅ Актуальные бронирования'), KeyboardButton('❌ Отклоненные заявки'))
+    keyboard.add(KeyboardButton('💬 Отзывы на модерации'), KeyboardButton('📈 Общая статистика'))
+    keyboard.add(KeyboardButton('🔙 В главное меню'))
+    return keyboard
+
+def build_cancel_keyboard():
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
+    keyboard.add(KeyboardButton('❌ Отмена бронирования'))
+    return keyboard
+
+def build_skip_comment_keyboard():
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
+    keyboard.add(KeyboardButton('➡️ Пропустить комментарий'))
+    keyboard.add(KeyboardButton('❌ Отмена бронирования'))
+    return keyboard
+
+def build_back_or_cancel_keyboard():
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
+    keyboard.add(KeyboardButton('🔙 Назад к календарю'))
+    keyboard.add(KeyboardButton('❌ Отмена бронирования'))
+    return keyboard
+
+# Постоянные меню сериализуются один раз
+@functools.lru_cache(maxsize=None)
+def _static_keyboard(name, *args):
+    return STATIC_KEYBOARDS[name](*args).to_json()
+
+STATIC_KEYBOARDS = {
+    'main': build_main_menu,
+    'admin': build_admin_menu,
+    'cancel': build_cancel_keyboard,
+    'skip_comment': build_skip_comment_keyboard,
+    'back_or_cancel': build_back_or_cancel_keyboard,
+}
+
+def main_menu(user_id=None):
+    return _static_keyboard('main', staff.is_staff(user_id))
+
+def admin_menu():
+    return _static_keyboard('admin')
+
+def cancel_keyboard():
+    return _static_keyboard('cancel')
+
+def skip_comment_keyboard():
+    return _static_keyboard('skip_comment')
+
+def back_or_cancel_keyboard():
+    return _static_keyboard('back_or_cancel')
+
+# === КАЛЕНДАРЬ И ВРЕМЯ ===
+def generate_calendar(year=None, month=None, venue_id=DEFAULT_VENUE_ID):
+    today = datetime.date.today()
+    if year is None:
+        year = today.year
+    if month is None:
+        month = today.month
+    return keyboards.get_or_build(
+        ('calendar', venue_id, year, month, today),
+        lambda: build_calendar(year, month, today, venue_id).to_json()
+    )
+
+def build_calendar(year, month, today, venue_id=DEFAULT_VENUE_ID):
+    keyboard = InlineKeyboardMarkup()
+    
+    month_name = get_month_name(month)
+    row = []
+    row.append(InlineKeyboardButton("◀️", callback_data=f"calendar_prev_{year}_{month}"))
+    row.append(InlineKeyboardButton(f"{month_name} {year}", callback_data="ignore"))
+    row.append(InlineKeyboardButton("▶️", callback_data=f"calendar_next_{year}_{month}"))
+    keyboard.row(*row)
+    
+    days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+    keyboard.row(*[InlineKeyboardButton(day, callback_data="ignore") for day in days])
+    
+    month_days = get_month_days(year, month)
+    
+    for week in month_days:
+        row = []
+        for day in week:
+            if day == 0:
+                row.append(InlineKeyboardButton(" ", callback_data="ignore"))
+            else:
+                date_str = f"{day:02d}.{month:02d}.{year}"
+                date_obj = datetime.date(year, month, day)
+                
+                if date_obj < today:
+                    row.append(InlineKeyboardButton(f"❌", callback_data="ignore"))
+                elif schedule.day(venue_id, date_obj).closed:
+                    # Нажатие покажет причину
+                    row.append(InlineKeyboardButton("🚫", callback_data=f"calendar_day_{date_str}"))
+                else:
+                    day_str = f"{day}"
+                    if date_obj == today:
+                        day_str = f"📍{day}"
+                    row.append(InlineKeyboardButton(day_str, callback_data=f"calendar_day_{date_str}"))
+        keyboard.row(*row)
+    
+    keyboard.row(InlineKeyboardButton("❌ Отмена", callback_data="calendar_cancel"))
+    return keyboard
+
+def get_month_name(month):
+    months = [
+        "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+        "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
+    ]
+    return months[month - 1]
+
+def get_month_days(year, month):
+    first_day = datetime.date(year, month, 1)
+    last_day = datetime.date(year, month + 1, 1) - timedelta(days=1) if month < 12 else datetime.date(year + 1, 1, 1) - timedelta(days=1)
+    
+    first_weekday = (first_day.weekday()) % 7
+    days = []
+    current_day = 1
+    
+    for week in range(6):
+        week_days = []
+        for day in range(7):
+            if (week == 0 and day < first_weekday) or current_day > last_day.day:
+                week_days.append(0)
+            else:
+                week_days.append(current_day)
+                current_day += 1
+        days.append(week_days)
+        if current_day > last_day.day:
+            break
+    return days
+
+# Слоты по получасам от открытия до последнего слота дня (по умолчанию вс-чт до 01:00,
+# пт-сб до 02:00); время до полудня - уже следующая ночь
+@functools.lru_cache(maxsize=64)
+def venue_slots(opens, last_slot):
+    start = datetime.datetime.combine(datetime.date.min, clock(opens))
+    end = datetime.datetime.combine(datetime.date.min + timedelta(days=clock(last_slot) < datetime.time(12, 0)), clock(last_slot))
+    slots = []
+    while start <= end:
+        slots.append(start.strftime('%H:%M'))
+        start += timedelta(minutes=30)
+    return tuple(slots)
+
+def booking_time_slots(date_str, venue_id=DEFAULT_VENUE_ID):
+    """Все слоты бронирования для даты по расписанию заведения"""
+    return slot_starts(date_str, venue_id)[0]
+
+def slot_starts(date_str, venue_id=DEFAULT_VENUE_ID):
+    """Слоты даты и фактическое начало каждого, по возрастанию"""
+    try:
+        day = opening_hours(date_str, venue_id)
+    except ValueError:
+        return (), ()
+    return day.slots, day.starts
+
+def available_times(date_str, guests=1, venue_id=DEFAULT_VENUE_ID):
+    """Слоты, на которые еще есть подходящий свободный стол.
+    
+    Результат переиспользуется, пока не изменилась занятость столов
+    заведения (plan.version) и не наступил очередной слот.
+    """
+    plan = seating.plan(venue_id)
+    slots, starts = slot_starts(date_str, venue_id)
+    first = bisect.bisect_right(starts, datetime.datetime.now())
+    
+    def compute():
+        return tuple(slots[i] for i in range(first, len(slots)) if plan.can_seat(guests, starts[i]))
+    
+    return keyboards.get_or_build(('times', venue_id, date_str, guests, plan.version, first), compute)
+
+def generate_time_buttons(date_str, venue_id=DEFAULT_VENUE_ID):
+    # Сетка зависит только от набора свободных слотов и общая для всех дат с таким набором
+    times = available_times(date_str, venue_id=venue_id)
+    return keyboards.get_or_build(('time_grid', times), lambda: build_time_buttons(times).to_json())
+
+def build_time_buttons(times):
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, row_width=4)
+    
+    for i in range(0, len(times), 4):
+        row = [KeyboardButton(time) for time in times[i:i+4]]
+        keyboard.add(*row)
+    
+    keyboard.add(KeyboardButton('🔙 Назад к календарю'))
+    keyboard.add(KeyboardButton('❌ Отмена бронирования'))
+    return keyboard
+
+# === МАРШРУТИЗАЦИЯ ===
+class Router:
+    """Таблицы маршрутов: команда, точный текст кнопки, шаг диалога, префикс callback.
+    
+    Выбор обработчика - несколько поисков в словарях, число маршрутов на него не влияет.
+    Кнопки проверяются раньше шагов диалога, поэтому «❌ Отмена бронирования»
+    и «🔙 Назад к календарю» срабатывают на любом шаге.
+    """
+    
+    MAX_CALLBACK_ARGS = 2   # calendar_prev_2025_1: префикс и до двух аргументов
+    
+    def __init__(self, state_of):
+        self.state_of = state_of
+        self.commands = {}
+        self.texts = {}       # текст кнопки -> (обработчик, только для администратора)
+        self.states = {}
+        self.callbacks = {}
+    
+    def command(self, name):
+        def register(handler):
+            self.commands[name] = handler
+            return handler
+        return register
+    
+    def text(self, *texts, admin_only=False):
+        def register(handler):
+            for text in texts:
+                self.texts[text] = (handler, admin_only)
+            return handler
+        return register
+    
+    def state(self, key):
+        def register(handler):
+            self.states[key] = handler
+            return handler
+        return register
+    
+    def callback(self, *prefixes):
+        def register(handler):
+            for prefix in prefixes:
+                self.callbacks[prefix] = handler
+            return handler
+        return register
+    
+    def resolve_message(self, message):
+        text = message.text or ''
+        if text.startswith('/'):
+            command = text.split(maxsplit=1)[0][1:].split('@', 1)[0]
+            return self.commands.get(command)
+        
+        route = self.texts.get(text)
+        if route and (not route[1] or staff.is_staff(message.from_user.id)):
+            return route[0]
+        
+        state = self.state_of(message.from_user.id)
+        return self.states.get(state) if state is not None else None
+    
+    def resolve_callback(self, data):
+        handler = self.callbacks.get(data)
+        parts = data
+        for _ in range(self.MAX_CALLBACK_ARGS):
+            if handler is not None or '_' not in parts:
+                break
+            parts = parts.rsplit('_', 1)[0]
+            handler = self.callbacks.get(parts)
+        return handler
+    
+    def run(self, kind, handler, update):
+        """Вызывает обработчик и пишет его время в метрики под именем функции"""
+        started = time_module.perf_counter()
+        try:
+            handler(update)
+        except Exception:
+            HANDLER_ERRORS.inc(kind, handler.__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time_module.perf_counter() - started, kind, handler.__name__)
+    
+    def dispatch_message(self, message):
+        with user_lock(message.from_user.id):
+            handler = self.resolve_message(message)
+            if handler is not None:
+                self.run('message', handler, message)
+    
+    def dispatch_callback(self, call):
+        try:
+            if not call.data:
+                bot.answer_callback_query(call.id, "❌ Ошибка данных")
+                return
+            
+            handler = self.resolve_callback(call.data)
+            if handler is None:
+                bot.answer_callback_query(call.id, "❌ Неизвестная команда")
+                return
+            
+            with user_lock(call.from_user.id):
+                self.run('callback', handler, call)
+        except Exception as e:
+            logger.error(f"❌ Ошибка в обработчике callback: {e}")
+            try:
+                bot.answer_callback_query(call.id, "❌ Произошла ошибка")
+            except:
+                pass
+
+def conversation_state(user_id):
+    """Ключ маршрута для текущего диалога пользователя"""
+    state = booking_state(user_id)
+    if state is not None:
+        return state
+    if staff.is_staff(user_id):
+        if AdminStates.get_booking_reply_mode(user_id) is not None:
+            return 'admin_booking_reply'
+        if AdminStates.get_review_reply_mode(user_id) is not None:
+            return 'admin_review_reply'
+    if user_id in review_data:
+        return 'review'
+    return None
+
+router = Router(conversation_state)
+
+class RecentIds:
+    """Ограниченное множество недавно обработанных идентификаторов"""
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def add(self, key):
+        """Добавляет ключ; False если он уже был"""
+        with self._lock:
+            if key in self._ids:
+                return False
+            self._ids[key] = True
+            if len(self._ids) > self.limit:
+                self._ids.popitem(last=False)
+            return True
+    
+    def discard(self, key):
+        with self._lock:
+            self._ids.pop(key, None)
+
+# Во всех режимах приема (polling после перезапуска, webhook) одно и то же сообщение
+# или нажатие может прийти повторно; второй раз оно отсекается поиском в памяти
+recent_messages = RecentIds(RECENT_IDS_LIMIT)
+recent_callbacks = RecentIds(RECENT_IDS_LIMIT)
+
+@bot.message_handler(func=lambda message: True)
+def route_message(message):
+    if not recent_messages.add((message.chat.id, message.message_id)):
+        DUPLICATE_UPDATES.inc('message')
+        return
+    router.dispatch_message(message)
+
+@bot.callback_query_handler(func=lambda call: True)
+def route_callback(call):
+    if not recent_callbacks.add(call.id):
+        DUPLICATE_UPDATES.inc('callback')
+        return
+    router.dispatch_callback(call)
+
+@router.callback('ignore')
+def ignore_callback(call):
+    bot.answer_callback_query(call.id)
+
+# === СИСТЕМА БРОНИРОВАНИЯ ===
+@router.text('📅 Забронировать стол')
+def start_booking(message):
+    user_id = message.from_user.id
+    
+    # Персонал не может бронировать
+    if staff.is_staff(user_id):
+        queue_message(
+            message.chat.id, 
+            "⛔ *Администратор не может бронировать столы через бота*\n\n"
+            "Для тестирования функционала используйте тестовый аккаунт.",
+            reply_markup=main_menu(message.from_user.id),
+            parse_mode='Markdown'
+        )
+        return
+    
+    cleanup_user_data(user_id)
+    
+    venue_id = current_venue(user_id)
+    user_data[user_id] = {
+        'state': BookingState.DATE,
+        'venue': venue_id,
+        'key': secrets.token_hex(8),   # ключ идемпотентности: одна сессия - не больше одной брони
+        'booking_steps': [],
+        'last_activity': time_module.time()
+    }
+    
+    calendar = generate_calendar(venue_id=venue_id)
+    msg = safe_send_message(
+        message.chat.id,
+        venue_caption(venue_id) +
+        "🍝 *Начнем бронирование столика!*\n\n"
+        "📅 **Шаг 1 из 6:** Выберите дату посещения\n"
+        "• Используйте стрелки для навигации\n• 📍 Сегодняшний день\n• ❌ Недоступные даты\n• 🚫 Заведение закрыто",
+        reply_markup=calendar,
+        parse_mode='Markdown'
+    )
+    
+    remember_step(user_id, msg)
+
+@router.callback('calendar_prev', 'calendar_next', 'calendar_day', 'calendar_cancel')
+def handle_calendar_callback(call):
+    """Обработка callback календаря"""
+    try:
+        if staff.is_staff(call.from_user.id):
+            bot.answer_callback_query(call.id, "⛔ Администратор не может бронировать столы")
+            return
+        
+        data = call.data
+        
+        if data == 'calendar_cancel':
+            safe_delete_message(call.message.chat.id, call.message.message_id)
+            queue_message(call.message.chat.id, "❌ Выбор даты отменен", reply_markup=main_menu(call.from_user.id))
+            return
+        
+        elif data.startswith('calendar_prev_'):
+            _, _, year, month = data.split('_')
+            year, month = int(year), int(month)
+            if month == 1:
+                year -= 1
+                month = 12
+            else:
+                month -= 1
+            new_calendar = generate_calendar(year, month, user_data.get(call.from_user.id, {}).get('venue', DEFAULT_VENUE_ID))
+            bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=new_calendar)
+        
+        elif data.startswith('calendar_next_'):
+            _, _, year, month = data.split('_')
+            year, month = int(year), int(month)
+            if month == 12:
+                year += 1
+                month = 1
+            else:
+                month += 1
+            new_calendar = generate_calendar(year, month, user_data.get(call.from_user.id, {}).get('venue', DEFAULT_VENUE_ID))
+            bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=new_calendar)
+        
+        elif data.startswith('calendar_day_'):
+            user_id = call.from_user.id
+            
+            if user_id not in user_data:
+                bot.answer_callback_query(call.id, "❌ Сессия бронирования устарела. Начните заново.")
+                return
+            
+            date_str = call.data.replace('calendar_day_', '')
+            
+            date_obj, error = validate_date(date_str)
+            if error:
+                bot.answer_callback_query(call.id, error)
+                return
+            
+            venue_id = user_data[user_id].get('venue', DEFAULT_VENUE_ID)
+            day = opening_hours(date_str, venue_id)
+            if day.closed:
+                bot.answer_callback_query(call.id, closed_day_text(day), show_alert=True)
+                return
+            if not available_times(date_str, venue_id=venue_id):
+                bot.answer_callback_query(call.id, "😔 На эту дату нет свободных столов", show_alert=True)
+                return
+            
+            user_data[user_id]['date'] = date_str
+            user_data[user_id]['state'] = BookingState.TIME
+            user_data[user_id]['last_activity'] = time_module.time()
+            
+            safe_delete_message(call.message.chat.id, call.message.message_id)
+            
+            time_keyboard = generate_time_buttons(date_str, venue_id)
+            
+            msg = safe_send_message(
+                call.message.chat.id,
+                f"✅ **Дата:** {date_str}\n🕒 **Часы работы:** {day.text}\n"
+                + (f"🎉 {day.note}\n" if day.note else "") + "\n"
+                "🕐 **Шаг 2 из 6:** Выберите время бронирования:",
+                reply_markup=time_keyboard,
+                parse_mode='Markdown'
+            )
+            
+            remember_step(user_id, msg)
+            bot.answer_callback_query(call.id, f"✅ Дата {date_str} выбрана")
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка в handle_calendar_callback: {e}")
+        bot.answer_callback_query(call.id, "❌ Произошла ошибка")
+
+@router.state(BookingState.TIME)
+def handle_time_selection(message):
+    user_id = message.from_user.id
+    time_str = message.text.strip()
+    if ':' not in time_str:
+        return
+    
+    venue_id = user_data[user_id].get('venue', DEFAULT_VENUE_ID)
+    time_obj, error = validate_time(time_str, user_data[user_id]['date'], venue_id)
+    if not error:
+        start = booking_start(user_data[user_id]['date'], time_str)
+        if start <= datetime.datetime.now():
+            error = "❌ Это время уже прошло. Выберите другое время"
+        elif not seating.plan(venue_id).can_seat(1, start):
+            error = "😔 На это время все столы заняты. Выберите другое время"
+    if error:
+        msg = safe_send_message(message.chat.id, error)
+        remember_step(user_id, msg)
+        return
+    
+    user_data[user_id]['time'] = time_str
+    if user_data[user_id].get('replaces'):
+        # При переносе имя, телефон, гости и комментарий берутся из прежней брони
+        complete_booking(message.chat.id, user_id)
+        return
+    user_data[user_id]['state'] = BookingState.GUESTS
+    user_data[user_id]['last_activity'] = time_module.time()
+    
+    msg = safe_send_message(
+        message.chat.id,
+        f"✅ **Время:** {time_str}\n\n"
+        "👥 **Шаг 3 из 6:** Введите количество гостей (от 1 до 12):",
+        reply_markup=cancel_keyboard(),
+        parse_mode='Markdown'
+    )
+    
+    remember_step(user_id, msg)
+
+@router.state(BookingState.GUESTS)
+def handle_guests_selection(message):
+    user_id = message.from_user.id
+    guests_str = message.text.strip()
+    
+    guests, error = validate_guests(guests_str)
+    if error:
+        msg = safe_send_message(message.chat.id, error)
+        remember_step(user_id, msg)
+        return
+    
+    start = booking_start(user_data[user_id]['date'], user_data[user_id]['time'])
+    if not seating.plan(user_data[user_id].get('venue', DEFAULT_VENUE_ID)).can_seat(guests, start):
+        msg = safe_send_message(
+            message.chat.id,
+            f"😔 На {user_data[user_id]['time']} нет свободных столов на {guests} чел.\n"
+            "Укажите меньше гостей или выберите другую дату и время.",
+            reply_markup=back_or_cancel_keyboard()
+        )
+        remember_step(user_id, msg)
+        return
+    
+    user_data[user_id]['guests'] = guests
+    user_data[user_id]['state'] = BookingState.NAME
+    user_data[user_id]['last_activity'] = time_module.time()
+    
+    msg = safe_send_message(
+        message.chat.id,
+        f"✅ **Гости:** {guests} человек\n\n"
+        "👤 **Шаг 4 из 6:** Введите ваше имя:",
+        reply_markup=cancel_keyboard(),
+        parse_mode='Markdown'
+    )
+    
+    remember_step(user_id, msg)
+
+@router.state(BookingState.NAME)
+def handle_name_selection(message):
+    user_id = message.from_user.id
+    name = message.text.strip()
+    
+    validated_name, error = validate_name(name)
+    if error:
+        msg = safe_send_message(message.chat.id, error)
+        remember_step(user_id, msg)
+        return
+    
+    user_data[user_id]['name'] = validated_name
+    user_data[user_id]['state'] = BookingState.PHONE
+    user_data[user_id]['last_activity'] = time_module.time()
+    
+    msg = safe_send_message(
+        message.chat.id,
+        f"✅ **Имя:** {validated_name}\n\n"
+        "📞 **Шаг 5 из 6:** Введите ваш номер телефона:\n"
+        "• В любом формате\n• Пример: 89123456789 или +7 (912) 345-67-89",
+        reply_markup=cancel_keyboard(),
+        parse_mode='Markdown'
+    )
+    
+    remember_step(user_id, msg)
+
+@router.state(BookingState.PHONE)
+def handle_phone_selection(message):
+    user_id = message.from_user.id
+    phone = message.text.strip()
+    
+    formatted_phone = validate_phone(phone)
+    if not formatted_phone:
+        msg = safe_send_message(
+            message.chat.id,
+            "❌ Неверный формат номера телефона.\n"
+            "Пожалуйста, введите корректный номер:\n"
+            "• 89123456789\n• +7 (912) 345-67-89\n• 8-912-345-67-89",
+            reply_markup=cancel_keyboard()
+        )
+        remember_step(user_id, msg)
+        return
+    
+    user_data[user_id]['phone'] = formatted_phone
+    user_data[user_id]['state'] = BookingState.COMMENT
+    user_data[user_id]['last_activity'] = time_module.time()
+    
+    msg = safe_send_message(
+        message.chat.id,
+        f"✅ **Телефон:** {formatted_phone}\n\n"
+        "💬 **Шаг 6 из 6:** Добавьте комментарий к бронированию (по желанию):\n"
+        "• Например: 'Столик у окна', 'День рождения', 'С приставкой'\n"
+        "• Или пропустите этот шаг",
+        reply_markup=skip_comment_keyboard(),
+        parse_mode='Markdown'
+    )
+    
+    remember_step(user_id, msg)
+
+@router.state(BookingState.COMMENT)
+def handle_comment_or_complete(message):
+    user_id = message.from_user.id
+    
+    if message.text == '➡️ Пропустить комментарий':
+        user_data[user_id]['comment'] = ""
+        complete_booking(message.chat.id, user_id)
+    else:
+        user_data[user_id]['comment'] = message.text
+        complete_booking(message.chat.id, user_id)
+
+def complete_booking(chat_id, user_id):
+    if user_id not in user_data:
+        queue_message(chat_id, "❌ Сессия бронирования устарела. Начните заново.", reply_markup=main_menu(user_id))
+        return
+        
+    required_fields = ['name', 'phone', 'date', 'time', 'guests']
+    missing_fields = []
+    
+    for field in required_fields:
+        if field not in user_data[user_id]:
+            missing_fields.append(field)
+    
+    if missing_fields:
+        logger.error(f"Отсутствуют поля: {missing_fields} для пользователя {user_id}")
+        queue_message(chat_id, "❌ Ошибка данных бронирования. Начните заново.", reply_markup=main_menu(user_id))
+        cleanup_user_data(user_id)
+        return
+    
+    if 'comment' not in user_data[user_id]:
+        user_data[user_id]['comment'] = ""
+    
+    try:
+        booking_id = save_booking_to_db(user_id, user_data[user_id])
+        send_booking_confirmation(chat_id, user_data[user_id], booking_id)
+        send_booking_to_admin(user_data[user_id], user_id, booking_id)
+        cleanup_user_data(user_id)
+        
+        logger.info(f"✅ Бронирование успешно создано #{booking_id} для пользователя {user_id}")
+    
+    except DuplicateBooking as e:
+        # Гость и персонал уже уведомлены первой обработкой
+        logger.info(f"♻️ Повторное завершение бронирования #{e.booking_id} для пользователя {user_id} пропущено")
+        cleanup_user_data(user_id)
+    
+    except NoSeatsAvailable:
+        data = user_data[user_id]
+        data['state'] = BookingState.TIME
+        data['last_activity'] = time_module.time()
+        msg = safe_send_message(
+            chat_id,
+            f"😔 *На {data['date']} в {data['time']} уже нет свободных столов на {data['guests']} чел.*\n\n"
+            "🕐 Выберите другое время:",
+            reply_markup=generate_time_buttons(data['date'], data.get('venue', DEFAULT_VENUE_ID)),
+            parse_mode='Markdown'
+        )
+        remember_step(user_id, msg)
+        msg = safe_send_message(
+            chat_id,
+            "🔔 Или встаньте в лист ожидания - напишем, если стол в это время освободится",
+            reply_markup=waitlist_join_keyboard(0)
+        )
+        remember_step(user_id, msg)
+    
+    except Exception as e:
+        logger.error(f"❌ Ошибка при сохранении брони: {e}")
+        queue_message(chat_id, "❌ Произошла ошибка при сохранении брони. Попробуйте позже.", reply_markup=main_menu(user_id))
+        cleanup_user_data(user_id)
+
+def save_booking_to_db(user_id, data):
+    """Сохраняет бронь и атомарно закрепляет за ней столы.
+    
+    Подбор столов и вставка выполняются под блокировкой индекса столов заведения,
+    поэтому два гостя не могут занять один стол. Если мест нет - NoSeatsAvailable.
+    Бронь с ключом сессии (data['key']) создается не больше одного раза: повтор
+    находит ее одним поиском по уникальному индексу и получает DuplicateBooking.
+    При переносе (data['replaces']) прежняя бронь гостя отменяется в той же транзакции
+    до подбора столов, и ее столы доступны новой; без мест отмена откатывается.
+    Гостю с низкой надежностью бронь ставится с депозитом (data['deposit']).
+    """
+    start_dt = booking_start(data['date'], data['time'])
+    venue_id = data.get('venue', DEFAULT_VENUE_ID)
+    key = data.get('key')
+    plan = seating.plan(venue_id)
+    data['deposit'] = reliability.needs_deposit(user_id)
+    
+    # Индекс столов обновляется до снятия блокировки: иначе параллельная бронь
+    # между коммитом и reserve увидит те же столы свободными
+    with plan.lock:
+        with db.transaction() as cursor:
+            if key:
+                cursor.execute('SELECT id FROM bookings WHERE idempotency_key = ?', (key,))
+                row = cursor.fetchone()
+                if row:
+                    raise DuplicateBooking(row[0])
+            
+            replaced = data.get('replaces')
+            if replaced and not cancel_guest_booking(cursor, replaced, user_id):
+                replaced = None
+            
+            table_ids = plan.find_tables(data['guests'], start_dt, ignore=replaced)
+            if not table_ids:
+                raise NoSeatsAvailable()
+            
+            cursor.execute('''
+                INSERT INTO bookings (venue_id, idempotency_key, user_id, user_name, phone, booking_date, booking_time, start_ts, guests, comment, deposit_required, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending')
+            ''', (
+                venue_id,
+                key,
+                user_id, 
+                data['name'], 
+                data['phone'], 
+                data['date'], 
+                data['time'], 
+                format_ts(start_dt),
+                data['guests'],
+                data.get('comment', ''),
+                int(data['deposit'])
+            ))
+            
+            booking_id = cursor.lastrowid
+            assign_tables(cursor, booking_id, table_ids, start_dt)
+            record_event(cursor, 'booking', booking_id, None, 'pending', service_day(data['date']), data['time'], venue_id=venue_id)
+        
+        plan.reserve(booking_id, table_ids, start_dt)
+    
+    if replaced:
+        forget_booking(replaced)
+        update_staff_notifications([replaced], cancelled_keyboard())
+    guest_bookings.invalidate(user_id)
+    return booking_id
+
+def send_booking_confirmation(chat_id, booking_data, booking_id):
+    venue = venues.get(booking_data.get('venue', DEFAULT_VENUE_ID))
+    confirmation_text = f"""
+✅ *Заявка на бронирование отправлена!*
+
+📋 *Детали бронирования:*
+• 👤 **Имя:** {booking_data['name']}
+• 📞 **Телефон:** {booking_data['phone']}
+• 📅 **Дата:** {booking_data['date']}
+• ⏰ **Время:** {booking_data['time']}
+• 👥 **Гости:** {booking_data['guests']} человек
+{f"• 💬 **Комментарий:** {booking_data['comment']}" if booking_data['comment'] else ""}
+
+🏢 *Лаундж-бар:* {venue['name']}
+📍 *Адрес:* {venue['address']}
+{venue['entertainment']}
+
+*Ожидайте подтверждения от администратора!* 📞
+    """
+    if booking_data.get('deposit'):
+        confirmation_text += f"\n💳 {DEPOSIT_TEXT}\n"
+    
+    queue_message(chat_id, confirmation_text, reply_markup=main_menu(chat_id), parse_mode='Markdown')
+
+def booking_keyboard(booking_id, claimed_by=None):
+    """Кнопки уведомления о заявке; claimed_by - кто взял ее в работу"""
+    keyboard = InlineKeyboardMarkup()
+    keyboard.row(
+        InlineKeyboardButton("✅ Одобрить", callback_data=f"admin_approve_{booking_id}"),
+        InlineKeyboardButton("❌ Отклонить", callback_data=f"admin_reject_{booking_id}")
+    )
+    keyboard.row(
+        InlineKeyboardButton(f"✋ {staff.title(claimed_by)}" if claimed_by else "✋ Взять", callback_data=f"admin_claim_{booking_id}"),
+        InlineKeyboardButton("💬 Ответить гостю", callback_data=f"admin_reply_{booking_id}")
+    )
+    return keyboard
+
+def decided_keyboard(action, staff_id):
+    """Клавиатура решенной заявки: кто и что решил"""
+    keyboard = InlineKeyboardMarkup()
+    label = "✅ Одобрено" if action == 'approve' else "❌ Отклонено"
+    keyboard.row(InlineKeyboardButton(f"{label} · {staff.title(staff_id)}", callback_data="ignore"))
+    return keyboard
+
+def cancelled_keyboard():
+    """Клавиатура заявки, которую гость отменил или перенес"""
+    keyboard = InlineKeyboardMarkup()
+    keyboard.row(InlineKeyboardButton("🚫 Отменено гостем", callback_data="ignore"))
+    return keyboard
+
+def send_booking_to_admin(booking_data, user_id, booking_id):
+    venue_id = booking_data.get('venue', DEFAULT_VENUE_ID)
+    venue = venues.get(venue_id)
+    comment_text = f"\n💬 *Комментарий гостя:* {booking_data['comment']}" if booking_data.get('comment') else "\n💬 *Комментарий:* Нет комментария"
+    if booking_data.get('replaces'):
+        comment_text += f"\n🔁 *Перенос брони #*{booking_data['replaces']}"
+    if booking_data.get('deposit'):
+        comment_text += "\n💳 *Нужен депозит:* одобряйте бронь после оплаты"
+    
+    booking_text = f"""
+📋 *НОВАЯ ЗАЯВКА НА БРОНИРОВАНИЕ* #{booking_id}
+
+👤 *Имя:* {booking_data['name']}
+📞 *Телефон:* {booking_data['phone']}
+📅 *Дата:* {booking_data['date']}
+⏰ *Время:* {booking_data['time']}
+👥 *Гости:* {booking_data['guests']} чел.
+🆔 *ID пользователя:* {user_id}
+🎯 *Надежность:* {reliability.badge(user_id) or 'новый гость'}
+{comment_text}
+
+🏢 *Лаундж-бар:* {venue['name']}
+📍 *Адрес:* {venue['address']}
+    """
+    
+    on_duty = staff.on_duty(venue_id=venue_id)
+    responsible = staff.responsible(booking_id, on_duty)
+    if len(on_duty) > 1:
+        booking_text += f"🎯 *Ответственный:* {staff.title(responsible)}\n"
+    
+    notify_staff(booking_text, booking_id, reply_markup=booking_keyboard(booking_id), on_duty=on_duty, parse_mode='Markdown')
+
+# === ИСПРАВЛЕННЫЙ ОБРАБОТЧИК ОТМЕНЫ БРОНИРОВАНИЯ ===
+@router.text('❌ Отмена бронирования')
+def cancel_booking(message):
+    user_id = message.from_user.id
+    if user_id in user_data:
+        cleanup_user_data(user_id)
+        queue_message(message.chat.id, "❌ Бронирование отменено", reply_markup=main_menu(user_id))
+    else:
+        queue_message(message.chat.id, "❌ Активное бронирование не найдено", reply_markup=main_menu(user_id))
+
+# === ОБРАБОТКА CALLBACK-ЗАПРОСОВ ===
+# === АДМИН-ПАНЕЛЬ ===
+@router.text('👑 Панель администратора')
+def admin_panel(message):
+    if staff.is_staff(message.from_user.id):
+        queue_message(message.chat.id, "👑 *Панель администратора*", reply_markup=admin_menu(), parse_mode='Markdown')
+    else:
+        queue_message(message.chat.id, "⛔ Доступ запрещен", reply_markup=main_menu(message.from_user.id))
+
+@router.text('🔙 В главное меню')
+def back_to_main(message):
+    queue_message(message.chat.id, "Главное меню", reply_markup=main_menu(message.from_user.id))
+
+# Списки броней в админ-панели: одна страница - одно сообщение, листание правит его на месте.
+# Страницы выбираются по ключу (start_ts, id) через индекс (venue_id, status, start_ts)
+LISTING_PAGE_SIZE = 5
+
+LISTINGS = {
+    'pending': {
+        'status': 'pending',
+        'title': '⏳ *Ожидающие заявки*',
+        'empty': '✅ Нет ожидающих заявок',
+        'descending': False,
+        'from_today': False,
+        'actions': 'decide',
+    },
+    'approved': {
+        'status': 'approved',
+        'title': '✅ *Актуальные бронирования*',
+        'empty': '📭 Нет актуальных бронирований',
+        'descending': False,
+        'from_today': True,
+        'actions': 'visit',
+    },
+    'rejected': {
+        'status': 'rejected',
+        'title': '❌ *Отклоненные заявки*',
+        'empty': '📭 Нет отклоненных заявок',
+        'descending': True,
+        'from_today': False,
+        'actions': None,
+    },
+}
+
+def pack_anchor(start_ts, booking_id):
+    """Ключ страницы для callback_data: 2025-01-31 20:00 и 17 -> 202501312000_17"""
+    return f"{start_ts.replace('-', '').replace(' ', '').replace(':', '')}_{booking_id}"
+
+def unpack_anchor(packed_ts, booking_id):
+    ts = packed_ts
+    return f"{ts[0:4]}-{ts[4:6]}-{ts[6:8]} {ts[8:10]}:{ts[10:12]}", safe_int(booking_id)
+
+def fetch_listing_page(kind, direction='first', anchor=None, page_size=LISTING_PAGE_SIZE, venue_id=DEFAULT_VENUE_ID):
+    """Страница списка заведения: (брони, есть ли предыдущая, есть ли следующая).
+    
+    direction: first - с начала, next - после anchor, prev - перед anchor,
+    here - начиная с anchor (перерисовка текущей страницы).
+    """
+    listing = LISTINGS[kind]
+    forward, backward = ('<', '>') if listing['descending'] else ('>', '<')
+    order, reverse_order = ('DESC', 'ASC') if listing['descending'] else ('ASC', 'DESC')
+    
+    conditions = ['venue_id = ?', 'status = ?']
+    params = [venue_id, listing['status']]
+    if listing['from_today']:
+        conditions.append('start_ts >= ?')
+        params.append(format_ts(datetime.datetime.combine(datetime.date.today(), datetime.time.min)))
+    if not anchor:
+        direction = 'first'
+    
+    def select(operator, sort, limit):
+        where = conditions + ([f'(start_ts, id) {operator} (?, ?)'] if operator else [])
+        cursor.execute(f'''
+            SELECT id, user_id, user_name, phone, booking_date, booking_time, guests, comment, start_ts
+            FROM bookings
+            WHERE {' AND '.join(where)}
+            ORDER BY start_ts {sort}, id {sort}
+            LIMIT ?
+        ''', params + (list(anchor) if operator else []) + [limit])
+        return cursor.fetchall()
+    
+    with db.connection() as cursor:
+        if direction == 'prev':
+            rows = select(backward, reverse_order, page_size + 1)
+            has_prev = len(rows) > page_size
+            rows = rows[:page_size]
+            rows.reverse()
+            return rows, has_prev, True
+        
+        operator = {'first': None, 'next': forward, 'here': forward + '='}[direction]
+        rows = select(operator, order, page_size + 1)
+        if direction == 'here':
+            has_prev = bool(select(backward, reverse_order, 1))
+        else:
+            has_prev = direction == 'next'
+    
+    return rows[:page_size], has_prev, len(rows) > page_size
+
+def render_listing_page(kind, rows, has_prev, has_next, venue_id=DEFAULT_VENUE_ID):
+    """Текст и клавиатура страницы"""
+    listing = LISTINGS[kind]
+    lines = [venue_caption(venue_id) + listing['title'], '']
+    keyboard = InlineKeyboardMarkup()
+    visit_border = format_ts(datetime.datetime.now() + SEAT_EARLY)
+    
+    for booking_id, user_id, user_name, phone, date, time, guests, comment, start_ts in rows:
+        icon = ("🟢" if is_booking_active(date) else "🔴") if kind == 'approved' else "•"
+        lines.append(f"{icon} *#{booking_id}* {date} {time} · {guests} чел.")
+        lines.append(f"👤 {user_name} · 📞 {phone} · 🆔 {user_id}")
+        badge = reliability.badge(user_id)
+        if badge:
+            lines.append(f"🎯 {badge}" + (" · 💳 депозит" if reliability.needs_deposit(user_id) else ""))
+        if comment:
+            lines.append(f"💬 {comment[:80]}")
+        lines.append('')
+        
+        if listing['actions'] == 'decide':
+            keyboard.row(
+                InlineKeyboardButton(f"✅ #{booking_id}", callback_data=f"admin_approve_{booking_id}"),
+                InlineKeyboardButton(f"❌ #{booking_id}", callback_data=f"admin_reject_{booking_id}"),
+                InlineKeyboardButton(f"💬 #{booking_id}", callback_data=f"admin_reply_{booking_id}")
+            )
+        elif listing['actions'] == 'visit' and start_ts <= visit_border:
+            keyboard.row(*visit_buttons(booking_id, f" #{booking_id}"))
+    
+    first, last = rows[0], rows[-1]
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=f"page_{kind}_prev_{pack_anchor(first[8], first[0])}"))
+    navigation.append(InlineKeyboardButton("🔄", callback_data=f"page_{kind}_here_{pack_anchor(first[8], first[0])}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=f"page_{kind}_next_{pack_anchor(last[8], last[0])}"))
+    keyboard.row(*navigation)
+    
+    return '\n'.join(lines), keyboard
+
+def show_listing(chat_id, kind, direction='first', anchor=None, message_id=None, venue_id=DEFAULT_VENUE_ID):
+    """Отправляет страницу или заменяет ею сообщение message_id"""
+    rows, has_prev, has_next = fetch_listing_page(kind, direction, anchor, venue_id=venue_id)
+    if not rows and direction != 'first':
+        rows, has_prev, has_next = fetch_listing_page(kind, venue_id=venue_id)
+    
+    if not rows:
+        text, keyboard = venue_caption(venue_id) + LISTINGS[kind]['empty'], None
+    else:
+        text, keyboard = render_listing_page(kind, rows, has_prev, has_next, venue_id)
+    
+    if message_id is None:
+        queue_message(chat_id, text, reply_markup=keyboard, parse_mode='Markdown', priority=PRIORITY_BULK)
+    else:
+        outbound.submit(
+            chat_id, bot.edit_message_text, text, chat_id, message_id,
+            reply_markup=keyboard, parse_mode='Markdown', priority=PRIORITY_URGENT
+        )
+
+def listing_anchor(message, prefix='page_'):
+    """Данные кнопки 🔄, если сообщение - страница списка"""
+    markup = getattr(message, 'reply_markup', None)
+    if not markup or not getattr(markup, 'keyboard', None):
+        return None
+    for row in reversed(markup.keyboard):
+        for button in row:
+            if button.callback_data and button.callback_data.startswith(prefix) and '_here_' in button.callback_data:
+                return button.callback_data
+    return None
+
+@router.text('⏳ Ожидающие заявки', admin_only=True)
+def show_pending_bookings(message):
+    show_listing(message.chat.id, 'pending', venue_id=current_venue(message.from_user.id))
+
+@router.text('✅ Актуальные бронирования', admin_only=True)
+def show_approved_bookings(message):
+    show_listing(message.chat.id, 'approved', venue_id=current_venue(message.from_user.id))
+
+@router.text('❌ Отклоненные заявки', admin_only=True)
+def show_rejected_bookings(message):
+    show_listing(message.chat.id, 'rejected', venue_id=current_venue(message.from_user.id))
+
+@router.callback(*[f'page_{kind}_{direction}' for kind in LISTINGS for direction in ('prev', 'next', 'here')])
+def handle_listing_page(call):
+    if not staff.is_staff(call.from_user.id):
+        bot.answer_callback_query(call.id, "⛔ Доступ запрещен")
+        return
+    
+    _, kind, direction, packed_ts, booking_id = call.data.split('_')
+    show_listing(
+        call.message.chat.id, kind, direction, unpack_anchor(packed_ts, booking_id),
+        message_id=call.message.message_id, venue_id=current_venue(call.from_user.id)
+    )
+    bot.answer_callback_query(call.id)
+
+@router.text('📈 Общая статистика', admin_only=True)
+def show_stats(message):
+    if not staff.can(message.from_user.id, 'reports'):
+        queue_message(message.chat.id, "⛔ Статистика доступна менеджерам и владельцу")
+        return
+    venue_id = current_venue(message.from_user.id)
+    stats = read_stats(venue_id)
+    
+    stats_text = venue_caption(venue_id) + f"""
+📈 *Общая статистика лаундж-бара*
+
+📊 *Бронирования:*
+• Всего заявок: {stats['total']}
+• Ожидают решения: {stats['pending']}
+• Актуальные брони: {stats['active']}
+• Одобрено всего: {stats['approved']}
+• Отклонено: {stats['rejected']}
+• Процент одобрения: {(stats['approved']/stats['total']*100) if stats['total'] > 0 else 0:.1f}%
+• Пришли: {stats['seated']} · Не пришли: {stats['no_show']}
+
+⭐ *Отзывы:*
+• Всего отзывов: {stats['reviews']}
+• Средний рейтинг: {stats['average_rating']:.1f}/5
+• Оценки: {' | '.join(f"{rating}⭐ {count}" for rating, count in sorted(stats['ratings'].items(), reverse=True))}
+
+📅 *Ближайшие 7 дней:*
+"""
+    
+    for date, count in stats['week']:
+        stats_text += f"• {date}: {count} броней\n"
+    
+    stats_text += "\n⏰ *Популярное время:*\n"
+    for time, count in stats['popular_times']:
+        stats_text += f"• {time}: {count} броней\n"
+    
+    queue_message(message.chat.id, stats_text, parse_mode='Markdown')
+
+@router.command('rebuild_stats')
+def rebuild_stats_command(message):
+    if not staff.can(message.from_user.id, 'reports'):
+        return
+    rebuild_stats()
+    show_stats(message)
+
+DECISIONS = {
+    'approve': ('approved', ('pending',)),
+    'reject': ('rejected', ('pending', 'approved')),
+}
+
+def apply_decisions(booking_ids, action, staff_id=None):
+    """Одобряет или отклоняет брони одной транзакцией.
+    
+    Возвращает (брони, к которым решение применено; id уже обработанных, не найденных
+    или взятых другим сотрудником). Перед условной сменой статуса заявка захватывается
+    сотрудником staff_id, поэтому повторное нажатие или решение другого администратора
+    не применяется дважды.
+    """
+    new_status, allowed_from = DECISIONS[action]
+    applied, skipped = [], []
+    with db.transaction() as cursor:
+        for booking_id in booking_ids:
+            if staff_id is not None and not claim_booking(cursor, booking_id, staff_id, statuses=allowed_from):
+                skipped.append(booking_id)
+                continue
+            if not transition_booking(cursor, booking_id, new_status, allowed_from):
+                skipped.append(booking_id)
+                continue
+            if action == 'reject':
+                release_tables(cursor, booking_id)
+            cursor.execute(
+                'SELECT id, user_id, user_name, booking_date, booking_time, guests, comment, start_ts, venue_id FROM bookings WHERE id = ?',
+                (booking_id,)
+            )
+            applied.append(cursor.fetchone())
+    
+    for booking in applied:
+        if action == 'approve':
+            reminders.schedule_booking(booking[0], datetime.datetime.strptime(booking[7], START_TS_FORMAT))
+        else:
+            forget_booking(booking[0])
+        guest_bookings.invalidate(booking[1])
+    return applied, skipped
+
+def decision_message(booking, action):
+    """Уведомление гостю о решении по брони"""
+    _, _, user_name, date, time, guests, comment, _, venue_id = booking
+    venue = venues.get(venue_id)
+    if action == 'approve':
+        return f"""
+✅ *Ваше бронирование подтверждено!*
+
+📋 *Детали:*
+• 👤 Имя: {user_name}
+• 📅 Дата: {date}
+• ⏰ Время: {time}
+• 👥 Гости: {guests} чел.
+{f"• 💬 Ваш комментарий: {comment}" if comment else ""}
+
+🏢 *Лаундж-бар:* {venue['name']}
+📍 *Адрес:* {venue['address']}
+📞 *Телефон:* {venue['phone']}
+{venue['entertainment']}
+
+*Ждем вас в гости!* 🍝
+            """
+    return f"""
+❌ *К сожалению, ваше бронирование отклонено.*
+
+📅 *Дата:* {date}
+⏰ *Время:* {time}
+
+*Пожалуйста, выберите другое время или свяжитесь с нами:*
+📞 {venue['phone']}
+            """
+
+def notify_decisions(applied, action, priority=PRIORITY_URGENT):
+    """Ставит уведомления гостям в очередь отправки; возвращает их Future.
+    Очередь рассылает по разным чатам параллельно в пределах лимитов Telegram"""
+    futures = []
+    for booking in applied:
+        keyboard = waitlist_join_keyboard(booking[0]) if action == 'reject' else None
+        try:
+            futures.append(queue_message(
+                booking[1], decision_message(booking, action), reply_markup=keyboard, priority=priority, parse_mode='Markdown'
+            ))
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки уведомления пользователю: {e}")
+    return futures
+
+def claim_holder(booking_id):
+    """Кто держит захват ожидающей заявки, если он еще действует"""
+    with db.connection() as cursor:
+        cursor.execute(
+            "SELECT claimed_by FROM bookings WHERE id = ? AND status = 'pending' AND claimed_at >= ?",
+            (booking_id, format_ts(datetime.datetime.now() - CLAIM_TTL))
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+@router.callback('admin_approve', 'admin_reject', 'admin_reply', 'admin_claim')
+def handle_admin_actions(call):
+    """Обработка действий администратора"""
+    if not staff.can(call.from_user.id, 'moderate'):
+        bot.answer_callback_query(call.id, "⛔ Доступ запрещен")
+        return
+        
+    data_parts = call.data.split('_')
+    if len(data_parts) < 3:
+        bot.answer_callback_query(call.id, "❌ Ошибка данных")
+        return
+        
+    action = data_parts[1]
+    booking_id = safe_int(data_parts[2])
+    
+    if not booking_id:
+        bot.answer_callback_query(call.id, "❌ Неверный ID брони")
+        return
+    
+    if action in ('approve', 'reject'):
+        applied, _ = apply_decisions([booking_id], action, staff_id=call.from_user.id)
+        if applied:
+            notify_decisions(applied, action)
+            update_staff_notifications(
+                [booking_id], decided_keyboard(action, call.from_user.id),
+                exclude=(call.message.chat.id, call.message.message_id)
+            )
+            bot.answer_callback_query(call.id, "✅ Бронирование одобрено" if action == 'approve' else "❌ Бронирование отклонено")
+        else:
+            holder = claim_holder(booking_id)
+            if holder and holder != call.from_user.id:
+                bot.answer_callback_query(call.id, f"✋ Заявку взял(а) в работу {staff.title(holder)}")
+                return
+            bot.answer_callback_query(call.id, "⚠️ Заявка уже обработана или не найдена")
+    
+    elif action == 'claim':
+        with db.transaction() as cursor:
+            cursor.execute('SELECT status FROM bookings WHERE id = ?', (booking_id,))
+            row = cursor.fetchone()
+            claimed = bool(row) and row[0] == 'pending' and claim_booking(cursor, booking_id, call.from_user.id)
+        if claimed:
+            update_staff_notifications([booking_id], booking_keyboard(booking_id, call.from_user.id))
+            bot.answer_callback_query(call.id, f"✋ Заявка за вами на {CLAIM_TTL.seconds // 60} минут")
+        elif row and row[0] == 'pending':
+            bot.answer_callback_query(call.id, f"✋ Заявку уже взял(а) {staff.title(claim_holder(booking_id))}")
+        else:
+            bot.answer_callback_query(call.id, "⚠️ Заявка уже обработана или не найдена")
+    
+    elif action == 'reply':
+        with db.connection() as cursor:
+            cursor.execute('SELECT user_id, user_name, comment, venue_id FROM bookings WHERE id = ?', (booking_id,))
+            booking = cursor.fetchone()
+        
+        if booking and not staff.can(call.from_user.id, 'moderate', booking[3]):
+            bot.answer_callback_query(call.id, "⛔ Бронь другого заведения")
+        elif booking:
+            AdminStates.set_booking_reply_mode(call.from_user.id, booking_id)
+            
+            reply_text = f"""
+💬 *Ответ на комментарий гостя*
+
+👤 *Гость:* {booking[1]}
+💭 *Комментарий:* {booking[2] if booking[2] else "Нет комментария"}
+
+*Введите ваш ответ для гостю:*
+            """
+            
+            queue_message(call.from_user.id, reply_text, parse_mode='Markdown')
+            bot.answer_callback_query(call.id, "💬 Введите ответ для гостя")
+        else:
+            bot.answer_callback_query(call.id, "❌ Бронь не найдена")
+    
+    # Удаляем кнопки только для approve/reject; страницу списка перерисовываем
+    if action in ['approve', 'reject']:
+        anchor = listing_anchor(call.message)
+        if anchor:
+            _, kind, _, packed_ts, anchor_id = anchor.split('_')
+            show_listing(
+                call.message.chat.id, kind, 'here', unpack_anchor(packed_ts, anchor_id),
+                message_id=call.message.message_id, venue_id=current_venue(call.from_user.id)
+            )
+            return
+        try:
+            bot.edit_message_reply_markup(
+                call.message.chat.id, call.message.message_id,
+                reply_markup=decided_keyboard(action, call.from_user.id) if applied else None
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось обновить клавиатуру: {e}")
+
+# === ПАКЕТНАЯ МОДЕРАЦИЯ ===
+# Администратор отмечает заявки на страницах по BULK_PAGE_SIZE (выбор хранится в его сессии
+# и переживает листание), затем одним нажатием одобряет или отклоняет все отмеченные:
+# одна транзакция, уведомления гостям через очередь отправки и одна правка сообщения.
+BULK_PAGE_SIZE = 20   # кнопки заявок + 3 ряда управления, лимит Telegram - 100 кнопок
+
+def pending_count(venue_id=DEFAULT_VENUE_ID):
+    with db.connection() as cursor:
+        cursor.execute(
+            "SELECT value FROM stats_counters WHERE venue_id = ? AND name = 'booking_status' AND key = 'pending'",
+            (venue_id,)
+        )
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+def render_bulk_page(rows, has_prev, has_next, selected, venue_id=DEFAULT_VENUE_ID):
+    total = pending_count(venue_id)
+    text = (
+        venue_caption(venue_id) +
+        f"☑️ *Пакетная модерация*\n\n"
+        f"Ожидают решения: {total}\n"
+        f"Выбрано: {len(selected)}\n\n"
+        f"Отметьте заявки и примените решение ко всем сразу."
+    )
+    keyboard = InlineKeyboardMarkup()
+    for booking_id, _, user_name, _, date, time, guests, _, _ in rows:
+        mark = '☑️' if booking_id in selected else '⬜'
+        keyboard.row(InlineKeyboardButton(
+            f"{mark} #{booking_id} {date[:5]} {time} · {guests} чел. · {user_name[:12]}",
+            callback_data=f"bulk_toggle_{booking_id}"
+        ))
+    
+    first, last = rows[0], rows[-1]
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=f"bulk_prev_{pack_anchor(first[8], first[0])}"))
+    navigation.append(InlineKeyboardButton("🔄", callback_data=f"bulk_here_{pack_anchor(first[8], first[0])}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=f"bulk_next_{pack_anchor(last[8], last[0])}"))
+    keyboard.row(*navigation)
+    keyboard.row(
+        InlineKeyboardButton("☑️ Страница", callback_data="bulk_page"),
+        InlineKeyboardButton(f"☑️ Все ({total})", callback_data="bulk_all"),
+        InlineKeyboardButton("⬜ Снять", callback_data="bulk_clear")
+    )
+    keyboard.row(
+        InlineKeyboardButton(f"✅ Одобрить ({len(selected)})", callback_data="bulk_approve"),
+        InlineKeyboardButton(f"❌ Отклонить ({len(selected)})", callback_data="bulk_reject")
+    )
+    return text, keyboard
+
+def show_bulk_page(chat_id, admin_id, direction='first', anchor=None, message_id=None):
+    """Отправляет страницу выбора или заменяет ею сообщение message_id"""
+    venue_id = current_venue(admin_id)
+    rows, has_prev, has_next = fetch_listing_page('pending', direction, anchor, BULK_PAGE_SIZE, venue_id)
+    if not rows and direction != 'first':
+        rows, has_prev, has_next = fetch_listing_page('pending', page_size=BULK_PAGE_SIZE, venue_id=venue_id)
+    
+    if rows:
+        text, keyboard = render_bulk_page(rows, has_prev, has_next, AdminStates.get_bulk_selection(admin_id), venue_id)
+    else:
+        AdminStates.set_bulk_selection(admin_id, ())
+        text, keyboard = LISTINGS['pending']['empty'], None
+    
+    if message_id is None:
+        queue_message(chat_id, text, reply_markup=keyboard, parse_mode='Markdown', priority=PRIORITY_BULK)
+    else:
+        outbound.submit(
+            chat_id, bot.edit_message_text, text, chat_id, message_id,
+            reply_markup=keyboard, parse_mode='Markdown', priority=PRIORITY_URGENT
+        )
+
+def redraw_bulk_page(call):
+    anchor = listing_anchor(call.message, 'bulk_')
+    if anchor:
+        _, _, packed_ts, anchor_id = anchor.split('_')
+        show_bulk_page(call.message.chat.id, call.from_user.id, 'here', unpack_anchor(packed_ts, anchor_id), call.message.message_id)
+    else:
+        show_bulk_page(call.message.chat.id, call.from_user.id, message_id=call.message.message_id)
+
+@router.text('☑️ Пакетная модерация', admin_only=True)
+def start_bulk_moderation(message):
+    show_bulk_page(message.chat.id, message.from_user.id)
+
+@router.callback('bulk_open', 'bulk_prev', 'bulk_next', 'bulk_here')
+def handle_bulk_navigation(call):
+    if not staff.can(call.from_user.id, 'moderate'):
+        bot.answer_callback_query(call.id, "⛔ Доступ запрещен")
+        return
+    
+    if call.data == 'bulk_open':
+        show_bulk_page(call.message.chat.id, call.from_user.id, message_id=call.message.message_id)
+    else:
+        _, direction, packed_ts, booking_id = call.data.split('_')
+        show_bulk_page(
+            call.message.chat.id, call.from_user.id, direction, unpack_anchor(packed_ts, booking_id),
+            message_id=call.message.message_id
+        )
+    bot.answer_callback_query(call.id)
+
+@router.callback('bulk_toggle', 'bulk_page', 'bulk_all', 'bulk_clear')
+def handle_bulk_selection(call):
+    if not staff.can(call.from_user.id, 'moderate'):
+        bot.answer_callback_query(call.id, "⛔ Доступ запрещен")
+        return
+    
+    admin_id = call.from_user.id
+    selected = AdminStates.get_bulk_selection(admin_id)
+    if call.data.startswith('bulk_toggle_'):
+        selected ^= {safe_int(call.data.rsplit('_', 1)[1])}
+    elif call.data == 'bulk_page':
+        selected |= {
+            safe_int(button.callback_data.rsplit('_', 1)[1])
+            for row in call.message.reply_markup.keyboard for button in row
+            if button.callback_data and button.callback_data.startswith('bulk_toggle_')
+        }
+    elif call.data == 'bulk_all':
+        # Заявки, взятые в работу другими сотрудниками, не отмечаем
+        with db.connection() as cursor:
+            cursor.execute('''
+                SELECT id FROM bookings
+                WHERE venue_id = ? AND status = 'pending' AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?)
+            ''', (current_venue(admin_id), admin_id, format_ts(datetime.datetime.now() - CLAIM_TTL)))
+            selected = {row[0] for row in cursor.fetchall()}
+    else:
+        selected = set()
+    
+    AdminStates.set_bulk_selection(admin_id, selected)
+    redraw_bulk_page(call)
+    bot.answer_callback_query(call.id, f"Выбрано: {len(selected)}")
+
+@router.callback('bulk_approve', 'bulk_reject')
+def handle_bulk_decision(call):
+    if not staff.can(call.from_user.id, 'moderate'):
+        bot.answer_callback_query(call.id, "⛔ Доступ запрещен")
+        return
+    
+    admin_id = call.from_user.id
+    selected = AdminStates.get_bulk_selection(admin_id)
+    if not selected:
+        bot.answer_callback_query(call.id, "⚠️ Ничего не выбрано")
+        return
+    
+    action = call.data.split('_')[1]
+    started = time_module.perf_counter()
+    applied, skipped = apply_decisions(sorted(selected), action, staff_id=admin_id)
+    AdminStates.set_bulk_selection(admin_id, ())
+    update_staff_notifications([booking[0] for booking in applied], decided_keyboard(action, admin_id))
+    bot.answer_callback_query(call.id, f"{'✅ Одобрено' if action == 'approve' else '❌ Отклонено'}: {len(applied)}")
+    
+    # Сначала сводка администратору, затем рассылка гостям: очередь сама разнесет их по чатам
+    summary = (
+        f"{'✅ *Одобрено*' if action == 'approve' else '❌ *Отклонено*'}: {len(applied)}\n"
+        + (f"⚠️ Уже обработаны, не найдены или взяты другими: {len(skipped)}\n" if skipped else "")
+        + f"\nОжидают решения: {pending_count(current_venue(admin_id))}"
+    )
+    keyboard = InlineKeyboardMarkup()
+    keyboard.row(InlineKeyboardButton("☑️ Продолжить", callback_data="bulk_open"))
+    outbound.submit(
+        call.message.chat.id, bot.edit_message_text, summary, call.message.chat.id, call.message.message_id,
+        reply_markup=keyboard, parse_mode='Markdown', priority=PRIORITY_URGENT
+    )
+    notify_decisions(applied, action, priority=PRIORITY_NORMAL)
+    logger.info(
+        f"☑️ Пакетное решение {action}: применено {len(applied)}, пропущено {len(skipped)} "
+        f"за {(time_module.perf_counter() - started) * 1000:.0f} мс"
+    )
+
+# === УПРАВЛЕНИЕ ПЕРСОНАЛОМ ===
+STAFF_USAGE = """
+👥 *Персонал*
+
+`/staff` - список и кто сейчас на смене
+`/staff add ID роль [имя]` - добавить сотрудника
+`/staff role ID роль` - сменить роль
+`/staff shift ID дни [ЧЧ:ММ-ЧЧ:ММ]` - смена, например `/staff shift 123 567 18:00-03:00`
+`/staff remove ID` - удалить
+`/staff venue ID номер|*` - закрепить за заведением или `*` - за всеми
+
+• роли: owner - владелец, manager - менеджер, host - хостес
+• владелец заведения видит и добавляет только персонал своего заведения
+• дни - цифры 1-7 (1 - понедельник) или `*` для всех дней
+• без часов сотрудник на смене весь день
+"""
+
+def parse_shift(days, hours=None):
+    """Разбор дней и часов смены; ((дни, начало, конец), None) или (None, текст ошибки)"""
+    days = WEEKDAY_DIGITS if days == '*' else ''.join(sorted(set(days)))
+    if not days or any(day not in WEEKDAY_DIGITS for day in days):
+        return None, "❌ Дни смены - цифры от 1 до 7 или *"
+    if hours is None:
+        return (days, None, None), None
+    match = SHIFT_PATTERN.fullmatch(hours)
+    if not match:
+        return None, "❌ Часы смены в формате ЧЧ:ММ-ЧЧ:ММ"
+    try:
+        start, end = (clock(value).strftime('%H:%M') for value in match.groups())
+    except ValueError:
+        return None, "❌ Часы смены в формате ЧЧ:ММ-ЧЧ:ММ"
+    if start == end:
+        return None, "❌ Начало и конец смены совпадают"
+    return (days, start, end), None
+
+def last_owner(user_id):
+    """Нельзя оставить бота без владельца"""
+    owners = [member.user_id for member in staff.members() if member.role == 'owner']
+    return owners == [user_id]
+
+def manages(manager_id, user_id):
+    """Владелец заведения управляет только персоналом своего заведения"""
+    manager, member = staff.get(manager_id), staff.get(user_id)
+    return manager.venue_id is None or member is None or member.venue_id == manager.venue_id
+
+def staff_list_text(venue_id=None):
+    on_duty = set(staff.on_duty(venue_id=venue_id))
+    lines = ["👥 Персонал", ""]
+    for member in staff.members():
+        if venue_id is not None and member.venue_id != venue_id:
+            continue
+        lines.append(f"{'🟢' if member.user_id in on_duty else '⚪'} {member.describe()}")
+    lines.append("")
+    lines.append(f"На смене: {len(on_duty)}. Подсказка: /staff help")
+    return '\n'.join(lines)
+
+@router.command('staff')
+def staff_command(message):
+    if not staff.can(message.from_user.id, 'staff'):
+        return
+    
+    args = message.text.split()[1:]
+    command = args[0].lower() if args else 'list'
+    own_venue = staff.get(message.from_user.id).venue_id
+    if command in ('help', 'помощь'):
+        queue_message(message.chat.id, STAFF_USAGE, parse_mode='Markdown')
+        return
+    if command == 'list':
+        queue_message(message.chat.id, staff_list_text(own_venue))
+        return
+    
+    user_id = safe_int(args[1]) if len(args) > 1 else 0
+    if command not in ('add', 'role', 'shift', 'remove', 'venue') or not user_id:
+        queue_message(message.chat.id, "❌ Неверная команда. Подсказка: /staff help")
+        return
+    if not manages(message.from_user.id, user_id) or (command == 'venue' and own_venue is not None):
+        queue_message(message.chat.id, "⛔ Сотрудник другого заведения")
+        return
+    
+    if command in ('add', 'role'):
+        role = args[2].lower() if len(args) > 2 else ''
+        if role not in STAFF_PERMISSIONS:
+            queue_message(message.chat.id, "❌ Роль: owner, manager или host")
+            return
+        if command == 'role' and not staff.is_staff(user_id):
+            queue_message(message.chat.id, "❌ Сотрудник не найден")
+            return
+        if role != 'owner' and last_owner(user_id):
+            queue_message(message.chat.id, "⛔ Это единственный владелец")
+            return
+        fields = {'role': role}
+        if command == 'add' and len(args) > 3:
+            fields['name'] = ' '.join(args[3:])[:64]
+        if command == 'add' and own_venue is not None:
+            fields['venue_id'] = own_venue
+        staff.save(user_id, **fields)
+        # Открытые сессии бронирования у нового сотрудника больше не нужны
+        cleanup_user_data(user_id)
+    
+    elif command == 'shift':
+        if not staff.is_staff(user_id) or len(args) < 3:
+            queue_message(message.chat.id, "❌ Сотрудник не найден или не указаны дни")
+            return
+        shift, error = parse_shift(args[2], args[3] if len(args) > 3 else None)
+        if error:
+            queue_message(message.chat.id, error)
+            return
+        days, start, end = shift
+        staff.save(user_id, shift_days=days, shift_start=start, shift_end=end)
+    
+    elif command == 'venue':
+        venue_id = None if len(args) > 2 and args[2] == '*' else safe_int(args[2]) if len(args) > 2 else 0
+        if not staff.is_staff(user_id) or (venue_id is not None and venue_id not in venues):
+            queue_message(message.chat.id, "❌ Сотрудник или заведение не найдены. Заведения: /venues")
+            return
+        staff.save(user_id, venue_id=venue_id)
+    
+    else:
+        if last_owner(user_id):
+            queue_message(message.chat.id, "⛔ Это единственный владелец")
+            return
+        if not staff.remove(user_id):
+            queue_message(message.chat.id, "❌ Сотрудник не найден")
+            return
+        AdminStates.set_bulk_selection(user_id, ())
+    
+    logger.info(f"👥 Персонал изменен ({command} {user_id}) администратором {message.from_user.id}")
+    queue_message(message.chat.id, staff_list_text(own_venue))
+
+# === УПРАВЛЕНИЕ ЗАВЕДЕНИЯМИ ===
+VENUES_USAGE = """
+🏢 *Заведения*
+
+`/venues` - список
+`/venues add Название | Адрес | Телефон` - новое заведение с типовой расстановкой столов
+`/venues set ID поле значение` - изменить настройку, например `/venues set 2 closes_week 01:00`
+`/venues on ID` / `/venues off ID` - открыть или скрыть от гостей
+
+• поля: name, address, phone, description, entertainment, hours\\_week, hours\\_weekend,
+opens, closes\\_week, closes\\_weekend, last\\_slot\\_week, last\\_slot\\_weekend, weekend\\_days
+• время - ЧЧ:ММ, выходные - цифры 1-7 (5 - пятница)
+• праздники, особые вечера и закрытые дни - /schedule
+"""
+VENUE_TIME_FIELDS= ('opens', 'closes_week', 'closes_weekend', 'last_slot_week', 'last_slot_weekend')
+
+def venues_list_text():
+    lines = ["🏢 Заведения", ""]
+    for venue in venues.all():
+        lines.append(f"{'🟢' if venue['active'] else '⚪'} #{venue['id']} {venue['name']} · {venue['address']} · {venue['phone']}")
+        lines.append(f"   🕒 {venue['opens']}-{venue['closes_week']} / {venue['closes_weekend']}, слоты до {venue['last_slot_week']} / {venue['last_slot_weekend']}")
+    lines.append("")
+    lines.append("Подсказка: /venues help")
+    return '\n'.join(lines)
+
+def parse_venue_value(field, value):
+    """Проверка значения настройки; (значение, None) или (None, текст ошибки)"""
+    if field in VENUE_TIME_FIELDS:
+        try:
+            return clock(value).strftime('%H:%M'), None
+        except ValueError:
+            return None, "❌ Время в формате ЧЧ:ММ"
+    if field == 'weekend_days':
+        shift, error = parse_shift(value)
+        return (shift[0], None) if shift else (None, "❌ Выходные - цифры от 1 до 7")
+    if not value:
+        return None, "❌ Пустое значение"
+    return value[:200], None
+
+@router.command('venues')
+def venues_command(message):
+    # Заведениями управляет владелец сети - без привязки к заведению
+    member = staff.get(message.from_user.id)
+    if member is None or not member.can('staff') or member.venue_id is not None:
+        return
+    
+    parts = message.text.split(maxsplit=2)
+    command = parts[1].lower() if len(parts) > 1 else 'list'
+    rest = parts[2].strip() if len(parts) > 2 else ''
+    if command in ('help', 'помощь'):
+        queue_message(message.chat.id, VENUES_USAGE, parse_mode='Markdown')
+        return
+    
+    if command == 'add':
+        fields = [field.strip() for field in rest.split('|')]
+        if len(fields) != 3 or not all(fields):
+            queue_message(message.chat.id, "❌ Формат: /venues add Название | Адрес | Телефон")
+            return
+        venue_id = venues.save(name=fields[0][:200], address=fields[1][:200], phone=fields[2][:200])
+    elif command in ('on', 'off', 'set'):
+        args = rest.split(maxsplit=2)
+        venue_id = safe_int(args[0]) if args else 0
+        if venue_id not in venues:
+            queue_message(message.chat.id, "❌ Заведение не найдено")
+            return
+        if command == 'set':
+            field = args[1] if len(args) > 1 else ''
+            if field not in VENUE_FIELDS or field in ('id', 'active'):
+                queue_message(message.chat.id, "❌ Неизвестное поле. Подсказка: /venues help")
+                return
+            value, error = parse_venue_value(field, args[2].strip() if len(args) > 2 else '')
+            if error:
+                queue_message(message.chat.id, error)
+                return
+            venues.save(venue_id, **{field: value})
+        else:
+            if command == 'off' and [venue['id'] for venue in venues.active()] == [venue_id]:
+                queue_message(message.chat.id, "⛔ Это единственное открытое заведение")
+                return
+            venues.save(venue_id, active=int(command == 'on'))
+    elif command != 'list':
+        queue_message(message.chat.id, "❌ Неверная команда. Подсказка: /venues help")
+        return
+    else:
+        queue_message(message.chat.id, venues_list_text())
+        return
+    
+    logger.info(f"🏢 Заведение #{venue_id} изменено ({command}) администратором {message.from_user.id}")
+    queue_message(message.chat.id, venues_list_text())
+
+# === УПРАВЛЕНИЕ РАСПИСАНИЕМ ===
+SCHEDULE_USAGE = """
+📆 *Расписание*
+
+`/schedule` - правила на ближайшие даты
+`/schedule closed 31.12.2026 Новогодняя ночь` - закрыть дни
+`/schedule hours 01.01.2027-07.01.2027 18:00-04:00` - другие часы
+`/schedule event 14.02.2027 18:00-03:00 День влюбленных` - особый вечер, часы необязательны
+`/schedule remove ID` - удалить правило
+
+• даты - ДД.ММ.ГГГГ или ДД.ММ.ГГГГ-ДД.ММ.ГГГГ
+• после дат можно указать дни недели цифрами 1-7, например `/schedule hours 01.06.2027-31.08.2027 56 16:00-05:00`
+• последний слот - за час до закрытия
+• правила действуют в текущем заведении, обычные часы - /venues
+"""
+SCHEDULE_KIND_NAMES = {'hours': '🕒 часы', 'event': '🎉 вечер', 'closed': '🚫 закрыто'}
+
+def parse_schedule_rule(kind, args):
+    """Разбор правила /schedule; (поля, None) или (None, текст ошибки)"""
+    dates = args[0].split('-') if args else []
+    try:
+        date_from, date_to = parse_date(dates[0]), parse_date(dates[-1])
+    except (ValueError, IndexError):
+        return None, "❌ Даты в формате ДД.ММ.ГГГГ или ДД.ММ.ГГГГ-ДД.ММ.ГГГГ"
+    if len(dates) > 2 or date_to < date_from or date_to < datetime.date.today():
+        return None, "❌ Неверный диапазон дат"
+    
+    rule = {'kind': kind, 'date_from': date_from, 'date_to': date_to, 'weekdays': WEEKDAY_DIGITS}
+    rest = args[1:]
+    if rest and rest[0].isdigit():
+        if any(day not in WEEKDAY_DIGITS for day in rest[0]):
+            return None, "❌ Дни недели - цифры от 1 до 7"
+        rule['weekdays'] = ''.join(sorted(set(rest[0])))
+        rest = rest[1:]
+    if kind != 'closed' and rest and SHIFT_PATTERN.fullmatch(rest[0]):
+        try:
+            opens, closes = (clock(value) for value in SHIFT_PATTERN.fullmatch(rest[0]).groups())
+        except ValueError:
+            return None, "❌ Часы в формате ЧЧ:ММ-ЧЧ:ММ"
+        last_slot = (datetime.datetime.combine(datetime.date.min + timedelta(days=1), closes) - timedelta(hours=1)).time()
+        if night_order(last_slot) < night_order(opens):
+            last_slot = opens
+        rule.update(opens=opens.strftime('%H:%M'), closes=closes.strftime('%H:%M'), last_slot=last_slot.strftime('%H:%M'))
+        rest = rest[1:]
+    elif kind == 'hours':
+        return None, "❌ Укажите часы: ЧЧ:ММ-ЧЧ:ММ"
+    rule['note'] = ' '.join(rest)[:100]
+    if kind == 'event' and not rule['note']:
+        return None, "❌ Укажите название вечера"
+    return rule, None
+
+def active_bookings_between(venue_id, date_from, date_to):
+    """Действующие брони заведения на дни визита date_from..date_to"""
+    with db.connection() as cursor:
+        cursor.execute('''
+            SELECT COUNT(*) FROM bookings
+            WHERE venue_id = ? AND status IN ('pending', 'approved') AND start_ts >= ? AND start_ts < ?
+        ''', (venue_id, format_ts(datetime.datetime.combine(date_from, NOON)),
+              format_ts(datetime.datetime.combine(date_to + timedelta(days=1), NOON))))
+        return cursor.fetchone()[0]
+
+def schedule_list_text(venue_id):
+    today = datetime.date.today()
+    lines = [f"📆 Расписание: {venues.get(venue_id)['name']}", ""]
+    rules = [rule for rule in schedule.rules(venue_id) if rule['date_to'] >= today]
+    for rule in sorted(rules, key=lambda rule: (rule['date_from'], rule['id'])):
+        dates = rule['date_from'].strftime('%d.%m.%Y')
+        if rule['date_to'] != rule['date_from']:
+            dates += f"-{rule['date_to'].strftime('%d.%m.%Y')}"
+        days = f" (дни {rule['weekdays']})" if rule['weekdays'] != WEEKDAY_DIGITS else ''
+        hours = f" {rule['opens']}-{rule['closes']}, слоты до {rule['last_slot']}" if rule['opens'] else ''
+        lines.append(f"#{rule['id']} {SCHEDULE_KIND_NAMES[rule['kind']]} {dates}{days}{hours} {rule['note']}".rstrip())
+    if not rules:
+        lines.append("Особых дней нет - действуют обычные часы")
+    lines.append("")
+    lines.append("Подсказка: /schedule help")
+    return '\n'.join(lines)
+
+@router.command('schedule')
+def schedule_command(message):
+    if not staff.can(message.from_user.id, 'staff'):
+        return
+    
+    venue_id = current_venue(message.from_user.id)
+    args = message.text.split()[1:]
+    command = args[0].lower() if args else 'list'
+    if command in ('help', 'помощь'):
+        queue_message(message.chat.id, SCHEDULE_USAGE, parse_mode='Markdown')
+        return
+    
+    if command == 'remove':
+        rule_id = safe_int(args[1]) if len(args) > 1 else 0
+        if not schedule.remove_rule(venue_id, rule_id):
+            queue_message(message.chat.id, "❌ Правило не найдено")
+            return
+    elif command in SCHEDULE_KINDS:
+        rule, error = parse_schedule_rule(command, args[1:])
+        if error:
+            queue_message(message.chat.id, error)
+            return
+        rule_id = schedule.add_rule(venue_id, created_by=message.from_user.id, **rule)
+        booked = active_bookings_between(venue_id, rule['date_from'], rule['date_to'])
+        if booked:
+            queue_message(message.chat.id, f"⚠️ На эти даты уже есть действующих броней: {booked}. Они не отменяются автоматически")
+    elif command != 'list':
+        queue_message(message.chat.id, "❌ Неверная команда. Подсказка: /schedule help")
+        return
+    else:
+        queue_message(message.chat.id, schedule_list_text(venue_id))
+        return
+    
+    logger.info(f"📆 Расписание заведения #{venue_id} изменено ({command}) администратором {message.from_user.id}")
+    queue_message(message.chat.id, schedule_list_text(venue_id))
+
+# === ЭКСПОРТ ===
+# /export читает строки курсором пачками по EXPORT_BATCH и сразу пишет их в gzip-файл,
+# поэтому память не зависит от числа строк. Выгрузка идет в отдельном потоке,
+# обработчики обновлений ее не ждут; выгрузки разных администраторов выполняются по очереди.
+EXPORT_BATCH = 1000
+EXPORT_MAX_BYTES = 49 * 1024 * 1024   # лимит Bot API на документ - 50 МБ
+
+EXPORTS = {
+    'bookings': {
+        'title': 'брони',
+        'table': 'bookings',
+        'columns': ('id', 'venue_id', 'user_id', 'user_name', 'phone', 'booking_date', 'booking_time', 'start_ts',
+                    'guests', 'comment', 'status', 'admin_reply', 'created_at'),
+        'statuses': ('pending', 'approved', 'rejected', 'cancelled_by_user', 'seated', 'no_show'),
+        'date_column': 'start_ts',
+        'archive': 'archive.bookings',
+    },
+    'reviews': {
+        'title': 'отзывы',
+        'table': 'reviews',
+        'columns': ('id', 'venue_id', 'user_id', 'user_name', 'rating', 'review_text', 'status', 'created_at'),
+        'statuses': ('pending', 'published', 'rejected'),
+        'date_column': 'created_at',
+    },
+}
+EXPORT_ALIASES = {'bookings': 'bookings', 'брони': 'bookings', 'reviews': 'reviews', 'отзывы': 'reviews'}
+EXPORT_FORMATS = {'csv': 'csv', 'json': 'ndjson', 'ndjson': 'ndjson'}
+
+EXPORT_USAGE = """
+📤 *Экспорт данных*
+
+`/export [bookings|reviews] [csv|json] [статус] [ДД.ММ.ГГГГ [ДД.ММ.ГГГГ]]`
+
+• по умолчанию - все брони в CSV
+• одна дата - только этот день, две - период включительно
+• даты броней - дни визита, отзывов - дни отправки
+• статусы броней: pending, approved, rejected, cancelled\\_by\\_user, seated, no\\_show
+• статусы отзывов: pending, published, rejected
+• сотрудник заведения получает только данные своего заведения
+
+Пример: `/export bookings json approved 01.06.2025 30.06.2025`
+"""
+
+export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export')
+
+def parse_export_args(args, venue_id=None):
+    """Разбор аргументов /export; (параметры, None) или (None, текст ошибки)"""
+    request = {'kind': 'bookings', 'format': 'csv', 'status': None, 'dates': [], 'venue': venue_id}
+    for arg in args:
+        token = arg.lower()
+        if token in EXPORT_ALIASES:
+            request['kind'] = EXPORT_ALIASES[token]
+        elif token in EXPORT_FORMATS:
+            request['format'] = EXPORT_FORMATS[token]
+        elif DATE_PATTERN.fullmatch(token):
+            try:
+                request['dates'].append(parse_date(token))
+            except ValueError:
+                return None, f"❌ Неверная дата: {arg}"
+        else:
+            request['status'] = token
+    
+    export = EXPORTS[request['kind']]
+    if request['status'] and request['status'] not in export['statuses']:
+        return None, f"❌ Неизвестный статус для выгрузки «{export['title']}»: {request['status']}"
+    if len(request['dates']) > 2:
+        return None, "❌ Укажите одну дату или две даты периода"
+    if len(request['dates']) == 2 and request['dates'][0] > request['dates'][1]:
+        return None, "❌ Начало периода позже конца"
+    return request, None
+
+def fetch_batches(cursor):
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH)
+        if not rows:
+            break
+        yield from rows
+
+def export_rows(request):
+    """Генератор строк выгрузки по возрастанию id: рабочая таблица и архив сливаются
+    без сортировки в памяти, курсоры читаются пачками, соединение занято до конца выгрузки"""
+    export = EXPORTS[request['kind']]
+    conditions, params = [], []
+    if request.get('venue') is not None:
+        conditions.append('venue_id = ?')
+        params.append(request['venue'])
+    if request['status']:
+        conditions.append('status = ?')
+        params.append(request['status'])
+    if request['dates']:
+        first, last = request['dates'][0], request['dates'][-1]
+        if request['kind'] == 'bookings':
+            # День визита длится до утра: слоты после полуночи относятся к предыдущей дате
+            low = datetime.datetime.combine(first, datetime.time(12))
+            high = datetime.datetime.combine(last + timedelta(days=1), datetime.time(12))
+        else:
+            low = datetime.datetime.combine(first, datetime.time.min)
+            high = datetime.datetime.combine(last + timedelta(days=1), datetime.time.min)
+        conditions.append(f"{export['date_column']} >= ? AND {export['date_column']} < ?")
+        params += [format_ts(low), format_ts(high)]
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    tables = (export['table'], export['archive']) if 'archive' in export else (export['table'],)
+    with db.connection() as cursor:
+        streams = []
+        for table in tables:
+            table_cursor = cursor.connection.cursor()
+            table_cursor.execute(f"SELECT {', '.join(export['columns'])} FROM {table} {where} ORDER BY id", params)
+            streams.append(fetch_batches(table_cursor))
+        
+        last_id = None
+        for row in heapq.merge(*streams, key=lambda row: row[0]):
+            # Во время переноса бронь может на мгновение оказаться в обеих таблицах
+            if row[0] != last_id:
+                yield row
+            last_id = row[0]
+
+def csv_lines(columns, rows):
+    """Строки CSV по одной; BOM нужен, чтобы Excel открыл UTF-8 без вопросов"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield '\ufeff' + buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+def ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+
+def write_export(request, path):
+    """Пишет выгрузку в gzip-файл; возвращает число строк"""
+    columns = EXPORTS[request['kind']]['columns']
+    counted = {'rows': 0}
+    
+    def counting(rows):
+        for row in rows:
+            counted['rows'] += 1
+            yield row
+    
+    lines = (csv_lines if request['format'] == 'csv' else ndjson_lines)(columns, counting(export_rows(request)))
+    with gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=6) as output:
+        for line in lines:
+            output.write(line)
+    return counted['rows']
+
+def export_file_name(request):
+    period = ''
+    if request['dates']:
+        period = '_' + '_'.join(date.strftime('%Y%m%d') for date in request['dates'])
+    status = f"_{request['status']}" if request['status'] else ''
+    status = (f"_venue{request['venue']}" if request.get('venue') is not None else '') + status
+    extension = 'csv' if request['format'] == 'csv' else 'ndjson'
+    return f"{request['kind']}{status}{period}.{extension}.gz"
+
+def send_document_file(chat_id, path, file_name, caption):
+    # Файл открывается на каждую попытку, чтобы повтор после 429 отправил его целиком
+    with open(path, 'rb') as document:
+        return bot.send_document(chat_id, document, caption=caption, visible_file_name=file_name)
+
+def run_export(chat_id, request):
+    """Выгрузка в фоновом потоке: файл во временном каталоге, отправка через очередь"""
+    started = time_module.perf_counter()
+    file_name = export_file_name(request)
+    handle, path = tempfile.mkstemp(suffix='.gz', prefix='export-')
+    os.close(handle)
+    try:
+        rows = write_export(request, path)
+        size = os.path.getsize(path)
+        if not rows:
+            queue_message(chat_id, "📭 По заданным условиям ничего не найдено")
+            return
+        if size > EXPORT_MAX_BYTES:
+            queue_message(chat_id, f"❌ Файл получился {size / 1024 / 1024:.1f} МБ, больше лимита Telegram. Сузьте период.")
+            return
+        
+        caption = f"📤 {EXPORTS[request['kind']]['title'].capitalize()}: {rows} строк, {size / 1024:.0f} КБ"
+        outbound.submit(chat_id, send_document_file, chat_id, path, file_name, caption, priority=PRIORITY_BULK).result(timeout=600)
+        logger.info(f"📤 Экспорт {file_name}: {rows} строк, {size} байт за {time_module.perf_counter() - started:.1f} с")
+    except Exception as e:
+        logger.error(f"❌ Ошибка экспорта {file_name}: {e}")
+        queue_message(chat_id, "❌ Не удалось выполнить экспорт")
+    finally:
+        EXPORT_SECONDS.observe(time_module.perf_counter() - started, request['kind'])
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+@router.command('export')
+def export_command(message):
+    if not staff.can(message.from_user.id, 'reports'):
+        return
+    
+    args = message.text.split()[1:]
+    if args and args[0].lower() in ('help', 'помощь'):
+        queue_message(message.chat.id, EXPORT_USAGE, parse_mode='Markdown')
+        return
+    
+    request, error = parse_export_args(args, staff.get(message.from_user.id).venue_id)
+    if error:
+        queue_message(message.chat.id, f"{error}\nПодсказка: /export help")
+        return
+    
+    export_executor.submit(run_export, message.chat.id, request)
+    queue_message(message.chat.id, f"⏳ Готовлю файл {export_file_name(request)}, пришлю документом")
+
+# === ОБРАБОТКА ОТВЕТОВ АДМИНИСТРАТОРА ===
+@router.state('admin_booking_reply')
+def handle_admin_reply(message):
+    booking_id = AdminStates.get_booking_reply_mode(message.from_user.id)
+    if not booking_id:
+        return
+        
+    reply_text = message.text
+    
+    with db.transaction() as cursor:
+        cursor.execute('SELECT venue_id FROM bookings WHERE id = ?', (booking_id,))
+        row = cursor.fetchone()
+        if row and not staff.can(message.from_user.id, 'moderate', row[0]):
+            AdminStates.clear_booking_reply_mode(message.from_user.id)
+            queue_message(message.chat.id, "⛔ Бронь другого заведения")
+            return
+        cursor.execute('UPDATE bookings SET admin_reply = ? WHERE id = ?', (reply_text, booking_id))
+        cursor.execute('INSERT INTO admin_replies (booking_id, admin_id, reply_text) VALUES (?, ?, ?)', 
+                      (booking_id, message.from_user.id, reply_text))
+        
+        cursor.execute('SELECT user_id, user_name, booking_date, booking_time, guests, comment, venue_id FROM bookings WHERE id = ?', (booking_id,))
+        booking = cursor.fetchone()
+    
+    # Отправляем ответ гостю
+    if booking:
+        user_message = f"""
+👑 *Ответ от администратора лаундж-бара:*
+
+💬 *{reply_text}*
+
+*По вопросам бронирования:*
+📞 {venues.get(booking[6])['phone']}
+        """
+        
+        admin_id = message.from_user.id
+        
+        # Уведомление о результате после фактической отправки
+        def report_delivery(future):
+            if future.result():
+                queue_message(admin_id, "✅ Ответ успешно отправлен гостю!")
+            else:
+                queue_message(admin_id, "❌ Не удалось отправить ответ гостю (возможно, заблокировал бота)")
+        
+        queue_message(booking[0], user_message, parse_mode='Markdown').add_done_callback(report_delivery)
+    
+    # Очищаем режим ответа
+    AdminStates.clear_booking_reply_mode(message.from_user.id)
+
+# === СИСТЕМА УВЕДОМЛЕНИЙ ===
+REMINDER_24H = '24h'
+REMINDER_1H = '1h'
+REMINDER_OFFSETS = {
+    REMINDER_24H: timedelta(hours=24),
+    REMINDER_1H: timedelta(hours=1),
+}
+
+class ReminderScheduler:
+    """Очередь напоминаний на min-heap по времени отправки.
+    
+    Источник истины - таблица bookings (start_ts и флаги reminder_*_sent),
+    поэтому после перезапуска очередь восстанавливается из базы.
+    """
+    
+    def __init__(self):
+        self._heap = []
+        self._jobs = {}
+        self._cond = threading.Condition()
+    
+    def __len__(self):
+        with self._cond:
+            return len(self._jobs)
+    
+    def _push(self, booking_id, kind, due):
+        self._jobs[(booking_id, kind)] = due
+        heapq.heappush(self._heap, (due, booking_id, kind))
+    
+    def schedule_booking(self, booking_id, start):
+        """Ставит напоминания для одобренной брони"""
+        with self._cond:
+            for kind, offset in REMINDER_OFFSETS.items():
+                self._push(booking_id, kind, start - offset)
+            self._cond.notify()
+    
+    def schedule_job(self, booking_id, kind, due):
+        with self._cond:
+            self._push(booking_id, kind, due)
+            self._cond.notify()
+    
+    def cancel_booking(self, booking_id):
+        """Снимает напоминания; записи в куче удаляются лениво"""
+        with self._cond:
+            for kind in REMINDER_OFFSETS:
+                self._jobs.pop((booking_id, kind), None)
+            if len(self._heap) > 2 * len(self._jobs) + 64:
+                self._heap = [(due, booking_id, kind) for (booking_id, kind), due in self._jobs.items()]
+                heapq.heapify(self._heap)
+    
+    def rebuild_from_db(self):
+        """Восстановление очереди: только будущие одобренные брони с неотправленными напоминаниями"""
+        now = datetime.datetime.now()
+        with db.connection() as cursor:
+            cursor.execute('''
+                SELECT id, start_ts, reminder_24h_sent, reminder_1h_sent
+                FROM bookings
+                WHERE status = 'approved'
+                AND start_ts > ?
+                AND (reminder_24h_sent = 0 OR reminder_1h_sent = 0)
+            ''', (format_ts(now),))
+            rows = cursor.fetchall()
+        
+        with self._cond:
+            self._heap = []
+            self._jobs = {}
+            for booking_id, start_ts, sent_24h, sent_1h in rows:
+                start = datetime.datetime.strptime(start_ts, START_TS_FORMAT)
+                if not sent_24h:
+                    self._push(booking_id, REMINDER_24H, start - REMINDER_OFFSETS[REMINDER_24H])
+                if not sent_1h:
+                    self._push(booking_id, REMINDER_1H, start - REMINDER_OFFSETS[REMINDER_1H])
+            self._cond.notify()
+        logger.info(f"🔔 Восстановлено напоминаний: {len(rows)} броней")
+    
+    def _next_due(self):
+        """Ожидает ближайшее задание; вызывается под self._cond"""
+        while True:
+            while self._heap:
+                due, booking_id, kind = self._heap[0]
+                if self._jobs.get((booking_id, kind)) == due:
+                    break
+                heapq.heappop(self._heap)
+            
+            if not self._heap:
+                self._cond.wait()
+                continue
+            
+            delay = (self._heap[0][0] - datetime.datetime.now()).total_seconds()
+            if delay > 0:
+                self._cond.wait(delay)
+                continue
+            
+            due, booking_id, kind = heapq.heappop(self._heap)
+            del self._jobs[(booking_id, kind)]
+            return booking_id, kind, due
+    
+    def run(self):
+        while True:
+            with self._cond:
+                booking_id, kind, due = self._next_due()
+            REMINDER_LAG_SECONDS.observe(max(0.0, (datetime.datetime.now() - due).total_seconds()))
+            try:
+                with REMINDER_SECONDS.time(kind):
+                    send_reminder(booking_id, kind)
+            except Exception as e:
+                logger.error(f"❌ Ошибка в системе уведомлений: {e}")
+
+reminders = ReminderScheduler()
+metrics.gauge('bot_reminders_scheduled', 'Запланированных напоминаний', lambda: len(reminders))
+
+def send_reminder(booking_id, kind):
+    """Отправка одного напоминания с проверкой актуальности брони"""
+    flag_column = 'reminder_24h_sent' if kind == REMINDER_24H else 'reminder_1h_sent'
+    
+    with db.connection() as cursor:
+        cursor.execute(f'''
+            SELECT user_id, user_name, booking_date, booking_time, guests, comment, start_ts, venue_id
+            FROM bookings
+            WHERE id = ? AND status = 'approved' AND {flag_column} = 0
+        ''', (booking_id,))
+        booking = cursor.fetchone()
+    
+    if not booking:
+        return
+    
+    user_id, user_name, date, time, guests, comment, start_ts, venue_id = booking
+    venue = venues.get(venue_id)
+    now = datetime.datetime.now()
+    start = datetime.datetime.strptime(start_ts, START_TS_FORMAT)
+    
+    if kind == REMINDER_24H:
+        # Если до визита меньше часа, достаточно часового напоминания
+        if now >= start - REMINDER_OFFSETS[REMINDER_1H]:
+            mark_reminder_sent(booking_id, flag_column)
+            return
+        
+        day_word = "сегодня" if start.date() == now.date() else "завтра"
+        reminder_text = f"""
+🔔 *Напоминание о бронировании*
+
+Уважаемый(ая) {user_name}! 
+Напоминаем, что {day_word} *{date} в {time}* 
+у вас бронь в *{venue['name']}* на *{guests}* персон.
+
+{f"💬 *Ваш комментарий:* {comment}" if comment else ""}
+
+📍 *Адрес:* {venue['address']}
+📞 *Телефон:* {venue['phone']}
+{venue['entertainment']}
+
+*Подтвердите, пожалуйста, вашу явку:* 👇
+        """
+        
+        keyboard = InlineKeyboardMarkup()
+        keyboard.row(
+            InlineKeyboardButton("✅ Подтверждаю", callback_data=f"confirm_visit_{booking_id}"),
+            InlineKeyboardButton("❌ Отменить визит", callback_data=f"cancel_visit_{booking_id}")
+        )
+    else:
+        if now >= start:
+            mark_reminder_sent(booking_id, flag_column)
+            return
+        
+        reminder_text = f"""
+⏰ *Скоро встретимся!*
+
+Уважаемый(ая) {user_name}!
+Через 1 час в *{time}* ждем вас в *{venue['name']}*!
+
+*Напоминаем:*
+👥 *Гости:* {guests} персон
+{f"💬 *Ваш комментарий:* {comment}" if comment else ""}
+📍 *Адрес:* {venue['address']}
+📞 *Телефон:* {venue['phone']}
+{venue['entertainment']}
+
+*Ждем с нетерпением!* 🍝
+        """
+        keyboard = None
+    
+    def on_sent(future):
+        if future.result():
+            mark_reminder_sent(booking_id, flag_column)
+            logger.info(f"✅ Отправлено уведомление ({kind}) для брони #{booking_id}")
+        else:
+            logger.error(f"❌ Ошибка отправки уведомления ({kind}) для брони #{booking_id}")
+            retry_at = datetime.datetime.now() + timedelta(minutes=5)
+            if retry_at < start:
+                reminders.schedule_job(booking_id, kind, retry_at)
+    
+    queue_message(user_id, reminder_text, priority=PRIORITY_NORMAL, reply_markup=keyboard, parse_mode='Markdown').add_done_callback(on_sent)
+
+def mark_reminder_sent(booking_id, flag_column):
+    with db.transaction() as cursor:
+        cursor.execute(f'UPDATE bookings SET {flag_column} = 1 WHERE id = ?', (booking_id,))
+
+@router.callback('confirm_visit')
+def handle_visit_confirmation(call):
+    booking_id = safe_int(call.data.replace('confirm_visit_', ''))
+    if not booking_id:
+        bot.answer_callback_query(call.id, "❌ Неверный ID брони")
+        return
+    
+    # Подтверждает только владелец брони; персонал получает уведомление при первом подтверждении
+    user_id = call.from_user.id
+    with db.transaction() as cursor:
+        cursor.execute(
+            "UPDATE bookings SET visit_confirmed_at = ? WHERE id = ? AND user_id = ? AND status = 'approved' AND visit_confirmed_at IS NULL",
+            (format_ts(datetime.datetime.now()), booking_id, user_id)
+        )
+        confirmed = cursor.rowcount == 1
+        cursor.execute('SELECT user_name, booking_date, booking_time, venue_id FROM bookings WHERE id = ? AND user_id = ?', (booking_id, user_id))
+        booking = cursor.fetchone()
+        if confirmed:
+            reliability.record(cursor, user_id, 'confirmed')
+    
+    if confirmed:
+        reliability.applied(user_id, 'confirmed')
+    if booking and not confirmed:
+        bot.answer_callback_query(call.id, "✅ Визит уже подтвержден или бронь не действует")
+    elif booking:
+        user_name, date, time, venue_id = booking
+        
+        admin_notification = f"""
+✅ *Гость подтвердил визит*
+
+👤 *Гость:* {user_name}
+📅 *Дата:* {date}
+⏰ *Время:* {time}
+
+*Бронь #*{booking_id}
+        """
+        
+        try:
+            notify_staff(
+                admin_notification, booking_id, reply_markup=visit_keyboard(booking_id),
+                venue_id=venue_id, parse_mode='Markdown'
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки уведомления администратору: {e}")
+        
+        bot.answer_callback_query(call.id, "✅ Спасибо за подтверждение! Ждем вас!")
+    else:
+        bot.answer_callback_query(call.id, "❌ Бронь не найдена")
+
+@router.callback('cancel_visit')
+def handle_visit_cancellation(call):
+    booking_id = safe_int(call.data.replace('cancel_visit_', ''))
+    if not booking_id:
+        bot.answer_callback_query(call.id, "❌ Неверный ID брони")
+        return
+    
+    if cancel_by_guest(booking_id, call.from_user.id):
+        bot.answer_callback_query(call.id, "❌ Бронь отменена. Надеемся увидеть вас в другой раз!")
+    else:
+        bot.answer_callback_query(call.id, "❌ Бронь не найдена")
+
+def cancel_guest_booking(cursor, booking_id, user_id):
+    """Отмена брони ее владельцем внутри транзакции; False - чужая, уже решенная или нет такой"""
+    cursor.execute('SELECT user_id FROM bookings WHERE id = ?', (booking_id,))
+    row = cursor.fetchone()
+    if not row or row[0] != user_id:
+        return False
+    if not transition_booking(cursor, booking_id, 'cancelled_by_user', ('pending', 'approved')):
+        return False
+    release_tables(cursor, booking_id)
+    return True
+
+def forget_booking(booking_id):
+    """Снимает напоминания и освобождает столы в индексе после коммита отмены"""
+    reminders.cancel_booking(booking_id)
+    seating.release(booking_id)
+    waitlist.freed(booking_id)
+
+def cancel_by_guest(booking_id, user_id):
+    """Отмена брони гостем с уведомлением персонала; True, если отменена"""
+    with db.transaction() as cursor:
+        if not cancel_guest_booking(cursor, booking_id, user_id):
+            return False
+        cursor.execute('SELECT user_name, booking_date, booking_time, venue_id FROM bookings WHERE id = ?', (booking_id,))
+        user_name, date, time, venue_id = cursor.fetchone()
+    
+    forget_booking(booking_id)
+    guest_bookings.invalidate(user_id)
+    update_staff_notifications([booking_id], cancelled_keyboard())
+    
+    admin_notification = f"""
+❌ *Гость отменил визит*
+
+👤 *Гость:* {user_name}
+📅 *Дата:* {date}
+⏰ *Время:* {time}
+
+*Бронь #*{booking_id}
+    """
+    
+    try:
+        notify_staff(admin_notification, venue_id=venue_id, parse_mode='Markdown')
+    except Exception as e:
+        logger.error(f"❌ Ошибка отправки уведомления администратору: {e}")
+    return True
+
+# === ВИЗИТЫ И НАДЕЖНОСТЬ ГОСТЕЙ ===
+# Персонал отмечает одобренную бронь: гость пришел (seated) или не пришел (no_show).
+# Счетчики гостя лежат в guest_reliability и в памяти: {user_id: [пришел, не пришел, подтвердил]}.
+# Отметка меняет счетчик в БД в своей транзакции, в памяти - после коммита, поэтому
+# карточка заявки и списки показывают надежность без запросов к истории броней.
+# Гость с надежностью ниже DEPOSIT_MIN_SCORE бронирует с депозитом: платежей в боте нет,
+# администратор получает пометку и одобряет бронь после оплаты.
+NO_SHOW_GRACE = timedelta(minutes=int(os.environ.get('NO_SHOW_GRACE_MINUTES', 15)))
+SEAT_EARLY = timedelta(hours=3)         # «пришел» можно отметить заранее, например при раннем визите
+DEPOSIT_MIN_SCORE = float(os.environ.get('DEPOSIT_MIN_SCORE', 0.5))
+DEPOSIT_TEXT = os.environ.get(
+    'DEPOSIT_TEXT', 'Для этой брони нужен депозит - администратор свяжется с вами и подскажет, как его внести'
+)
+RELIABILITY_FIELDS = ('seated', 'no_shows', 'confirmed')
+RELIABILITY_PRIOR = 2   # новый гость считается дважды пришедшим: одна неявка не требует депозита
+
+VISIT_MARKS = {
+    'seated': ('seated', 'seated', "🪑 Пришел"),
+    'noshow': ('no_show', 'no_shows', "🚫 Не пришел"),
+}
+
+VISIT_MARKED = metrics.counter('bot_visit_marks_total', 'Отметки визита персоналом', ('status',))
+
+class ReliabilityIndex:
+    """Счетчики визитов гостей в памяти; запись - в транзакции отметки, затем applied()"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._guests = {}
+    
+    def load_from_db(self):
+        with db.connection() as cursor:
+            cursor.execute('SELECT user_id, seated, no_shows, confirmed FROM guest_reliability')
+            guests = {row[0]: list(row[1:]) for row in cursor.fetchall()}
+        with self._lock:
+            self._guests = guests
+        logger.info(f"🎯 Надежность гостей: {len(guests)}")
+    
+    def __len__(self):
+        return len(self._guests)
+    
+    def counts(self, user_id):
+        return tuple(self._guests.get(user_id, (0, 0, 0)))
+    
+    def record(self, cursor, user_id, field):
+        """+1 к счетчику гостя внутри транзакции"""
+        cursor.execute(f'''
+            INSERT INTO guest_reliability (user_id, {field}) VALUES (?, 1)
+            ON CONFLICT (user_id) DO UPDATE SET {field} = {field} + 1, updated_at = CURRENT_TIMESTAMP
+        ''', (user_id,))
+    
+    def applied(self, user_id, field):
+        """То же изменение в памяти после коммита"""
+        with self._lock:
+            self._guests.setdefault(user_id, [0, 0, 0])[RELIABILITY_FIELDS.index(field)] += 1
+    
+    def score(self, user_id):
+        """Доля визитов с поправкой на RELIABILITY_PRIOR; None - отметок еще не было"""
+        seated, no_shows, _ = self.counts(user_id)
+        if not seated and not no_shows:
+            return None
+        return (seated + RELIABILITY_PRIOR) / (seated + no_shows + RELIABILITY_PRIOR)
+    
+    def needs_deposit(self, user_id):
+        score = self.score(user_id)
+        return score is not None and score < DEPOSIT_MIN_SCORE
+    
+    def badge(self, user_id):
+        """Строка для персонала; пустая - истории у гостя нет"""
+        seated, no_shows, confirmed = self.counts(user_id)
+        parts = []
+        score = self.score(user_id)
+        if score is not None:
+            parts += [f"{score:.0%}", f"пришел {seated}", f"не пришел {no_shows}"]
+        if confirmed:
+            parts.append(f"подтверждал {confirmed}")
+        return ' · '.join(parts)
+
+reliability = ReliabilityIndex()
+metrics.gauge('bot_guests_with_history', 'Гостей со счетчиками визитов', lambda: len(reliability))
+
+def visit_buttons(booking_id, suffix=''):
+    return [
+        InlineKeyboardButton(f"{label}{suffix}", callback_data=f"visit_{mark}_{booking_id}")
+        for mark, (_, _, label) in VISIT_MARKS.items()
+    ]
+
+def visit_keyboard(booking_id):
+    """Кнопки отметки визита"""
+    keyboard = InlineKeyboardMarkup()
+    keyboard.row(*visit_buttons(booking_id))
+    return keyboard
+
+def visit_marked_keyboard(mark, staff_id):
+    """Клавиатура отмеченного визита: что и кто отметил"""
+    keyboard = InlineKeyboardMarkup()
+    keyboard.row(InlineKeyboardButton(f"{VISIT_MARKS[mark][2]} · {staff.title(staff_id)}", callback_data="ignore"))
+    return keyboard
+
+def mark_visit(booking_id, mark, staff_id, now=None):
+    """Отметка визита одобренной брони; None - отмечено, иначе текст ошибки.
+    
+    «Не пришел» ставится не раньше NO_SHOW_GRACE после начала и освобождает столы,
+    «пришел» - не раньше SEAT_EARLY до начала. Отметка ставится один раз.
+    """
+    new_status, field, _ = VISIT_MARKS[mark]
+    now = now or datetime.datetime.now()
+    with db.transaction() as cursor:
+        cursor.execute('SELECT user_id, start_ts, venue_id FROM bookings WHERE id = ?', (booking_id,))
+        row = cursor.fetchone()
+        if not row:
+            return "❌ Бронь не найдена"
+        user_id, start_ts, venue_id = row
+        if not staff.can(staff_id, 'moderate', venue_id):
+            return "⛔ Бронь другого заведения"
+        start = datetime.datetime.strptime(start_ts, START_TS_FORMAT)
+        if new_status == 'no_show' and now < start + NO_SHOW_GRACE:
+            return f"⏳ Неявку можно отметить после {(start + NO_SHOW_GRACE).strftime('%H:%M')}"
+        if new_status == 'seated' and now < start - SEAT_EARLY:
+            return "⏳ До визита еще больше 3 часов"
+        if not transition_booking(cursor, booking_id, new_status, ('approved',)):
+            return "⚠️ Визит уже отмечен или бронь не действует"
+        cursor.execute(
+            'UPDATE bookings SET visit_marked_by = ?, visit_marked_at = ? WHERE id = ?',
+            (staff_id, format_ts(now), booking_id)
+        )
+        reliability.record(cursor, user_id, field)
+        if new_status == 'no_show':
+            release_tables(cursor, booking_id)
+    
+    reliability.applied(user_id, field)
+    VISIT_MARKED.inc(new_status)
+    if new_status == 'no_show':
+        forget_booking(booking_id)
+    else:
+        reminders.cancel_booking(booking_id)
+    guest_bookings.invalidate(user_id)
+    update_staff_notifications([booking_id], visit_marked_keyboard(mark, staff_id))
+    logger.info(f"🎯 Бронь #{booking_id}: {new_status}, гость {user_id} - {reliability.badge(user_id)}")
+    return None
+
+@router.callback('visit_seated', 'visit_noshow')
+def handle_visit_mark(call):
+    if not staff.can(call.from_user.id, 'moderate'):
+        bot.answer_callback_query(call.id, "⛔ Доступ запрещен")
+        return
+    
+    _, mark, booking_id = call.data.split('_')
+    booking_id = safe_int(booking_id)
+    if not booking_id:
+        bot.answer_callback_query(call.id, "❌ Неверный ID брони")
+        return
+    
+    error = mark_visit(booking_id, mark, call.from_user.id)
+    if error:
+        bot.answer_callback_query(call.id, error)
+        return
+    bot.answer_callback_query(call.id, "🪑 Гость отмечен" if mark == 'seated' else "🚫 Неявка отмечена")
+    
+    anchor = listing_anchor(call.message)
+    if anchor:
+        _, kind, _, packed_ts, anchor_id = anchor.split('_')
+        show_listing(
+            call.message.chat.id, kind, 'here', unpack_anchor(packed_ts, anchor_id),
+            message_id=call.message.message_id, venue_id=current_venue(call.from_user.id)
+        )
+
+# === МОИ БРОНИ ===
+# Предстоящие брони гостя читаются одним диапазонным запросом по индексу (user_id, start_ts):
+# прошлые визиты постоянного гостя в него не попадают. Результат кэшируется по гостю
+# и сбрасывается после каждой смены статуса его броней.
+MY_BOOKINGS_LIMIT = 10
+MY_BOOKING_STATUSES = {'pending': '⏳ ждет подтверждения', 'approved': '✅ подтверждена'}
+
+class GuestBookingsCache:
+    """LRU-кэш предстоящих броней по гостям"""
+    
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._invalidations = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, user_id):
+        with self._lock:
+            rows = self._items.get(user_id)
+            if rows is not None:
+                self._items.move_to_end(user_id)
+                self.hits += 1
+                return rows
+            self.misses += 1
+            invalidations = self._invalidations
+        
+        rows = fetch_upcoming_bookings(user_id)
+        with self._lock:
+            # Если пока шел запрос, чьи-то брони изменились, результат может быть устаревшим
+            if invalidations == self._invalidations:
+                self._items[user_id] = rows
+                if len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+        return rows
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            self._invalidations += 1
+            self._items.pop(user_id, None)
+
+guest_bookings = GuestBookingsCache()
+
+def fetch_upcoming_bookings(user_id):
+    """Действующие брони гостя от текущего слота по времени начала"""
+    since = datetime.datetime.now() - BOOKING_DURATION
+    with db.connection() as cursor:
+        cursor.execute('''
+            SELECT id, venue_id, booking_date, booking_time, guests, status, start_ts
+            FROM bookings
+            WHERE user_id = ? AND start_ts > ? AND status IN ('pending', 'approved')
+            ORDER BY start_ts
+            LIMIT ?
+        ''', (user_id, format_ts(since), MY_BOOKINGS_LIMIT))
+        return tuple(cursor.fetchall())
+
+def render_my_bookings(user_id):
+    """Текст и клавиатура списка; уже начавшиеся брони показываются без кнопок"""
+    now = format_ts(datetime.datetime.now())
+    rows = guest_bookings.get(user_id)
+    if not rows:
+        return "📭 У вас нет предстоящих броней", None
+    
+    several = len(venues.active()) > 1
+    lines = ["📋 *Ваши брони*", ""]
+    keyboard = InlineKeyboardMarkup()
+    for booking_id, venue_id, date, time, guests, status, start_ts in rows:
+        lines.append(f"*#{booking_id}* {date} {time} · {guests} чел. · {MY_BOOKING_STATUSES[status]}")
+        if several:
+            lines.append(f"🏢 {venues.get(venue_id)['name']}")
+        if start_ts > now:
+            keyboard.row(
+                InlineKeyboardButton(f"🔁 Перенести #{booking_id}", callback_data=f"my_move_{booking_id}"),
+                InlineKeyboardButton(f"❌ Отменить #{booking_id}", callback_data=f"my_cancel_{booking_id}")
+            )
+    return '\n'.join(lines), keyboard
+
+@router.text('📋 Мои брони')
+def show_my_bookings(message):
+    text, keyboard = render_my_bookings(message.from_user.id)
+    queue_message(message.chat.id, text, reply_markup=keyboard, parse_mode='Markdown')
+
+@router.callback('my_cancel', 'my_move')
+def handle_my_booking(call):
+    user_id = call.from_user.id
+    booking_id = safe_int(call.data.rsplit('_', 1)[1])
+    booking = next((row for row in guest_bookings.get(user_id) if row[0] == booking_id), None)
+    if booking is None or booking[6] <= format_ts(datetime.datetime.now()):
+        bot.answer_callback_query(call.id, "⚠️ Бронь уже изменена или прошла")
+    elif call.data.startswith('my_cancel_'):
+        if cancel_by_guest(booking_id, user_id):
+            bot.answer_callback_query(call.id, f"❌ Бронь #{booking_id} отменена")
+        else:
+            bot.answer_callback_query(call.id, "⚠️ Бронь уже изменена")
+    elif start_reschedule(call.message.chat.id, user_id, booking_id):
+        bot.answer_callback_query(call.id, "📅 Выберите новую дату")
+        return
+    else:
+        bot.answer_callback_query(call.id, "❌ Бронь не найдена")
+    
+    text, keyboard = render_my_bookings(user_id)
+    outbound.submit(
+        call.message.chat.id, bot.edit_message_text, text, call.message.chat.id, call.message.message_id,
+        reply_markup=keyboard, parse_mode='Markdown', priority=PRIORITY_URGENT
+    )
+
+def start_reschedule(chat_id, user_id, booking_id):
+    """Сессия бронирования с данными прежней брони: гость выбирает только дату и время.
+    False - брони нет, она чужая или уже не действует"""
+    with db.connection() as cursor:
+        cursor.execute(
+            "SELECT venue_id, user_name, phone, guests, comment FROM bookings WHERE id = ? AND user_id = ? AND status IN ('pending', 'approved')",
+            (booking_id, user_id)
+        )
+        row = cursor.fetchone()
+    if not row:
+        return False
+    venue_id, name, phone, guests, comment = row
+    
+    cleanup_user_data(user_id)
+    user_data[user_id] = {
+        'state': BookingState.DATE,
+        'venue': venue_id,
+        'key': secrets.token_hex(8),
+        'replaces': booking_id,
+        'name': name,
+        'phone': phone,
+        'guests': guests,
+        'comment': comment or '',
+        'booking_steps': [],
+        'last_activity': time_module.time()
+    }
+    msg = safe_send_message(
+        chat_id,
+        f"🔁 *Перенос брони #{booking_id}*\n\n"
+        "📅 Выберите новую дату. Прежняя бронь отменится, когда новая будет отправлена",
+        reply_markup=generate_calendar(venue_id=venue_id),
+        parse_mode='Markdown'
+    )
+    remember_step(user_id, msg)
+    return True
+
+# === ЛИСТ ОЖИДАНИЯ ===
+# Гость, которому не хватило стола, встает в очередь на день визита: окно времени вокруг
+# желаемого и число гостей. Очередь в памяти разбита по (заведение, день), поэтому
+# освободившийся стол сверяется только с записями своего дня. Отмена и отклонение лишь
+# кладут событие в очередь фонового потока - подбор и отправка предложения идут в нем.
+# Один слот одновременно предлагается одной записи, в порядке записи; предложение
+# действует WAITLIST_OFFER_TTL, после чего запись снимается и слот получает следующий.
+WAITLIST_WINDOW = timedelta(minutes=int(os.environ.get('WAITLIST_WINDOW_MINUTES', 60)))
+WAITLIST_OFFER_TTL = timedelta(minutes=int(os.environ.get('WAITLIST_OFFER_MINUTES', 15)))
+WAITLIST_TICK = 30                      # проверка истекших предложений, с
+WAITLIST_KEEP = timedelta(days=30)      # сколько хранить завершенные записи
+
+class WaitlistEntry:
+    __slots__ = ('id', 'venue_id', 'user_id', 'user_name', 'phone', 'guests', 'comment',
+                 'date', 'window_start', 'window_end', 'offer_start', 'offer_expires')
+    
+    def __init__(self, id, venue_id, user_id, user_name, phone, guests, comment, date,
+                 window_start, window_end, offer_start=None, offer_expires=None):
+        self.id = id
+        self.venue_id = venue_id
+        self.user_id = user_id
+        self.user_name = user_name
+        self.phone = phone
+        self.guests = guests
+        self.comment = comment
+        self.date = date
+        self.window_start = window_start
+        self.window_end = window_end
+        self.offer_start = offer_start
+        self.offer_expires = offer_expires
+    
+    def booking_data(self):
+        """Данные брони по действующему предложению"""
+        return {
+            'venue': self.venue_id,
+            'key': f"waitlist-{self.id}",   # одна запись - не больше одной брони
+            'name': self.user_name,
+            'phone': self.phone,
+            'date': self.date,
+            'time': self.offer_start.strftime('%H:%M'),
+            'guests': self.guests,
+            'comment': self.comment,
+        }
+
+class Waitlist:
+    """Записи листа ожидания по (заведение, день) и поток подбора предложений"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days = {}      # (venue_id, дата) -> {id: запись} в порядке записи
+        self._entries = {}   # id -> запись
+        self._events = queue.Queue()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def _add(self, entry):
+        self._entries[entry.id] = entry
+        self._days.setdefault((entry.venue_id, entry.date), {})[entry.id] = entry
+    
+    def _remove(self, entry):
+        self._entries.pop(entry.id, None)
+        day = self._days.get((entry.venue_id, entry.date))
+        if day is not None:
+            day.pop(entry.id, None)
+            if not day:
+                del self._days[(entry.venue_id, entry.date)]
+    
+    def load_from_db(self):
+        now = datetime.datetime.now()
+        with db.connection() as cursor:
+            cursor.execute('''
+                SELECT id, venue_id, user_id, user_name, phone, guests, comment, booking_date,
+                       window_start, window_end, offer_start, offer_expires
+                FROM waitlist WHERE status IN ('waiting', 'offered') AND window_end > ? ORDER BY id
+            ''', (format_ts(now),))
+            rows = cursor.fetchall()
+        
+        with self._lock:
+            self._days, self._entries = {}, {}
+            for row in rows:
+                times = [datetime.datetime.strptime(value, START_TS_FORMAT) if value else None for value in row[8:]]
+                self._add(WaitlistEntry(*row[:8], *times))
+        logger.info(f"🔔 Лист ожидания: {len(rows)} записей")
+    
+    def get(self, entry_id, user_id):
+        with self._lock:
+            entry = self._entries.get(entry_id)
+        return entry if entry is not None and entry.user_id == user_id else None
+    
+    def join(self, user_id, data):
+        """Записывает гостя на день data['date'] вокруг data['time'];
+        прежняя запись гостя на этот день заменяется. None - время уже прошло"""
+        venue_id = data.get('venue', DEFAULT_VENUE_ID)
+        desired = booking_start(data['date'], data['time'])
+        now = datetime.datetime.now()
+        if desired <= now:
+            return None
+        window = (max(desired - WAITLIST_WINDOW, now), desired + WAITLIST_WINDOW)
+        
+        with self._lock:
+            previous = [entry for entry in self._days.get((venue_id, data['date']), {}).values() if entry.user_id == user_id]
+            with db.transaction() as cursor:
+                cursor.executemany(
+                    "UPDATE waitlist SET status = 'replaced' WHERE id = ?", [(entry.id,) for entry in previous]
+                )
+                cursor.execute('''
+                    INSERT INTO waitlist (venue_id, user_id, user_name, phone, guests, comment, booking_date, window_start, window_end)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (venue_id, user_id, data['name'], data['phone'], data['guests'], data.get('comment') or '',
+                      data['date'], format_ts(window[0]), format_ts(window[1])))
+                entry = WaitlistEntry(cursor.lastrowid, venue_id, user_id, data['name'], data['phone'],
+                                      data['guests'], data.get('comment') or '', data['date'], *window)
+            for old in previous:
+                self._remove(old)
+            self._add(entry)
+        
+        logger.info(f"🔔 Гость {user_id} в листе ожидания #{entry.id}: {data['date']} на {data['guests']} чел.")
+        return entry
+    
+    def freed(self, booking_id):
+        """Бронь отменена или отклонена; подбор идет в фоновом потоке"""
+        self._events.put(('booking', booking_id))
+    
+    def recheck(self, venue_id, date_str):
+        """Подобрать предложения дня заново"""
+        self._events.put(('day', (venue_id, date_str)))
+    
+    def finish(self, entry, status):
+        """Снимает запись: booked, left или expired"""
+        with db.transaction() as cursor:
+            cursor.execute(
+                "UPDATE waitlist SET status = ? WHERE id = ? AND status IN ('waiting', 'offered')", (status, entry.id)
+            )
+        with self._lock:
+            self._remove(entry)
+        if entry.offer_start and status != 'booked':
+            # Предложенный слот достается следующему в очереди
+            self.recheck(entry.venue_id, entry.date)
+    
+    def retract(self, entry):
+        """Предложенный слот уже занят: запись снова ждет"""
+        with db.transaction() as cursor:
+            cursor.execute(
+                "UPDATE waitlist SET status = 'waiting', offer_start = NULL, offer_expires = NULL WHERE id = ?", (entry.id,)
+            )
+        with self._lock:
+            entry.offer_start = entry.offer_expires = None
+        self.recheck(entry.venue_id, entry.date)
+    
+    def start(self):
+        threading.Thread(target=self._run, name='waitlist', daemon=True).start()
+    
+    def _run(self):
+        last_tick = 0
+        while True:
+            try:
+                kind, value = self._events.get(timeout=WAITLIST_TICK)
+            except queue.Empty:
+                kind = value = None
+            try:
+                if kind == 'booking':
+                    value = self._booking_day(value)
+                if value in self._days:
+                    self._match(*value)
+                if time_module.monotonic() - last_tick >= WAITLIST_TICK:
+                    last_tick = time_module.monotonic()
+                    self._expire()
+            except Exception as e:
+                logger.error(f"❌ Ошибка листа ожидания: {e}")
+    
+    def _booking_day(self, booking_id):
+        with db.connection() as cursor:
+            cursor.execute('SELECT venue_id, booking_date FROM bookings WHERE id = ?', (booking_id,))
+            row = cursor.fetchone()
+        return tuple(row) if row else None
+    
+    def _match(self, venue_id, date_str):
+        """Предлагает свободные слоты дня записям без предложения, в порядке записи"""
+        with self._lock:
+            entries = list(self._days.get((venue_id, date_str), {}).values())
+        if not entries:
+            return
+        plan = seating.plan(venue_id)
+        slots, starts = slot_starts(date_str, venue_id)
+        now = datetime.datetime.now()
+        offered = {entry.offer_start for entry in entries if entry.offer_start}
+        for entry in entries:
+            if entry.offer_start:
+                continue
+            i = bisect.bisect_right(starts, max(entry.window_start - timedelta(seconds=1), now))
+            while i < len(starts) and starts[i] <= entry.window_end:
+                if starts[i] not in offered and plan.can_seat(entry.guests, starts[i]):
+                    self._offer(entry, slots[i], starts[i])
+                    offered.add(starts[i])
+                    break
+                i += 1
+    
+    def _offer(self, entry, time_str, start):
+        expires = datetime.datetime.now() + WAITLIST_OFFER_TTL
+        with db.transaction() as cursor:
+            cursor.execute(
+                "UPDATE waitlist SET status = 'offered', offer_start = ?, offer_expires = ? WHERE id = ? AND status = 'waiting'",
+                (format_ts(start), format_ts(expires), entry.id)
+            )
+            if cursor.rowcount != 1:
+                return
+        with self._lock:
+            entry.offer_start, entry.offer_expires = start, expires
+        
+        keyboard = InlineKeyboardMarkup()
+        keyboard.row(
+            InlineKeyboardButton(f"✅ Забронировать на {time_str}", callback_data=f"waitlist_take_{entry.id}"),
+            InlineKeyboardButton("🚫 Не нужно", callback_data=f"waitlist_leave_{entry.id}")
+        )
+        queue_message(
+            entry.user_id,
+            f"🎉 *Освободился стол!*\n\n"
+            f"🏢 {venues.get(entry.venue_id)['name']}\n"
+            f"📅 {entry.date} в *{time_str}* на {entry.guests} чел.\n\n"
+            f"Предложение действует до {expires.strftime('%H:%M')} - забронируйте одним нажатием",
+            reply_markup=keyboard, priority=PRIORITY_URGENT, parse_mode='Markdown'
+        )
+        WAITLIST_OFFERS.inc('offered')
+        logger.info(f"🔔 Предложение по листу ожидания #{entry.id}: {entry.date} {time_str}")
+    
+    def _expire(self):
+        """Снимает истекшие предложения и записи с прошедшим окном.
+        Слот снятого предложения получает следующий в очереди - через событие из finish"""
+        now = datetime.datetime.now()
+        with self._lock:
+            stale = [entry for entry in self._entries.values()
+                     if entry.window_end <= now or (entry.offer_expires and entry.offer_expires <= now)]
+        for entry in stale:
+            self.finish(entry, 'expired')
+            if entry.offer_start:
+                WAITLIST_OFFERS.inc('expired')
+        
+        with db.transaction() as cursor:
+            cursor.execute(
+                "DELETE FROM waitlist WHERE status NOT IN ('waiting', 'offered') AND window_end < ?",
+                (format_ts(now - WAITLIST_KEEP),)
+            )
+
+waitlist = Waitlist()
+WAITLIST_OFFERS = metrics.counter('bot_waitlist_offers_total', 'Предложения из листа ожидания', ('result',))
+metrics.gauge('bot_waitlist_entries', 'Записей в листе ожидания', lambda: len(waitlist))
+
+def waitlist_join_keyboard(booking_id):
+    """Кнопка записи в лист ожидания: по отклоненной брони или, при 0, по текущей сессии"""
+    keyboard = InlineKeyboardMarkup()
+    keyboard.row(InlineKeyboardButton("🔔 Встать в лист ожидания", callback_data=f"waitlist_join_{booking_id}"))
+    return keyboard
+
+def waitlist_request(user_id, booking_id):
+    """Данные для записи: из отклоненной брони гостя или из его незавершенной сессии"""
+    if not booking_id:
+        data = user_data.get(user_id)
+        if data and all(field in data for field in ('name', 'phone', 'date', 'time', 'guests')):
+            return dict(data)
+        return None
+    with db.connection() as cursor:
+        cursor.execute('''
+            SELECT venue_id, user_name, phone, booking_date, booking_time, guests, comment
+            FROM bookings WHERE id = ? AND user_id = ? AND status = 'rejected'
+        ''', (booking_id, user_id))
+        row = cursor.fetchone()
+    if not row:
+        return None
+    return dict(zip(('venue', 'name', 'phone', 'date', 'time', 'guests', 'comment'), row))
+
+@router.callback('waitlist_join', 'waitlist_take', 'waitlist_leave')
+def handle_waitlist(call):
+    user_id = call.from_user.id
+    action = call.data.split('_')[1]
+    value = safe_int(call.data.rsplit('_', 1)[1])
+    
+    if action == 'join':
+        data = waitlist_request(user_id, value)
+        entry = waitlist.join(user_id, data) if data else None
+        if entry is None:
+            bot.answer_callback_query(call.id, "⚠️ Запрос устарел, выберите время заново")
+            return
+        if not value:
+            cleanup_user_data(user_id)
+        keyboard = InlineKeyboardMarkup()
+        keyboard.row(InlineKeyboardButton("🚫 Выйти из листа ожидания", callback_data=f"waitlist_leave_{entry.id}"))
+        queue_message(
+            call.message.chat.id,
+            f"🔔 *Вы в листе ожидания*\n\n"
+            f"📅 {entry.date}, {entry.window_start.strftime('%H:%M')}-{entry.window_end.strftime('%H:%M')}, "
+            f"{entry.guests} чел.\n\n"
+            "Как только стол освободится, пришлем предложение - бронь одним нажатием",
+            reply_markup=keyboard, priority=PRIORITY_URGENT, parse_mode='Markdown'
+        )
+        # Стол мог освободиться раньше, чем гость нажал кнопку
+        waitlist.recheck(entry.venue_id, entry.date)
+        bot.answer_callback_query(call.id, "🔔 Вы в листе ожидания")
+        return
+    
+    entry = waitlist.get(value, user_id)
+    if entry is None:
+        bot.answer_callback_query(call.id, "⌛ Предложение уже не действует")
+        return
+    if action == 'leave':
+        waitlist.finish(entry, 'left')
+        bot.answer_callback_query(call.id, "🚫 Вы вышли из листа ожидания")
+        return
+    if not entry.offer_start or entry.offer_expires <= datetime.datetime.now():
+        bot.answer_callback_query(call.id, "⌛ Предложение уже не действует")
+        return
+    
+    data = entry.booking_data()
+    try:
+        booking_id = save_booking_to_db(user_id, data)
+    except DuplicateBooking:
+        bot.answer_callback_query(call.id, "✅ Бронь уже отправлена")
+        return
+    except NoSeatsAvailable:
+        waitlist.retract(entry)
+        WAITLIST_OFFERS.inc('taken_by_other')
+        bot.answer_callback_query(call.id, "😔 Стол уже заняли, вы остаетесь в листе ожидания")
+        return
+    
+    waitlist.finish(entry, 'booked')
+    WAITLIST_OFFERS.inc('booked')
+    send_booking_confirmation(call.message.chat.id, data, booking_id)
+    send_booking_to_admin(data, user_id, booking_id)
+    bot.answer_callback_query(call.id, f"✅ Бронь #{booking_id} отправлена")
+
+# === СИСТЕМА ОТЗЫВОВ ===
+@router.text('⭐ Оставить отзыв')
+def start_review(message):
+    venue = venues.get(current_venue(message.from_user.id))
+    keyboard = InlineKeyboardMarkup()
+    keyboard.row(
+        InlineKeyboardButton("1 ⭐", callback_data="review_direct_1"),
+        InlineKeyboardButton("2 ⭐", callback_data="review_direct_2"), 
+        InlineKeyboardButton("3 ⭐", callback_data="review_direct_3"),
+        InlineKeyboardButton("4 ⭐", callback_data="review_direct_4"),
+        InlineKeyboardButton("5 ⭐", callback_data="review_direct_5")
+    )
+    
+    review_text = f"""
+⭐ *Оцените {venue['name']}*
+
+Пожалуйста, оцените ваше посещение по 5-балльной шкале:
+
+5 ⭐ - Отлично
+4 ⭐ - Хорошо  
+3 ⭐ - Нормально
+2 ⭐ - Плохо
+1 ⭐ - Очень плохо
+
+*Выберите оценку:* 👇
+    """
+    
+    queue_message(message.chat.id, review_text, reply_markup=keyboard, parse_mode='Markdown')
+
+@router.callback('review_direct')
+def handle_review_rating(call):
+    global review_data
+    
+    rating = safe_int(call.data.replace('review_direct_', ''))
+    if not rating or rating < 1 or rating > 5:
+        bot.answer_callback_query(call.id, "❌ Неверная оценка")
+        return
+        
+    user_id = call.from_user.id
+    review_data[user_id] = {'rating': rating, 'venue': current_venue(user_id)}
+    
+    safe_delete_message(call.message.chat.id, call.message.message_id)
+    msg = safe_send_message(
+        call.message.chat.id,
+        f"⭐ *Спасибо за оценку {rating}/5!*\n\n*Пожалуйста, напишите ваш отзыв:*\n• Что понравилось?\n• Что можно улучшить?\n• Ваши пожелания\n\nИли нажмите /skip чтобы пропустить текст",
+        parse_mode='Markdown'
+    )
+
+@router.command('skip')
+def skip_review_text(message):
+    global review_data
+    user_id = message.from_user.id
+    if user_id in review_data:
+        save_review(user_id, "")
+        queue_message(message.chat.id, "✅ Спасибо! Ваш отзыв сохранен.", reply_markup=main_menu(user_id))
+    else:
+        queue_message(message.chat.id, "❌ Сначала оцените ресторан")
+
+@router.state('review')
+def handle_review_text(message):
+    global review_data
+    user_id = message.from_user.id
+    review_text = message.text
+    save_review(user_id, review_text)
+    queue_message(message.chat.id, "✅ Спасибо! Ваш отзыв сохранен.", reply_markup=main_menu(user_id))
+
+def save_review(user_id, review_text):
+    """Сохраняет отзыв и отправляет его на модерацию; id отзыва или None без оценки"""
+    global review_data
+    if user_id not in review_data:
+        return None
+    
+    rating = review_data[user_id]['rating']
+    venue_id = review_data[user_id].get('venue', DEFAULT_VENUE_ID)
+    
+    try:
+        user = bot.get_chat(user_id)
+        user_name = user.first_name or "Аноним"
+        if user.last_name:
+            user_name += f" {user.last_name}"
+    except:
+        user_name = "Аноним"
+    
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO reviews (venue_id, user_id, user_name, rating, review_text, status) VALUES (?, ?, ?, ?, ?, 'pending')",
+                      (venue_id, user_id, user_name, rating, review_text))
+        review_id = cursor.lastrowid
+        record_event(cursor, 'review', review_id, None, 'pending', rating=rating, venue_id=venue_id)
+    
+    send_review_to_admin(review_id, user_name, rating, review_text, venue_id=venue_id)
+    del review_data[user_id]
+    return review_id
+
+def send_review_to_admin(review_id, user_name, rating, review_text, booking_id=None, venue_id=DEFAULT_VENUE_ID):
+    stars = "⭐" * rating + "☆" * (5 - rating)
+    booking_info = f"\n📋 *Бронь #*{booking_id}" if booking_id else ""
+    
+    review_message = venue_caption(venue_id) + f"""
+⭐ *НОВЫЙ ОТЗЫВ* {booking_info}
+
+👤 *Гость:* {user_name}
+⭐ *Оценка:* {rating}/5 {stars}
+{f"💬 *Текст отзыва:* {review_text}" if review_text else "💬 *Текст:* Без текста"}
+    """
+    
+    keyboard = InlineKeyboardMarkup()
+    keyboard.row(
+        InlineKeyboardButton("✅ Опубликовать", callback_data=f"publish_review_{review_id}"),
+        InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_review_{review_id}")
+    )
+    
+    if review_text:
+        keyboard.row(InlineKeyboardButton("💬 Ответить гостю", callback_data=f"admin_reply_review_{review_id}"))
+    
+    notify_staff(review_message, reply_markup=keyboard, venue_id=venue_id, parse_mode='Markdown')
+
+@router.text('💬 Отзывы на модерации', admin_only=True)
+def show_pending_reviews(message):
+    venue_id = current_venue(message.from_user.id)
+    with db.connection() as cursor:
+        cursor.execute('''
+            SELECT id, user_id, user_name, rating, review_text, status, created_at FROM reviews
+            WHERE venue_id = ? AND status = 'pending' ORDER BY created_at DESC
+        ''', (venue_id,))
+        pending_reviews = cursor.fetchall()
+    
+    if not pending_reviews:
+        queue_message(message.chat.id, venue_caption(venue_id) + "✅ Нет отзывов на модерации")
+        return
+    
+    for review in pending_reviews:
+        review_id, user_id, user_name, rating, review_text, status, created_at = review
+        stars = "⭐" * rating + "☆" * (5 - rating)
+        text_display = f"💬 *Текст:* {review_text}" if review_text else "💬 *Текст:* Без текста"
+        
+        review_message = f"""
+⭐ *ОТЗЫВ НА МОДЕРАЦИИ* #{review_id}
+
+👤 *Гость:* {user_name}
+⭐ *Оценка:* {rating}/5 {stars}
+{text_display}
+📅 *Дата:* {created_at}
+        """
+        
+        keyboard = InlineKeyboardMarkup()
+        keyboard.row(
+            InlineKeyboardButton("✅ Опубликовать", callback_data=f"publish_review_{review_id}"),
+            InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_review_{review_id}")
+        )
+        
+        if review_text:
+            keyboard.row(InlineKeyboardButton("💬 Ответить гостю", callback_data=f"admin_reply_review_{review_id}"))
+        
+        queue_message(message.chat.id, review_message, reply_markup=keyboard, parse_mode='Markdown', priority=PRIORITY_BULK)
+
+@router.callback('publish_review', 'reject_review', 'admin_reply_review')
+def handle_review_moderation(call):
+    """Обработка модерации отзывов"""
+    if not staff.can(call.from_user.id, 'moderate'):
+        bot.answer_callback_query(call.id, "⛔ Доступ запрещен")
+        return
+    
+    if not call.data:
+        bot.answer_callback_query(call.id, "❌ Ошибка данных")
+        return
+    
+    review_id = safe_int(call.data.rsplit('_', 1)[-1])
+    if not review_id:
+        bot.answer_callback_query(call.id, "❌ Неверный ID отзыва")
+        return
+    
+    # Сотрудник заведения модерирует только отзывы своего заведения
+    with db.connection() as cursor:
+        cursor.execute('SELECT venue_id FROM reviews WHERE id = ?', (review_id,))
+        row = cursor.fetchone()
+    if not row:
+        bot.answer_callback_query(call.id, "❌ Отзыв не найден")
+        return
+    if not staff.can(call.from_user.id, 'moderate', row[0]):
+        bot.answer_callback_query(call.id, "⛔ Отзыв другого заведения")
+        return
+    
+    if call.data.startswith('publish_review_'):
+        with db.transaction() as cursor:
+            published = transition_review(cursor, review_id, 'published')
+        bot.answer_callback_query(call.id, "✅ Отзыв опубликован" if published else "⚠️ Отзыв уже обработан")
+        
+        try:
+            bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить клавиатуру: {e}")
+        
+    elif call.data.startswith('reject_review_'):
+        with db.transaction() as cursor:
+            rejected = transition_review(cursor, review_id, 'rejected')
+        bot.answer_callback_query(call.id, "❌ Отзыв отклонен" if rejected else "⚠️ Отзыв уже обработан")
+        
+        try:
+            bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить клавиатуру: {e}")
+    
+    elif call.data.startswith('admin_reply_review_'):
+        AdminStates.set_review_reply_mode(call.from_user.id, review_id)
+        
+        with db.connection() as cursor:
+            cursor.execute('SELECT user_id, user_name, review_text FROM reviews WHERE id = ?', (review_id,))
+            review = cursor.fetchone()
+        
+        if review:
+            user_id, user_name, review_text = review
+            
+            reply_text = f"""
+💬 *Ответ на отзыв гостя*
+
+👤 *Гость:* {user_name}
+⭐ *Отзыв:* {review_text if review_text else "Без текста"}
+
+*Введите ваш ответ для гостя:*
+            """
+            
+            try:
+                bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
+            except Exception as e:
+                logger.warning(f"Не удалось обновить клавиатуру: {e}")
+            
+            queue_message(call.from_user.id, reply_text, parse_mode='Markdown')
+            bot.answer_callback_query(call.id, "💬 Введите ответ для гостя")
+        else:
+            bot.answer_callback_query(call.id, "❌ Отзыв не найден")
+
+@router.state('admin_review_reply')
+def handle_admin_review_reply(message):
+    review_id = AdminStates.get_review_reply_mode(message.from_user.id)
+    if not review_id:
+        return
+        
+    reply_text = message.text
+    
+    with db.connection() as cursor:
+        cursor.execute('SELECT user_id, user_name, venue_id FROM reviews WHERE id = ?', (review_id,))
+        review = cursor.fetchone()
+    
+    if review and not staff.can(message.from_user.id, 'moderate', review[2]):
+        queue_message(message.chat.id, "⛔ Отзыв другого заведения")
+    elif review:
+        user_id, user_name, _ = review
+        user_message = f"""
+👑 *Ответ от администратора на ваш отзыв:*
+
+💬 *{reply_text}*
+
+*Спасибо за ваш отзыв!* ❤️
+        """
+        admin_id = message.from_user.id
+        
+        def report_delivery(future):
+            if future.result():
+                queue_message(admin_id, "✅ Ответ успешно отправлен гостю!")
+            else:
+                queue_message(admin_id, "❌ Не удалось отправить ответ гостю")
+        
+        queue_message(user_id, user_message, parse_mode='Markdown').add_done_callback(report_delivery)
+    
+    AdminStates.clear_review_reply_mode(message.from_user.id)
+
+# === ДОПОЛНИТЕЛЬНЫЕ ОБРАБОТЧИКИ ===
+@router.text('🔙 Назад к календарю')
+def back_to_calendar(message):
+    user_id = message.from_user.id
+    venue_id = user_data.get(user_id, {}).get('venue') or current_venue(user_id)
+    
+    cleanup_user_data(user_id)
+    
+    calendar = generate_calendar(venue_id=venue_id)
+    msg = safe_send_message(message.chat.id, "🗓️ Возврат к выбору даты:", reply_markup=calendar)
+    
+    user_data[user_id] = {
+        'state': BookingState.DATE,
+        'venue': venue_id,
+        'key': secrets.token_hex(8),
+        'booking_steps': [msg.message_id] if msg else [],
+        'last_activity': time_module.time()
+    }
+
+# === ОСНОВНЫЕ КОМАНДЫ ===
+def venue_selector(selected_id):
+    """Выбор заведения; кнопки одинаковы для всех, кроме отметки выбранного"""
+    def build():
+        keyboard = InlineKeyboardMarkup()
+        for venue in venues.active():
+            mark = '✅ ' if venue['id'] == selected_id else ''
+            keyboard.row(InlineKeyboardButton(f"{mark}{venue['name']}", callback_data=f"venue_select_{venue['id']}"))
+        return keyboard.to_json()
+    
+    return keyboards.get_or_build(('venues', selected_id), build)
+
+@router.command('start')
+def start(message):
+    user_id = message.from_user.id
+    venue = venues.get(current_venue(user_id))
+    member = staff.get(user_id)
+    # Выбор заведения нужен гостям и сотрудникам сети, пока заведений больше одного
+    choose = len(venues.active()) > 1 and (member is None or member.venue_id is None)
+    if member is not None:
+        welcome_text = f"""
+👑 *Добро пожаловать в панель администратора!*
+
+🏢 *Лаундж-бар:* {venue['name']}
+📍 *Адрес:* {venue['address']}
+{venue['entertainment']}
+
+*Используйте меню ниже для управления:* 👇
+        """
+        queue_message(message.chat.id, welcome_text, reply_markup=admin_menu(), parse_mode='Markdown')
+    else:
+        welcome_text = f"""
+🍝 *Добро пожаловать в {venue['name']}!*
+
+{venue['description']}
+
+{venue['entertainment']}
+
+📍 *Адрес:* {venue['address']}
+📞 *Телефон:* {venue['phone']}
+🕒 *Режим работы:*
+• {venue['hours_week']}
+• {venue['hours_weekend']}
+
+*Чем могу помочь?* 👇
+        """
+        queue_message(message.chat.id, welcome_text, reply_markup=main_menu(user_id), parse_mode='Markdown')
+    
+    if choose:
+        queue_message(message.chat.id, "🏢 *Выберите заведение:*", reply_markup=venue_selector(venue['id']), parse_mode='Markdown')
+
+@router.callback('venue_select')
+def handle_venue_select(call):
+    venue_id = safe_int(call.data.rsplit('_', 1)[1])
+    member = staff.get(call.from_user.id)
+    if not any(venue['id'] == venue_id for venue in venues.active()) or (member is not None and member.venue_id is not None):
+        bot.answer_callback_query(call.id, "❌ Заведение недоступно")
+        return
+    
+    choose_venue(call.from_user.id, venue_id)
+    # Незаконченное бронирование относится к прежнему заведению
+    if call.from_user.id in user_data:
+        cleanup_user_data(call.from_user.id)
+    outbound.submit(
+        call.message.chat.id, bot.edit_message_reply_markup, call.message.chat.id, call.message.message_id,
+        reply_markup=venue_selector(venue_id), priority=PRIORITY_URGENT
+    )
+    bot.answer_callback_query(call.id, f"🏢 {venues.get(venue_id)['name']}")
+
+@router.text('📞 Контакты')
+def contacts(message):
+    venue = venues.get(current_venue(message.from_user.id))
+    contacts_text = f"""
+📞 *Контакты {venue['name']}:*
+
+📍 *Адрес:* {venue['address']}
+📞 *Телефон:* {venue['phone']}
+
+🕒 *Режим работы:*
+• {venue['hours_week']}
+• {venue['hours_weekend']}
+
+🎮 *Развлечения:*
+{venue['entertainment']}
+
+*Ждем вас в гости!* 😊
+    """
+    queue_message(message.chat.id, contacts_text, parse_mode='Markdown')
+
+# === СИСТЕМА ОЧИСТКИ СЕССИЙ ===
+def cleanup_old_sessions():
+    """Пишет изменения сессий в базу и завершает истекшие"""
+    last_prune = 0
+    while True:
+        try:
+            current_time = time_module.time()
+            flush_sessions()
+            for store in session_stores:
+                store.expire_due(current_time)
+            
+            if current_time - last_prune >= 300:
+                seating.prune(datetime.datetime.now())
+                last_prune = current_time
+        except Exception as e:
+            logger.error(f"❌ Ошибка в очистке сессий: {e}")
+        time_module.sleep(SESSION_FLUSH_INTERVAL)
+
+def start_reminder_system():
+    reminders.rebuild_from_db()
+    reminder_thread = threading.Thread(target=reminders.run)
+    reminder_thread.daemon = True
+    reminder_thread.start()
+    logger.info("✅ Система уведомлений запущена")
+
+# === ПРИЕМ ОБНОВЛЕНИЙ ===
+class UpdateWorkerPool:
+    """Ограниченная очередь обновлений и пул обработчиков"""
+    
+    def __init__(self, workers, size):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=size)
+    
+    def start(self):
+        for number in range(self.workers):
+            threading.Thread(target=self._work, name=f'updates-{number}', daemon=True).start()
+    
+    def offer(self, update):
+        """Неблокирующая постановка в очередь; False при переполнении"""
+        try:
+            self._queue.put_nowait(update)
+            return True
+        except queue.Full:
+            return False
+    
+    def qsize(self):
+        return self._queue.qsize()
+    
+    def _work(self):
+        while True:
+            update = self._queue.get()
+            try:
+                bot.process_new_updates([update])
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработки обновления {update.update_id}: {e}")
+
+update_pool = UpdateWorkerPool(UPDATE_WORKERS, UPDATE_QUEUE_SIZE)
+metrics.gauge('bot_update_queue', 'Обновлений в очереди webhook', update_pool.qsize)
+recent_updates = RecentIds(RECENT_IDS_LIMIT)
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Прием обновлений от Telegram. Для локальной проверки достаточно POST с JSON обновления"""
+    
+    MAX_BODY = 1024 * 1024
+    
+    def _reply(self, code, body=b''):
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+    
+    def do_GET(self):
+        # Проверка живости для Railway
+        self._reply(200, b'ok')
+    
+    def do_POST(self):
+        if self.path != WEBHOOK_PATH:
+            return self._reply(404)
+        
+        if WEBHOOK_SECRET:
+            token = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if not hmac.compare_digest(token, WEBHOOK_SECRET):
+                return self._reply(403)
+        
+        length = safe_int(self.headers.get('Content-Length'))
+        if length <= 0 or length > self.MAX_BODY:
+            return self._reply(413 if length > self.MAX_BODY else 400)
+        
+        try:
+            payload = json.loads(self.rfile.read(length))
+            update = telebot.types.Update.de_json(payload)
+        except Exception:
+            return self._reply(400)
+        
+        # Повторная доставка того же update_id подтверждается без обработки
+        if not recent_updates.add(update.update_id):
+            DUPLICATE_UPDATES.inc('update')
+            return self._reply(200)
+        
+        if not update_pool.offer(update):
+            # Очередь переполнена: Telegram повторит доставку позже
+            recent_updates.discard(update.update_id)
+            return self._reply(503)
+        
+        self._reply(200)
+    
+    def log_message(self, format, *args):
+        logger.debug(f"webhook: {format % args}")
+
+def run_webhook():
+    # Обработчики выполняются в нашем пуле, а не во внутреннем пуле telebot
+    bot.threaded = False
+    update_pool.start()
+    
+    if WEBHOOK_URL:
+        bot.remove_webhook()
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, max_connections=UPDATE_WORKERS)
+        logger.info(f"✅ Webhook зарегистрирован: {WEBHOOK_URL}")
+    else:
+        logger.warning("⚠️ WEBHOOK_URL не задан: webhook не регистрируется, обновления принимаются только локально")
+    if not WEBHOOK_SECRET:
+        logger.warning("⚠️ WEBHOOK_SECRET не задан: заголовок секретного токена не проверяется")
+    
+    server = ThreadingHTTPServer((WEBHOOK_HOST, WEBHOOK_PORT), WebhookHandler)
+    server.daemon_threads = True
+    print(f"🌐 Webhook слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    server.serve_forever()
+
+def run_polling():
+    failures = 0
+    while True:
+        try:
+            print("🔍 Ожидание сообщений...")
+            bot.polling(none_stop=True, timeout=60)
+            failures = 0
+        except Exception as e:
+            failures += 1
+            delay = min(60, 2 ** (failures - 1))
+            logger.error(f"❌ Ошибка бота: {e}")
+            print(f"🔄 Перезапуск через {delay} с...")
+            time_module.sleep(delay)
+
+# === ЗАПУСК СИСТЕМЫ ===
+def main():
+    print("🚀 Запуск бота на Railway...")
+    print(f"👑 Владелец: {ADMIN_ID}")
+    
+    # Инициализация базы данных
+    init_db()
+    venues.load_from_db()
+    schedule.load_from_db()
+    staff.load_from_db()
+    reliability.load_from_db()
+    seating.load_from_db()
+    for venue in venues.active():
+        print(f"🏢 Лаундж-бар #{venue['id']}: {venue['name']}, {venue['address']}")
+    for store in session_stores:
+        store.load_index()
+    
+    # Запуск очереди исходящих сообщений
+    outbound.start()
+    start_metrics_server()
+    
+    # Запуск системы уведомлений
+    start_reminder_system()
+    
+    # Запуск очистки сессий
+    cleanup_thread = threading.Thread(target=cleanup_old_sessions)
+    cleanup_thread.daemon = True
+    cleanup_thread.start()
+    
+    # Перенос старых броней в архив
+    threading.Thread(target=run_archiver, name='archiver', daemon=True).start()
+    
+    # Подбор предложений листа ожидания
+    waitlist.load_from_db()
+    waitlist.start()
+    
+    print("✅ Все системы запущены!")
+    print("🤖 Бот запущен и готов к работе...")
+    
+    # Бесконечный цикл для Railway
+    if BOT_MODE == 'webhook':
+        run_webhook()
+    else:
+        bot.remove_webhook()
+        run_polling()
+
+if __name__ == '__main__':
+    main()